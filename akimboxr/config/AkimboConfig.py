@@ -1,4 +1,7 @@
+import hashlib
+import json
 from enum import Enum
+from functools import lru_cache
 import yaml
 from typing import List, Dict, Any
 from abc import ABC, abstractmethod
@@ -10,16 +13,28 @@ class ConfigActionType(Enum):
     PushLayer = "pushlayer"
     PopLayer = "poplayer"
     TopLayer = "toplayer"
+    Text = "text"
+    # Stops any text still being typed
+    Cancel = "cancel"
 
 
 class ConfigAction:
     def __init__(
-        self, type: ConfigActionType, backspace_count: int, layer: str | None, keys: list[list[Key | str]]
+        self,
+        type: ConfigActionType,
+        backspace_count: int,
+        layer: str | None,
+        keys: list[list[Key | str]],
+        text: str = "",
+        rate: float | None = None,
     ):
         self.type = type
         self.keys = keys
         self.backspace_count = backspace_count
         self.layer = layer
+        self.text = text
+        # Key events per millisecond for text, overriding the config's text_rate
+        self.rate = rate
 
     @staticmethod
     def build(values: Dict[str, Any]) -> "ConfigAction":
@@ -33,8 +48,12 @@ class ConfigAction:
             values["keys"] = []
         values["layer"] = values["layer"] if "layer" in values else None
         values["type"] = ConfigActionType(values["type"])
+        values["text"] = str(values["text"]) if "text" in values else ""
+        values["rate"] = values["rate"] if "rate" in values else None
         values["backspace_count"] = (
-            values["backspace_count"] if "backspace_count" in values else 1
+            values["backspace_count"]
+            if "backspace_count" in values
+            else len(values["text"]) if values["type"] == ConfigActionType.Text else 1
         )
         return ConfigAction(**values)
 
@@ -42,6 +61,7 @@ class ConfigAction:
         return f"""      ConfigAction(type={self.type}, key={self.key})"""
 
 
+@lru_cache(maxsize=None)
 def _parse_key(key: str) -> Key | KeyCode:
     match key:
         case "space" | " ":
@@ -106,16 +126,27 @@ class ConfigMapEntryType(Enum):
     Triple = "triple"
 
 
-def _parse_code(code: str) -> int:
+def _parse_code(code: str | int) -> int:
     c = 0
+    if isinstance(code, int):
+        return code
     if code.isnumeric():
         return int(code)
-    for i, ch in enumerate(code):
+    # Chords are written left|right, the right hand's fingers taking bits 5-9
+    for i, ch in enumerate(code.replace("|", "")):
         if ch == "x" or ch == "●":
             c |= 1 << i
     return c
 
 
+# The inverse of _parse_code: xoooo, or left|right for a chord
+def format_code(code: int) -> str:
+    left = "".join("x" if code >> i & 1 else "o" for i in range(5))
+    if code >> 5:
+        return left + "|" + "".join("x" if code >> i & 1 else "o" for i in range(5, 10))
+    return left
+
+
 class ConfigMapEntry:
     def __init__(self, code: int, type: str, actions: List[ConfigAction]):
         self.code = code
@@ -140,6 +171,22 @@ class ConfigMapEntry:
     {"}"}"""
 
 
+# Makes a layer a steno layer: codes it doesn't bind are strokes, translated through a JSON dictionary of
+# "stroke/stroke" -> text. The text is typed at rate key events per millisecond, by default all at once.
+class ConfigSteno:
+    def __init__(self, dictionary: str, rate: float = 0):
+        self.dictionary = dictionary
+        self.rate = rate
+
+    @staticmethod
+    def build(values: Dict[str, Any]) -> "ConfigSteno":
+        values["rate"] = values["rate"] if "rate" in values else 0
+        return ConfigSteno(**values)
+
+    def __repr__(self):
+        return f"""ConfigSteno(dictionary={self.dictionary}, rate={self.rate})"""
+
+
 class ConfigLayer:
     def __init__(
         self,
@@ -149,6 +196,8 @@ class ConfigLayer:
         map: List[ConfigMapEntry],
         actions: List[ConfigAction],
         extends: str,
+        mode: "ConfigMode | None" = None,
+        steno: ConfigSteno | None = None,
     ):
         self.name = name
         self.default = default
@@ -157,6 +206,10 @@ class ConfigLayer:
         self.transparent = transparent
         self.actions = actions
         self.extends = extends
+        # Overrides the config-wide mode for taps this layer owns, e.g. timeout for layers used in Vim
+        self.mode = mode
+        self.steno = steno
+        self.digest = b""
 
     @staticmethod
     def build(values: Dict[str, Any]) -> "ConfigLayer":
@@ -164,6 +217,8 @@ class ConfigLayer:
             values["transparent"] if "transparent" in values else False
         )
         values["extends"] = values["extends"] if "extends" in values else None
+        values["mode"] = ConfigMode(values["mode"].lower()) if "mode" in values else None
+        values["steno"] = ConfigSteno.build(dict(values["steno"])) if "steno" in values else None
         values["actions"] = (
             [ConfigAction.build(action) for action in values["actions"]]
         ) if "actions" in values else []
@@ -181,28 +236,107 @@ class ConfigLayer:
 {keys}
   {"}"}"""
 
+
+def _digest(values: Any) -> bytes:
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).digest()
+
+
 class ConfigMode(Enum):
     Backspace = "backspace"
     TIMEOUT = "timeout"
 
 
+# Learned per-code timeouts: each code's window shrinks towards the given quantile of its observed multi-tap gaps,
+# times a margin, kept within min and max (milliseconds; max defaults to the config's timeout)
+class ConfigAdaptive:
+    def __init__(self, quantile: float, margin: float, min: int, max: int | None, file: str):
+        self.quantile = quantile
+        self.margin = margin
+        self.min = min
+        self.max = max
+        self.file = file
+
+    @staticmethod
+    def build(values: Dict[str, Any]) -> "ConfigAdaptive":
+        values["quantile"] = values["quantile"] if "quantile" in values else 0.95
+        values["margin"] = values["margin"] if "margin" in values else 1.5
+        values["min"] = values["min"] if "min" in values else 50
+        values["max"] = values["max"] if "max" in values else None
+        values["file"] = values["file"] if "file" in values else "windows.json"
+        if not 0 < values["quantile"] <= 1:
+            raise ValueError(f"adaptive quantile must be in (0, 1], got {values['quantile']}")
+        return ConfigAdaptive(**values)
+
+    def __repr__(self):
+        return f"""ConfigAdaptive(quantile={self.quantile}, margin={self.margin}, min={self.min}, max={self.max})"""
+
+
+# Codes tapped one after another on the same device, each within the config's combo_window of the last, that run the
+# combo's actions instead of their own bindings
+class ConfigCombo:
+    def __init__(self, codes: List[int], actions: List[ConfigAction]):
+        self.codes = codes
+        self.actions = actions
+
+    @staticmethod
+    def build(values: Dict[str, Any]) -> "ConfigCombo":
+        values["codes"] = [_parse_code(code) for code in values["codes"]]
+        if len(values["codes"]) < 2:
+            raise ValueError(f"A combo needs at least two codes, got {values['codes']}")
+        values["actions"] = (
+            [ConfigAction.build(action) for action in values["actions"]]
+            if "actions" in values
+            else []
+        )
+        return ConfigCombo(**values)
+
+    def __repr__(self):
+        return f"""ConfigCombo(codes={self.codes})"""
+
+
 class AkimboConfig:
     def __init__(
-        self, onehand: bool, mode: str, timeout: int, layers: Dict[str, ConfigLayer]
+        self,
+        onehand: bool,
+        mode: str,
+        timeout: int,
+        layers: Dict[str, ConfigLayer],
+        adaptive: ConfigAdaptive | None = None,
+        chord_window: int = 0,
+        devices: List[str] | None = None,
+        text_rate: float = 2,
+        combos: List[ConfigCombo] | None = None,
+        combo_window: int = 300,
     ):
         self.onehand = onehand
         self.mode = mode
         self.timeout = timeout
         self.layers = layers
+        self.adaptive = adaptive
+        # How long (ms) a tap waits for the other hand to make a chord, 0 to dispatch every tap on its own
+        self.chord_window = chord_window
+        # Device identifiers of the left and right hands; otherwise the first two devices to tap
+        self.devices = devices if devices is not None else []
+        # Key events per millisecond that text is typed at, 0 for all at once
+        self.text_rate = text_rate
+        self.combos = combos if combos is not None else []
+        # How long (ms) a combo waits for its next tap
+        self.combo_window = combo_window
 
     @staticmethod
-    def build(values: Dict[str, Any]) -> "AkimboConfig":
+    def build(values: Dict[str, Any], previous: Dict[str, ConfigLayer] | None = None) -> "AkimboConfig":
+        # Layers whose content is unchanged from a previous build are reused as-is rather than parsed again
         layers = {}
         if "layers" in values:
             for layer in values["layers"]:
+                digest = _digest(values["layers"][layer])
+                if previous is not None and layer in previous and previous[layer].digest == digest:
+                    layers[layer] = previous[layer]
+                    continue
                 layers[layer] = ConfigLayer.build(
                     {**values["layers"][layer], "name": layer}
                 )
+                layers[layer].digest = digest
         return AkimboConfig(
             onehand=values["onehand"] if "onehand" in values else True,
             mode=(
@@ -212,6 +346,12 @@ class AkimboConfig:
             ),
             timeout=values["timeout"] if "timeout" in values else 500,
             layers=layers,
+            adaptive=ConfigAdaptive.build(dict(values["adaptive"] or {})) if "adaptive" in values else None,
+            chord_window=values["chord_window"] if "chord_window" in values else 0,
+            devices=values["devices"] if "devices" in values else None,
+            text_rate=values["text_rate"] if "text_rate" in values else 2,
+            combos=[ConfigCombo.build(dict(combo)) for combo in values["combos"]] if "combos" in values else None,
+            combo_window=values["combo_window"] if "combo_window" in values else 300,
         )
 
     def __repr__(self):
@@ -221,10 +361,18 @@ class AkimboConfig:
 {"}"}"""
 
 
+# The libyaml-backed loader is several times faster; fall back to the pure-Python one when PyYAML was built without it
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def deserialize_config_text(yaml_content: str, previous: Dict[str, ConfigLayer] | None = None) -> AkimboConfig:
+    return AkimboConfig.build(yaml.load(yaml_content, Loader=_Loader), previous)
+
+
 def deserialize_config(filename: str) -> AkimboConfig:
     with open(filename, "r", encoding="utf-8") as file:
         yaml_content = file.read()
-        return AkimboConfig.build(yaml.load(yaml_content, Loader=yaml.SafeLoader))
+        return deserialize_config_text(yaml_content)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+import os
+from logging import getLogger
+from threading import Event, Thread
+from typing import Callable, Tuple
+
+logger = getLogger(__name__)
+
+
+# Polls a file's mtime and size and calls on_change after it settles on a new value. Polling keeps this free of
+# platform-specific watcher dependencies; a stat every half second is negligible.
+class ConfigWatcher:
+    def __init__(self, filename: str, on_change: Callable[[], None], interval: float = 0.5):
+        self.__filename = filename
+        self.__on_change = on_change
+        self.__interval = interval
+        self.__stopped = Event()
+        self.__seen = self.__stat()
+
+    def __stat(self) -> Tuple[int, int] | None:
+        try:
+            stat = os.stat(self.__filename)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self) -> Thread:
+        thread = Thread(target=self.__poll, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.__stopped.set()
+
+    def __poll(self):
+        pending = None
+        while not self.__stopped.wait(self.__interval):
+            current = self.__stat()
+            if current is None or current == self.__seen:
+                pending = None
+                continue
+            # Editors often write in several steps; wait for one quiet interval before reloading
+            if current != pending:
+                pending = current
+                continue
+            self.__seen = current
+            pending = None
+            try:
+                self.__on_change()
+            except Exception:
+                logger.exception("Failed to reload %s", self.__filename)
@@ -1,46 +1,186 @@
+import argparse
 import asyncio
+import atexit
 import logging
+import signal
+import sys
+import threading
+from time import monotonic_ns, perf_counter
+from typing import Tuple
 
 from tapsdk import TapSDK, TapInputMode
-import traceback
 
-from threads.KeyboardThread import run_keyboard_thread, queue, KeyboardThreadSupplier
-from model.AkimboModel import AkimboModel
-from config.AkimboConfig import deserialize_config
+from akimboxr.threads.AsyncKeyboard import AsyncKeyboardSupplier
+from akimboxr.threads.KeyboardThread import run_keyboard_thread, KeyboardThreadSupplier
+from akimboxr.threads.KeyQueue import KeyQueue, OverflowPolicy
+from akimboxr.model.AdaptiveWindows import AdaptiveWindows
+from akimboxr.model.AkimboModel import AkimboModel
+from akimboxr.model.ChordCombiner import ChordCombiner
+from akimboxr.config.ConfigWatcher import ConfigWatcher
+from akimboxr.model.AkimboCompiler import CompiledConfig, load_compiled
+from akimboxr.metrics.LatencyTracker import LatencyTracker
+from akimboxr.metrics.Tracer import TraceEvent, tracer
+from akimboxr.replay.TapLog import TapRecorder
+from akimboxr.output.KeyboardBackend import KeyboardBackend
 
-config = deserialize_config("config.yaml")
-model = AkimboModel(config, KeyboardThreadSupplier(queue))
+config: CompiledConfig | None = None
+latency = LatencyTracker()
+model: AkimboModel | None = None
+windows: AdaptiveWindows | None = None
+key_queue: KeyQueue | None = None
+combiner: ChordCombiner | None = None
+# Set when taps are dispatched on the event loop instead of the SDK's callback thread
+tap_loop: asyncio.AbstractEventLoop | None = None
+# The earliest deadline of a held chord or combo tap, and the timer that settles it
+expiry: Tuple[int, asyncio.TimerHandle] | None = None
 
 tap_instance = {}
 tap_identifiers = []
+recorder: TapRecorder | None = None
 
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("akimboxr")
 
 
 def on_connect(identifier, name, fw):
-    print(identifier + " Tap: " + str(name), " FW Version: ", fw)
+    logger.info("%s Tap: %s FW Version: %s", identifier, name, fw)
     if identifier not in tap_identifiers:
         tap_identifiers.append(identifier)
-    print("Connected taps:")
-    for identifier in tap_identifiers:
-        print(identifier)
+    logger.info("Connected taps: %s", ", ".join(tap_identifiers))
 
 
 def on_disconnect(identifier):
-    print(f"Tap {identifier} has disconnected")
+    logger.info("Tap %s has disconnected", identifier)
     if identifier in tap_identifiers:
         tap_identifiers.remove(identifier)
-    for identifier in tap_identifiers:
-        print(identifier)
+    logger.info("Connected taps: %s", ", ".join(tap_identifiers))
 
 
 def on_tap_event(identifier, tapcode):
+    if recorder is not None:
+        recorder.record(identifier, int(tapcode), monotonic_ns())
+    if tap_loop is not None:
+        tap_loop.call_soon_threadsafe(process_tap, int(tapcode), identifier)
+    else:
+        process_tap(int(tapcode), identifier)
+
+
+def process_tap(tapcode: int, identifier: str = ""):
+    try:
+        if combiner is not None:
+            deadline = combiner.tap(identifier, tapcode)
+        else:
+            deadline = model.process(tapcode, identifier=identifier)
+        if deadline is not None:
+            loop.call_soon_threadsafe(schedule_expiry, deadline)
+    except Exception:
+        logger.exception("Error processing tapcode %s", tapcode)
+        if tracer.enabled:
+            tracer.record(TraceEvent.Error, tapcode)
+            dump_trace()
+
+
+# Runs on the event loop, keeping a single timer for the earliest deadline of taps held for a chord or a combo
+def schedule_expiry(deadline: int):
+    global expiry
+    if expiry is not None:
+        if expiry[0] <= deadline:
+            return
+        expiry[1].cancel()
+    delay = max(deadline - monotonic_ns(), 0) / 1_000_000_000
+    expiry = (deadline, loop.call_later(delay, expire_held))
+
+
+def expire_held():
+    global expiry
+    expiry = None
+    deadline = combiner.expire() if combiner is not None else None
+    held = model.expire()
+    if held is not None and (deadline is None or held < deadline):
+        deadline = held
+    if deadline is not None:
+        schedule_expiry(deadline)
+
+
+def reload_config():
+    global config
+    started = perf_counter()
+    compiled, _ = load_compiled(args.config, use_cache=not args.no_cache, previous=config)
+    if compiled is config:
+        # Touched or saved unchanged: swapping would only settle held taps early
+        logger.debug("%s is unchanged, nothing to reload", args.config)
+        return
+    config = compiled
+
+    def swap():
+        if windows is not None and compiled.adaptive is not None:
+            windows.configure(compiled.adaptive, compiled.timeout)
+        if combiner is not None:
+            combiner.configure(compiled.chord_window)
+        model.swap(compiled, cancel_pending=args.reload_pending == "cancel")
+
+    if tap_loop is not None:
+        tap_loop.call_soon_threadsafe(swap)
+    else:
+        swap()
+    logger.info(
+        "Reloaded %s in %.1fms (%d/%d layers rebuilt)",
+        args.config,
+        (perf_counter() - started) * 1000,
+        len(compiled.rebuilt),
+        len(compiled.layers),
+    )
+
+
+# A report asked for with SIGUSR1 (and printed at exit), so it goes to stdout rather than the log
+def dump_latency(*_):
+    print("Tap to keystroke latency:")
+    print(latency.format())
+    if key_queue is not None:
+        print("Keyboard queue:")
+        print(key_queue.metrics.format())
+    if windows is not None:
+        print("Learned windows:")
+        print(windows.format())
+
+
+def dump_trace(*_):
+    try:
+        tracer.dump(args.trace)
+    except OSError as error:
+        logger.error("Couldn't dump the trace: %s", error)
+
+
+# Dumps the trace before an uncaught exception takes down the process or a thread
+def install_crash_dump():
+    excepthook = sys.excepthook
+    thread_excepthook = threading.excepthook
+
+    def on_exception(*error):
+        dump_trace()
+        excepthook(*error)
+
+    def on_thread_exception(error):
+        dump_trace()
+        thread_excepthook(error)
+
+    sys.excepthook = on_exception
+    threading.excepthook = on_thread_exception
+
+
+def save_windows(filename: str):
     try:
-        model.process(int(tapcode))
-    except Exception as error:
-        print("Error processing tapcode")
-        print(error)
-        print(traceback.format_exception(type(error), error), error.__traceback__)
+        windows.save(filename)
+    except OSError as error:
+        logger.error("Couldn't save learned windows to %s: %s", filename, error)
+
+
+def open_backend() -> KeyboardBackend | None:
+    if args.output == "uinput":
+        # Only imported when asked for: it needs fcntl and write access to the device
+        from akimboxr.output.UinputBackend import UinputBackend
+        return UinputBackend.open(args.uinput_device)
+    return None
 
 
 def main():
@@ -54,8 +194,103 @@ def main():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", metavar="FILE", help="record the tap stream for akimboxr.replay.TapReplay")
+    parser.add_argument(
+        "--worker",
+        choices=["thread", "asyncio"],
+        default="thread",
+        help="type keys from the keyboard thread, or schedule everything on the asyncio event loop",
+    )
+    parser.add_argument(
+        "--output",
+        choices=["pynput", "uinput"],
+        default="pynput",
+        help="type through pynput, or write key events straight to a Linux uinput device",
+    )
+    parser.add_argument("--uinput-device", default="/dev/uinput", help="uinput device for --output uinput")
+    parser.add_argument(
+        "--modifier-hold",
+        type=int,
+        default=100,
+        metavar="MS",
+        help="keep modifiers down between keys that need them for up to MS without output (0 to release them each "
+             "time)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=256,
+        metavar="N",
+        help="key sequences the keyboard thread's queue holds before --queue-policy applies (0 for unbounded)",
+    )
+    parser.add_argument(
+        "--queue-policy",
+        choices=[policy.value for policy in OverflowPolicy],
+        default=OverflowPolicy.Block.value,
+        help="when the queue is full, wait for the keyboard thread, drop the oldest deferred sequence, or merge "
+             "redundant sequences",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="trace taps and key sequences into a ring buffer, dumped to FILE on SIGUSR2, on a crash and at exit",
+    )
+    parser.add_argument("--trace-size", type=int, default=1 << 16, metavar="N", help="records the trace keeps")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--no-cache", action="store_true", help="always recompile the config")
+    parser.add_argument("--no-watch", action="store_true", help="don't reload the config when it changes")
+    parser.add_argument(
+        "--reload-pending",
+        choices=["finish", "cancel"],
+        default="finish",
+        help="what happens to deferred taps of bindings a reload replaces",
+    )
+    args = parser.parse_args()
+
+    if args.trace:
+        tracer.enable(args.trace_size)
+        install_crash_dump()
+        atexit.register(dump_trace)
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, dump_trace)
+
+    started = perf_counter()
+    config, cached = load_compiled(args.config, use_cache=not args.no_cache)
+    if args.record:
+        recorder = TapRecorder.open(args.record)
+        atexit.register(recorder.close)
+
+    if config.adaptive is not None:
+        windows = AdaptiveWindows.build(config.adaptive, config.timeout)
+        windows.load(config.adaptive.file)
+        atexit.register(save_windows, config.adaptive.file)
+
+    backend = open_backend()
+    if backend is not None:
+        atexit.register(backend.close)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if args.worker == "asyncio":
+        supplier = AsyncKeyboardSupplier(loop, backend, latency, args.modifier_hold / 1000)
+        model = AkimboModel(config, supplier, windows=windows)
+        tap_loop = loop
+    else:
+        key_queue = KeyQueue(args.queue_size, OverflowPolicy(args.queue_policy))
+        model = AkimboModel(config, KeyboardThreadSupplier(key_queue), windows=windows)
+        run_keyboard_thread(key_queue, backend=backend, tracker=latency, modifier_hold=args.modifier_hold / 1000)
+    if config.chord_window > 0:
+        combiner = ChordCombiner(model, config.chord_window, config.devices)
+    logger.info(
+        "Loaded %s in %.1fms (%s)", args.config, (perf_counter() - started) * 1000, "cached" if cached else "compiled"
+    )
+
+    if not args.no_watch:
+        ConfigWatcher(args.config, reload_config).start()
+
     main()
-    run_keyboard_thread()
-    print(id(queue))
-    asyncio.set_event_loop(asyncio.new_event_loop())
-    asyncio.get_event_loop().run_forever()
\ No newline at end of file
+    atexit.register(dump_latency)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, dump_latency)
+    loop.run_forever()
\ No newline at end of file
@@ -0,0 +1,61 @@
+from array import array
+
+# Log-linear buckets in the style of HdrHistogram: values below 2^SUB_BITS are exact, larger values keep SUB_BITS
+# significant bits (under 1% error) so recording is a couple of shifts and an array increment.
+SUB_BITS = 7
+_SUB_COUNT = 1 << SUB_BITS
+_HALF_COUNT = _SUB_COUNT >> 1
+_BUCKETS = _SUB_COUNT + 64 * _HALF_COUNT
+
+
+def _index(value: int) -> int:
+    if value < _SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return _SUB_COUNT + (shift - 1) * _HALF_COUNT + (value >> shift) - _HALF_COUNT
+
+
+def _lower_bound(index: int) -> int:
+    if index < _SUB_COUNT:
+        return index
+    shift, sub = divmod(index - _SUB_COUNT, _HALF_COUNT)
+    return (sub + _HALF_COUNT) << (shift + 1)
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * _BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        self.counts[_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, p: float) -> int:
+        if self.count == 0:
+            return 0
+        target = max(int(self.count * p + 0.5), 1)
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= target:
+                return min(_lower_bound(index), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = array("Q", bytes(8 * _BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.max = 0
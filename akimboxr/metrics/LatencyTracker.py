@@ -0,0 +1,44 @@
+from enum import Enum
+from typing import Dict
+
+from .LatencyHistogram import LatencyHistogram
+
+
+class LatencyPath(Enum):
+    Immediate = "immediate"
+    Deferred = "deferred"
+    Cancelled = "cancelled"
+
+
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+
+
+# Tap-to-keystroke latency, recorded by the keyboard worker when a sequence's first key is emitted (or when a
+# cancelled sequence is dropped), split by the path the tap took.
+class LatencyTracker:
+    def __init__(self):
+        self.histograms: Dict[LatencyPath, LatencyHistogram] = {path: LatencyHistogram() for path in LatencyPath}
+
+    def record(self, path: LatencyPath, tapped_at: int, now: int):
+        self.histograms[path].record(now - tapped_at)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for path, histogram in self.histograms.items():
+            stats = {"count": histogram.count, "mean": histogram.mean() / 1_000_000}
+            for label, p in PERCENTILES:
+                stats[label] = histogram.percentile(p) / 1_000_000
+            stats["max"] = histogram.max / 1_000_000
+            summary[path.value] = stats
+        return summary
+
+    def format(self) -> str:
+        lines = []
+        for path, stats in self.summary().items():
+            values = " ".join(f"{label}={stats[label]:.3f}ms" for label in ("mean", "p50", "p90", "p99", "max"))
+            lines.append(f"{path:>9} n={stats['count']} {values}")
+        return "\n".join(lines)
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
@@ -0,0 +1,52 @@
+from typing import Dict
+
+from .LatencyHistogram import LatencyHistogram
+from .LatencyTracker import PERCENTILES
+
+
+# Depth and wait statistics of the keyboard queue, for sizing it: the deepest it got, how long sequences sat in it
+# before the worker took them, and how often a full queue made a producer wait or lose or merge sequences.
+class QueueMetrics:
+    def __init__(self, capacity: int = 0):
+        self.capacity = capacity
+        self.waits = LatencyHistogram()
+        self.high_water = 0
+        self.blocked = 0
+        self.blocked_ns = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def summary(self) -> Dict[str, float]:
+        summary = {
+            "capacity": self.capacity,
+            "high_water": self.high_water,
+            "count": self.waits.count,
+            "mean": self.waits.mean() / 1_000_000,
+        }
+        for label, p in PERCENTILES:
+            summary[label] = self.waits.percentile(p) / 1_000_000
+        summary["max"] = self.waits.max / 1_000_000
+        summary["blocked"] = self.blocked
+        summary["blocked_ms"] = self.blocked_ns / 1_000_000
+        summary["dropped"] = self.dropped
+        summary["coalesced"] = self.coalesced
+        return summary
+
+    def format(self) -> str:
+        stats = self.summary()
+        capacity = stats["capacity"] or "unbounded"
+        waits = " ".join(f"{label}={stats[label]:.3f}ms" for label in ("mean", "p50", "p90", "p99", "max"))
+        return "\n".join((
+            f"    depth high water={stats['high_water']} capacity={capacity}",
+            f"     wait n={stats['count']} {waits}",
+            f" overflow blocked={stats['blocked']} ({stats['blocked_ms']:.3f}ms) dropped={stats['dropped']} "
+            f"coalesced={stats['coalesced']}",
+        ))
+
+    def reset(self):
+        self.waits.reset()
+        self.high_water = 0
+        self.blocked = 0
+        self.blocked_ns = 0
+        self.dropped = 0
+        self.coalesced = 0
@@ -0,0 +1,142 @@
+import argparse
+import os
+import struct
+from itertools import count
+from time import monotonic_ns
+from typing import Dict, List, NamedTuple
+
+from akimboxr.config.AkimboConfig import format_code
+
+
+# Plain ints rather than an Enum, as looking up an Enum member costs more than recording the event
+class TraceEvent:
+    # A tap reached the model
+    Tap = 1
+    # A combo's taps fired its program
+    Combo = 2
+    # A tap was translated as a steno stroke
+    Stroke = 3
+    # A key sequence was handed to the keyboard worker
+    Submit = 4
+    Expedite = 5
+    Cancel = 6
+    # Some of a sequence's keys were emitted
+    Emit = 7
+    # The worker dropped a cancelled sequence
+    Drop = 8
+    # The full keyboard queue dropped or merged a sequence
+    Overflow = 9
+    Error = 10
+
+
+EVENT_NAMES = {value: name.lower() for name, value in vars(TraceEvent).items() if not name.startswith("_")}
+
+
+# Event, tapcode, tap id, task id (-1 when there isn't one) and monotonic ns
+RECORD = struct.Struct("<BxHiiQ")
+# A dump is the header (MAGIC, how many records follow) and then the records, oldest first
+MAGIC = b"AKTR\x01"
+_HEADER = struct.Struct("<5sxxxQ")
+
+
+class TraceRecord(NamedTuple):
+    event: int
+    tapcode: int
+    tap_id: int
+    task_id: int
+    timestamp: int
+
+
+# Fixed-size binary records in a preallocated ring buffer, keeping the last capacity of them. Recording is a single
+# pack_into, and call sites check enabled first, so a disabled tracer costs one attribute lookup.
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.__capacity = 0
+        self.__buffer = bytearray()
+        self.__slots = count()
+
+    def enable(self, capacity: int = 1 << 16):
+        self.__capacity = capacity
+        self.__buffer = bytearray(capacity * RECORD.size)
+        self.__slots = count()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def record(self, event: int, tapcode: int = 0, tap_id: int = -1, task_id: int = -1, timestamp: int = 0):
+        # next() on a count is atomic, so threads recording at once never share a slot
+        slot = next(self.__slots) % self.__capacity
+        RECORD.pack_into(
+            self.__buffer, slot * RECORD.size, event, tapcode, tap_id, task_id, timestamp or monotonic_ns()
+        )
+
+    def dump(self, filename: str):
+        # Takes a slot of its own to learn how many were written; it's never filled in, as it's past the end
+        written = next(self.__slots)
+        buffer = bytes(self.__buffer)
+        kept = min(written, self.__capacity)
+        start = (written - kept) % self.__capacity if self.__capacity else 0
+        with open(f"{filename}.tmp", "wb") as file:
+            file.write(_HEADER.pack(MAGIC, kept))
+            file.write(buffer[start * RECORD.size:kept * RECORD.size])
+            if start:
+                file.write(buffer[:start * RECORD.size])
+        os.replace(f"{filename}.tmp", filename)
+
+
+tracer = Tracer()
+
+
+def read_trace(filename: str) -> List[TraceRecord]:
+    with open(filename, "rb") as file:
+        data = file.read()
+    magic, records = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{filename} isn't a trace")
+    trace = []
+    for event, tapcode, tap_id, task_id, timestamp in RECORD.iter_unpack(
+            data[_HEADER.size:_HEADER.size + records * RECORD.size]
+    ):
+        # Slots a thread had taken but not yet filled in when the trace was dumped
+        if event:
+            trace.append(TraceRecord(event, tapcode, tap_id, task_id, timestamp))
+    return trace
+
+
+# One block per tap, in the order they happened, listing what became of it relative to the tap
+def format_timeline(trace: List[TraceRecord]) -> str:
+    taps: Dict[int, List[TraceRecord]] = {}
+    for record in sorted(trace, key=lambda record: record.timestamp):
+        taps.setdefault(record.tap_id, []).append(record)
+    origin = min((record.timestamp for record in trace), default=0)
+    lines = []
+    for tap_id, records in taps.items():
+        started = records[0].timestamp
+        first = records[0]
+        if tap_id < 0:
+            lines.append("untracked")
+        elif first.event in (TraceEvent.Tap, TraceEvent.Stroke):
+            lines.append(f"tap {tap_id} {format_code(first.tapcode)} at {(started - origin) / 1_000_000:.3f}ms")
+        else:
+            lines.append(f"tap {tap_id} at {(started - origin) / 1_000_000:.3f}ms")
+        for record in records:
+            if record is first and record.event == TraceEvent.Tap:
+                continue
+            task = f" task {record.task_id}" if record.task_id >= 0 else ""
+            code = f" {format_code(record.tapcode)}" if record.event in (TraceEvent.Stroke, TraceEvent.Error) else ""
+            name = EVENT_NAMES.get(record.event, record.event)
+            lines.append(f"  {(record.timestamp - started) / 1_000_000:+10.3f}ms {name}{code}{task}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a trace dumped by akimboxr --trace as a per-tap timeline")
+    parser.add_argument("trace")
+    args = parser.parse_args()
+    print(format_timeline(read_trace(args.trace)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import json
+import os
+from collections import deque
+from logging import getLogger
+from typing import Deque, Dict
+
+from akimboxr.config.AkimboConfig import ConfigAdaptive
+
+logger = getLogger(__name__)
+
+# Gaps kept per code; older ones fall off so the windows follow the user's current speed
+SAMPLES = 256
+# Below this many gaps a code keeps the maximum window
+MIN_SAMPLES = 16
+# Recompute a code's window every this many new gaps
+REFRESH = 8
+
+
+# Per-tapcode disambiguation windows learned from the gaps between repeated taps of a code. Every gap up to the maximum
+# is seen, not only the ones the current window took as a multi-tap, so a window that shrank can grow back; the quantile
+# is taken with a margin on top to leave room for slower multi-taps.
+class AdaptiveWindows:
+    def __init__(self, quantile: float, margin: float, minimum: float, maximum: float):
+        self.quantile = quantile
+        self.margin = margin
+        self.minimum = minimum
+        self.maximum = maximum
+        self.timeout = maximum
+        self.__gaps: Dict[int, Deque[int]] = {}
+        self.__fresh: Dict[int, int] = {}
+        self.__windows: Dict[int, float] = {}
+        # Taps seen per code, to weigh the windows by
+        self.__taps: Dict[int, int] = {}
+
+    @staticmethod
+    def build(adaptive: ConfigAdaptive, timeout: float) -> "AdaptiveWindows":
+        windows = AdaptiveWindows(0, 0, 0, 0)
+        windows.configure(adaptive, timeout)
+        return windows
+
+    # Applies new bounds (timeout in seconds, like CompiledConfig.timeout), keeping the learned gaps
+    def configure(self, adaptive: ConfigAdaptive, timeout: float):
+        self.timeout = timeout
+        self.quantile = adaptive.quantile
+        self.margin = adaptive.margin
+        self.maximum = adaptive.max / 1000 if adaptive.max is not None else timeout
+        self.minimum = min(adaptive.min / 1000, self.maximum)
+        for code in self.__gaps:
+            self.__update(code)
+
+    def window(self, code: int) -> float:
+        return self.__windows.get(code, self.maximum)
+
+    # Counts a tap of the code, and its gap to the last one if it could have been a multi-tap
+    def record(self, code: int, gap: int | None):
+        self.__taps[code] = self.__taps.get(code, 0) + 1
+        if gap is None:
+            return
+        gaps = self.__gaps.get(code)
+        if gaps is None:
+            gaps = self.__gaps[code] = deque(maxlen=SAMPLES)
+            self.__fresh[code] = 0
+        gaps.append(gap)
+        self.__fresh[code] += 1
+        if self.__fresh[code] >= REFRESH:
+            self.__update(code)
+
+    def __update(self, code: int):
+        self.__fresh[code] = 0
+        gaps = sorted(self.__gaps[code])
+        if len(gaps) < MIN_SAMPLES:
+            self.__windows.pop(code, None)
+            return
+        gap = gaps[min(int(len(gaps) * self.quantile), len(gaps) - 1)] / 1_000_000_000
+        self.__windows[code] = min(max(gap * self.margin, self.minimum), self.maximum)
+
+    def load(self, filename: str):
+        try:
+            with open(filename, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            logger.warning("Ignoring learned windows in %s: %s", filename, error)
+            return
+        for code, gaps in saved.get("gaps", {}).items():
+            self.__gaps[int(code)] = deque(gaps, maxlen=SAMPLES)
+            self.__update(int(code))
+
+    def save(self, filename: str):
+        saved = {"gaps": {str(code): list(gaps) for code, gaps in list(self.__gaps.items())}}
+        with open(f"{filename}.tmp", "w", encoding="utf-8") as file:
+            json.dump(saved, file)
+        os.replace(f"{filename}.tmp", filename)
+
+    def format(self) -> str:
+        lines = []
+        taps = self.__taps
+        for code in sorted(self.__gaps.keys() | taps.keys()):
+            lines.append(
+                f"{code:>4} {self.maximum * 1000:.0f}ms -> {self.window(code) * 1000:.0f}ms "
+                f"({len(self.__gaps.get(code, ()))} gaps, {taps.get(code, 0)} taps)"
+            )
+        total = sum(taps.values())
+        if total:
+            # What a deferred tap waits on average, each code weighed by how often it's tapped
+            learned = sum(self.window(code) * count for code, count in taps.items()) / total
+            lines.append(f"mean deferral {self.timeout * 1000:.0f}ms -> {learned * 1000:.0f}ms over {total} taps")
+        return "\n".join(lines)
@@ -0,0 +1,294 @@
+import hashlib
+import os
+import pickle
+import sys
+from functools import lru_cache
+from logging import getLogger
+from typing import Dict, List, Tuple
+
+from akimboxr import __version__
+from akimboxr.config.AkimboConfig import (
+    AkimboConfig,
+    ConfigActionType,
+    ConfigAdaptive,
+    ConfigLayer,
+    ConfigMapEntry,
+    ConfigMapEntryType,
+    ConfigMode,
+    deserialize_config_text,
+)
+
+from .AkimboLayer import TABLE_SIZE, AkimboLayer, AkimboSlot
+from .AkimboProgram import LinkedProgram, Program, compile_entry, compile_split_action
+from .ComboTrie import ComboTrie
+
+logger = getLogger(__name__)
+
+_TAP_COUNTS = {ConfigMapEntryType.Single: 1, ConfigMapEntryType.Double: 2, ConfigMapEntryType.Triple: 3}
+# Actions whose output backspacing can take back
+_TYPING = (ConfigActionType.Press, ConfigActionType.Text)
+
+
+# Everything AkimboModel needs that doesn't depend on runtime state: the layers with their dispatch tables and linked
+# programs, plus the slots each layer owns (indexed by AkimboSlot.index, None once a recompile drops them) so the
+# model can attach one tap handler each. sources keeps the ConfigLayer each layer was compiled from, rebuilt the
+# layers that were actually compiled rather than carried over from a previous compile, and digest the content it was
+# loaded from.
+class CompiledConfig:
+    def __init__(
+            self,
+            timeout: float,
+            mode: ConfigMode,
+            layers: Dict[str, AkimboLayer],
+            defaults: List[str],
+            slots: List[AkimboSlot | None],
+            sources: Dict[str, ConfigLayer],
+            rebuilt: List[str],
+            adaptive: ConfigAdaptive | None = None,
+            chord_window: float = 0,
+            devices: List[str] | None = None,
+            text_rate: float = 0,
+            combos: ComboTrie | None = None,
+            combo_window: float = 0,
+            digest: bytes = b"",
+    ):
+        self.timeout = timeout
+        self.mode = mode
+        self.layers = layers
+        self.defaults = defaults
+        self.slots = slots
+        self.sources = sources
+        self.rebuilt = rebuilt
+        self.adaptive = adaptive
+        self.chord_window = chord_window
+        self.devices = devices if devices is not None else []
+        self.text_rate = text_rate
+        self.combos = combos
+        self.combo_window = combo_window
+        self.digest = digest
+
+
+# Every attribute a compiled config has; one unpickled without them all was written by another revision
+_FIELDS = frozenset(vars(CompiledConfig(0, ConfigMode.TIMEOUT, {}, [], [], {}, [])))
+
+
+class _Compiler:
+    def __init__(self, config: AkimboConfig, previous: CompiledConfig | None = None):
+        self.__config = config
+        self.__previous = previous
+        self.__layers: Dict[str, AkimboLayer] = {}
+        self.__slots: List[AkimboSlot | None] = list(previous.slots) if previous is not None else []
+        self.__rebuilt: List[str] = []
+        # Indices new slots take before growing the list, largest first: the slots of removed layers, and of each
+        # layer as it's rebuilt
+        self.__free: List[int] = []
+        if previous is not None:
+            for name in previous.layers:
+                if name not in config.layers:
+                    self.__free_slots(previous.layers[name])
+            self.__free.extend(index for index, slot in enumerate(self.__slots) if slot is None)
+            self.__free.sort(reverse=True)
+
+    def compile(self) -> CompiledConfig:
+        for name in self.__config.layers:
+            self._build_layer(name, [])
+        if self.__previous is not None:
+            # Free the slots of every layer that was rebuilt or removed
+            kept = {slot.index for layer in self.__layers.values() for slot in layer.table if slot is not None}
+            self.__slots = [slot if slot is not None and slot.index in kept else None for slot in self.__slots]
+        return CompiledConfig(
+            self.__config.timeout / 1000,
+            self.__config.mode,
+            self.__layers,
+            [name for name, layer in self.__config.layers.items() if layer.default],
+            self.__slots,
+            dict(self.__config.layers),
+            self.__rebuilt,
+            self.__config.adaptive,
+            self.__config.chord_window / 1000,
+            self.__config.devices,
+            self.__config.text_rate,
+            ComboTrie.build(self.__config.combos, self.__config.text_rate),
+            self.__config.combo_window / 1000,
+        )
+
+    def _build_layer(self, name: str, building: List[str]) -> AkimboLayer:
+        if name in self.__layers:
+            return self.__layers[name]
+        if name in building:
+            raise ValueError(f"Layer {name} extends itself: {' -> '.join(building + [name])}")
+        if name not in self.__config.layers:
+            raise ValueError(f"Layer {building[-1]} extends unknown layer {name}")
+        config_layer = self.__config.layers[name]
+        parent = (
+            self._build_layer(config_layer.extends, building + [name])
+            if config_layer.extends is not None
+            else None
+        )
+        previous = self.__previous
+        if (
+                previous is not None
+                and previous.mode == self.__config.mode
+                and previous.text_rate == self.__config.text_rate
+                and previous.sources.get(name) is config_layer
+                and (parent is None or previous.layers.get(config_layer.extends) is parent)
+        ):
+            # Same source and same parent: the compiled layer from last time is still exact
+            layer = previous.layers[name]
+        else:
+            if previous is not None and name in previous.layers:
+                self.__free_slots(previous.layers[name])
+                self.__free.sort(reverse=True)
+            layer = self._build_map_layer(config_layer, parent)
+            self.__rebuilt.append(name)
+        self.__layers[name] = layer
+        return layer
+
+    # The slots a layer of the previous compile owns; the layers extending it are rebuilt with it, so nothing else
+    # still dispatches to them
+    def __free_slots(self, layer: AkimboLayer):
+        for slot in layer.table:
+            if slot is not None and not slot.layers and self.__slots[slot.index] is slot:
+                self.__slots[slot.index] = None
+                self.__free.append(slot.index)
+
+    def _build_map_layer(self, layer: ConfigLayer, parent: AkimboLayer | None = None) -> AkimboLayer:
+        # Bucket entries by code and tap count in one pass; the first binding of each kind wins
+        key_entries: Dict[int, List[ConfigMapEntry | None]] = {}
+        for entry in layer.map:
+            entries = key_entries.setdefault(entry.code, [None, None, None, None])
+            if entries[_TAP_COUNTS[entry.type]] is None:
+                entries[_TAP_COUNTS[entry.type]] = entry
+
+        mode = layer.mode if layer.mode is not None else self.__config.mode
+        key_tasks = {}
+        for code, (_, single, double, triple) in key_entries.items():
+            if code >= TABLE_SIZE:
+                continue
+            text_rate = self.__config.text_rate
+            actions = (
+                None,
+                compile_entry(single, text_rate),
+                compile_entry(double, text_rate),
+                compile_entry(triple, text_rate),
+            )
+            retractable = _retract(single, double, triple)
+            retract = retractable if mode == ConfigMode.Backspace else None
+            if self.__free:
+                slot = AkimboSlot(self.__free.pop(), code, actions, retract=retract, retractable=retractable)
+                self.__slots[slot.index] = slot
+            else:
+                slot = AkimboSlot(len(self.__slots), code, actions, retract=retract, retractable=retractable)
+                self.__slots.append(slot)
+            key_tasks[code] = slot
+
+        enter_program: Program = ()
+        exit_program: Program = ()
+        logger.debug("%s actions: %d", layer.name, len(layer.actions))
+        for action in layer.actions:
+            enter, exit = compile_split_action(action)
+            enter_program += enter
+            exit_program += exit
+
+        # Codes the layer doesn't bind itself are inherited from the layer it extends, wrapped in this layer's actions
+        table: List[AkimboSlot | None] = [None] * TABLE_SIZE
+        built = AkimboLayer(layer.name, (), layer.transparent, enter_program, exit_program, layer.steno, layer.mode)
+        for code in range(TABLE_SIZE):
+            if code in key_tasks:
+                table[code] = key_tasks[code]
+            elif parent is not None and parent.table[code] is not None:
+                table[code] = parent.table[code].wrap((built,))
+        built.table = tuple(table)
+        return built
+
+
+# Backspace counts that undo each tap count's output, or None when the code can't be disambiguated speculatively:
+# either nothing is ambiguous, or an ambiguous binding changes layers, which backspacing can't take back
+def _retract(*entries: ConfigMapEntry | None) -> Tuple[int, ...] | None:
+    if entries[1] is None and entries[2] is None:
+        return None
+    retract = [0]
+    for entry in entries:
+        if entry is None:
+            retract.append(0)
+            continue
+        if any(action.type not in _TYPING for action in entry.actions):
+            return None
+        retract.append(sum(action.backspace_count for action in entry.actions))
+    return tuple(retract)
+
+
+def compile_config(config: AkimboConfig) -> CompiledConfig:
+    return _Compiler(config).compile()
+
+
+# Recompiles only the layers whose source changed (or whose parent did), reusing everything else from previous
+def recompile_config(config: AkimboConfig, previous: CompiledConfig) -> CompiledConfig:
+    return _Compiler(config, previous).compile()
+
+
+# The source of every module defining a class a compiled config pickles, so a cache written by any other revision of
+# them (whatever __version__ says) never matches
+@lru_cache(maxsize=None)
+def _format_digest() -> bytes:
+    digest = hashlib.sha256(__version__.encode("utf-8"))
+    for cls in (CompiledConfig, AkimboLayer, AkimboSlot, LinkedProgram, ComboTrie, ConfigLayer):
+        with open(sys.modules[cls.__module__].__file__, "rb") as file:
+            digest.update(file.read())
+    return digest.digest()
+
+
+def config_digest(content: bytes) -> bytes:
+    return hashlib.sha256(_format_digest() + b"\0" + content).digest()
+
+
+def cache_filename(filename: str) -> str:
+    return f"{filename}.cache"
+
+
+# Loads a config compiled, reusing the pickled result of the last compile while the file's content hash (and the
+# compiler's own source) still match. A cache that can't be read back is recompiled over. Given the previously loaded
+# config, only changed layers are parsed and recompiled, and the cache isn't read, as the previous config's slots have
+# to be kept for the model to keep their handlers; previous itself is returned when the content hasn't changed.
+# Returns whether the cache was hit.
+def load_compiled(
+        filename: str, use_cache: bool = True, previous: CompiledConfig | None = None
+) -> Tuple[CompiledConfig, bool]:
+    with open(filename, "rb") as file:
+        content = file.read()
+    digest = config_digest(content)
+    cache = cache_filename(filename)
+
+    if previous is not None and previous.digest == digest:
+        return previous, False
+
+    if use_cache and previous is None:
+        try:
+            with open(cache, "rb") as file:
+                if file.read(len(digest)) == digest:
+                    compiled = pickle.load(file)
+                    if isinstance(compiled, CompiledConfig) and vars(compiled).keys() == _FIELDS:
+                        return compiled, True
+                    logger.warning("Ignoring %s as it holds no compiled config", cache)
+        except OSError:
+            pass
+        except Exception as e:
+            # Unpickling runs arbitrary constructors, so a stale or damaged cache can fail in any number of ways
+            logger.warning("Ignoring unreadable %s: %r", cache, e)
+
+    if previous is not None:
+        config = deserialize_config_text(content.decode("utf-8"), previous.sources)
+        compiled = recompile_config(config, previous)
+    else:
+        compiled = compile_config(deserialize_config_text(content.decode("utf-8")))
+    compiled.digest = digest
+    if use_cache:
+        try:
+            # Write then rename so a crash mid-write never leaves a cache that matches the digest
+            with open(f"{cache}.tmp", "wb") as file:
+                file.write(digest)
+                pickle.dump(compiled, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{cache}.tmp", cache)
+        except OSError:
+            pass
+    return compiled, False
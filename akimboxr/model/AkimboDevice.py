@@ -0,0 +1,20 @@
+from .AkimboTapHandler import AkimboTapHandler
+from .ComboMatcher import ComboMatcher
+
+
+# What each tap device keeps to itself: the tap it's processing, the handler that may still be waiting to tell a
+# single from a multi-tap, and its progress through the combos. Its handlers live in the model's dispatch, at the
+# device's index.
+class AkimboDevice:
+    __slots__ = ("index", "identifier", "tap_id", "tapped_at", "pending", "combos")
+
+    def __init__(self, index: int, identifier: str):
+        self.index = index
+        self.identifier = identifier
+        self.tap_id = -1
+        self.tapped_at = 0
+        self.pending: AkimboTapHandler | None = None
+        self.combos: ComboMatcher | None = None
+
+    def __repr__(self):
+        return f"AkimboDevice({self.index}, {self.identifier!r})"
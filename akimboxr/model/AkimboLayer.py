@@ -0,0 +1,122 @@
+from typing import Tuple
+
+from akimboxr.config.AkimboConfig import ConfigMode, ConfigSteno
+
+from .AkimboProgram import Program, link, speculate
+
+# Codes of one hand are 5 bits; chords of both hands are left | right << HAND_BITS
+HAND_BITS = 5
+HAND_SIZE = 1 << HAND_BITS
+TABLE_SIZE = HAND_SIZE * HAND_SIZE
+
+
+class AkimboLayer:
+    def __init__(
+            self,
+            name: str,
+            table: Tuple["AkimboSlot | None", ...],
+            transparent: bool = False,
+            enter_program: Program = (),
+            exit_program: Program = (),
+            steno: ConfigSteno | None = None,
+            mode: ConfigMode | None = None,
+    ):
+        self.name = name
+        self.table = table
+        self.enter_program = enter_program
+        self.exit_program = exit_program
+        self.__transparent = transparent
+        # On top of the stack, codes the layer doesn't bind are steno strokes
+        self.steno = steno
+        # The layer's own override of the config's mode, which also applies to the codes that fall through it
+        self.mode = mode
+
+    def is_transparent(self):
+        return self.__transparent
+
+    def would_process(self, tapcode: int):
+        return self.table[tapcode] is not None
+
+    def __repr__(self):
+        return f"AkimboLayer(name={self.name})"
+
+
+# A dispatch entry: the index of the tap handler that owns a tapcode, the transparent (or extending) layers above it
+# whose enter/exit programs wrap its presses (top-most first), and the linked programs indexed by tap count. A
+# speculative slot (backspace mode) has a retract count per tap count, and its programs are what to emit on each tap
+# with the earlier output already typed. retractable keeps the retract counts whatever the mode, for when the slot is
+# wrapped in a layer that overrides it.
+class AkimboSlot:
+    __slots__ = ("index", "code", "layers", "actions", "retract", "retractable", "programs")
+
+    def __init__(
+            self,
+            index: int,
+            code: int,
+            actions: Tuple[Tuple[Program, ...] | None, ...],
+            layers: Tuple[AkimboLayer, ...] = (),
+            retract: Tuple[int, ...] | None = None,
+            retractable: Tuple[int, ...] | None = None,
+    ):
+        self.index = index
+        self.code = code
+        self.layers = layers
+        self.actions = actions
+        self.retract = retract
+        self.retractable = retractable if retractable is not None else retract
+        enter = tuple(op for layer in layers for op in layer.enter_program)
+        exit = tuple(op for layer in layers for op in layer.exit_program)
+        self.programs = tuple(link(entry, enter, exit) for entry in actions)
+        if retract is not None:
+            self.programs = speculate(self.programs, retract)
+
+    @property
+    def speculative(self) -> bool:
+        return self.retract is not None
+
+    # The top-most of the layers that sets a mode decides whether the slot is speculative
+    def wrap(self, layers: Tuple[AkimboLayer, ...]) -> "AkimboSlot":
+        if not layers:
+            return self
+        retract = self.retract
+        for layer in layers:
+            if layer.mode is not None:
+                retract = self.retractable if layer.mode == ConfigMode.Backspace else None
+                break
+        return AkimboSlot(self.index, self.code, self.actions, layers + self.layers, retract, self.retractable)
+
+    def __repr__(self):
+        return f"AkimboSlot({self.index}, code={self.code}, layers={self.layers})"
+
+
+# Flattens transparency: each code resolves to the first layer from the top that handles it, carrying every transparent
+# layer it fell through
+def resolve_stack(stack: Tuple[AkimboLayer, ...]) -> Tuple[AkimboSlot | None, ...]:
+    if stack and not stack[-1].is_transparent():
+        return stack[-1].table
+    table = []
+    for code in range(TABLE_SIZE):
+        resolved = None
+        passed = ()
+        for layer in reversed(stack):
+            slot = layer.table[code]
+            if slot is not None:
+                resolved = slot.wrap(passed)
+                break
+            if not layer.is_transparent():
+                break
+            passed = passed + (layer,)
+        table.append(resolved)
+    return tuple(table)
+
+
+# For each hand's 5-bit codes (the right hand's offset by HAND_SIZE), whether the table binds a chord the code is part
+# of, so a tap that can't start a chord is never held back
+def chord_hands(table: Tuple[AkimboSlot | None, ...]) -> bytes:
+    joins = bytearray(2 * HAND_SIZE)
+    for code in range(HAND_SIZE, TABLE_SIZE):
+        left = code & (HAND_SIZE - 1)
+        if left and table[code] is not None:
+            joins[left] = 1
+            joins[HAND_SIZE + (code >> HAND_BITS)] = 1
+    return bytes(joins)
@@ -1,14 +1,23 @@
-from typing import Any, Callable, Dict, List
-from akimboxr.config.AkimboConfig import (
-    AkimboConfig,
-    ConfigActionType,
-    ConfigMapEntry,
-    ConfigMapEntryType, ConfigLayer, ConfigAction,
-)
-from akimboxr.threads.KeyboardThread import KeyboardThreadSupplier
+from functools import partial
+from itertools import count
+from threading import Lock
+from time import monotonic_ns
+from typing import Callable, Dict, List, Tuple
+from akimboxr.config.AkimboConfig import AkimboConfig
+from akimboxr.metrics.Tracer import TraceEvent, tracer
+from akimboxr.steno.StenoDictionary import StenoDictionary
+from akimboxr.steno.StenoTranslator import StenoTranslator
+from akimboxr.threads.KeyboardThread import KeyboardThreadSupplier, KeySequence
 from pynput.keyboard import Controller
 
+from .AdaptiveWindows import AdaptiveWindows
+from .AkimboCompiler import CompiledConfig, compile_config
+from .AkimboDevice import AkimboDevice
+from .AkimboLayer import HAND_SIZE, TABLE_SIZE, AkimboLayer, AkimboSlot, chord_hands, resolve_stack
+from .AkimboProgram import LayerOperation, LinkedProgram, ModelOperation
 from .AkimboTapHandler import AkimboTapHandler
+from .ComboMatcher import ComboMatcher
+from .ComboTrie import ComboTrie
 
 
 # Converts a 5-bit integer to a unicode representation of a key
@@ -16,212 +25,314 @@ def key_to_unicode(key: int) -> str:
     return "".join(["●" if (key >> i) & 1 else "○" for i in range(5)])
 
 
-class AkimboLayer:
-    def __init__(
-            self,
-            name: str,
-            action_map: Dict[int, AkimboTapHandler],
-            transparent: bool = False,
-            enter_actions: List[Callable[[], None]] | None = None,
-            exit_actions: List[Callable[[], None]] | None = None,
-    ):
-        if enter_actions is None:
-            enter_actions = []
-        if exit_actions is None:
-            exit_actions = []
-        self.name = name
-        self.__actionMap = action_map
-        self.__enter_actions = enter_actions
-        self.__exit_actions = exit_actions
-        self.__transparent = transparent
-
-    def is_transparent(self):
-        return self.__transparent
-
-    def process(self, tapcode: int, layers: List["AkimboLayer"]):
-        if tapcode in self.__actionMap:
-            self.__actionMap[tapcode].execute(layers)
-
-    def would_process(self, tapcode: int):
-        return tapcode in self.__actionMap
-
-    def __repr__(self):
-        return f"AkimboLayer(name={self.name})"
+# A steno layer can chord every code of either hand
+_ALL_JOINS = bytes([0] + [1] * (HAND_SIZE - 1)) * 2
 
-    def start(self, delay: float):
-        for action in self.__enter_actions:
-            action(delay)
-
-    def finish(self, delay: float):
-        for action in self.__exit_actions:
-            action(delay)
+# Handlers, for each device, indexed by AkimboSlot.index
+Handlers = List[List[AkimboTapHandler | None]]
 
 
+# Devices process taps independently, each with its own handlers, so they can run on separate threads; only the layer
+# stack is shared (behind the stack lock), so a layer pushed from one hand applies to both.
 class AkimboModel:
-    def __init__(self, config: AkimboConfig, supplier: KeyboardThreadSupplier):
-        self.__layers = {}
-        self.__active_layers = []
-        self.__timeout = config.timeout / 1000
+    def __init__(
+            self,
+            config: AkimboConfig | CompiledConfig,
+            supplier: KeyboardThreadSupplier,
+            clock: Callable[[], int] = monotonic_ns,
+            windows: AdaptiveWindows | None = None,
+    ):
+        if isinstance(config, AkimboConfig):
+            config = compile_config(config)
+        self.__layers: Dict[str, AkimboLayer] = config.layers
+        self.__slots = config.slots
+        self.__active_layers: List[AkimboLayer] = []
+        self.__stack_lock = Lock()
+        self.__tables: Dict[Tuple[AkimboLayer, ...], Tuple[Tuple[AkimboSlot | None, ...], bytes]] = {}
+        self.__joins = bytes(2 * HAND_SIZE)
+        self.__timeout = config.timeout
         self.__keyboard = Controller()
         self.__supplier = supplier
-
-        for layerName in config.layers:
-            config_layer = config.layers[layerName]
-            layer = self._build_map_layer(config_layer)
-            self.__layers[layerName] = layer
-            if config_layer.default:
-                self.__active_layers.append(layer)
-
-    def process(self, tapcode: int):
-        # Process the tapcode through the active layers, passing the next layer as a callback
-        active_layers: List[AkimboLayer] = [*self.__active_layers]
-
-        useful_layers: List[AkimboLayer] = []
-        def down_layer():
-            if len(active_layers) < 1:
-                return
-            layer = active_layers.pop()
-            useful_layers.append(layer)
-            if layer.would_process(tapcode):
-                layer.process(tapcode, useful_layers[:-1])
-            elif layer.is_transparent():
-                down_layer()
-
-        down_layer()
-
-    def _build_map_layer(self, layer: ConfigLayer):
-        key_entries: Dict[int, Any] = {}
-        for entry in layer.map:
-            if entry.code not in key_entries:
-                key_entries[entry.code] = []
-            key_entries[entry.code].append(entry)
-
-        key_tasks = {}
-        for code in key_entries:
-            single = next(
-                filter(
-                    lambda x: x.type == ConfigMapEntryType.Single,
-                    key_entries[code],
-                ),
-                None,
-            )
-            single_action = (
-                self._build_action(single, code) if single is not None else None
-            )
-            double = next(
-                filter(
-                    lambda x: x.type == ConfigMapEntryType.Double,
-                    key_entries[code],
-                ),
-                None,
-            )
-            double_action = (
-                self._build_action(double, code) if double is not None else None
-            )
-            triple = next(
-                filter(
-                    lambda x: x.type == ConfigMapEntryType.Triple,
-                    key_entries[code],
-                ),
-                None,
-            )
-            triple_action = (
-                self._build_action(triple, code) if triple is not None else None
-            )
-
-            key_tasks[code] = AkimboTapHandler(
-                single_action, double_action, triple_action, self.__timeout, code
-            )
-
-        enter_actions = []
-        exit_actions = []
-        print(f"{layer.name} actions: {len(layer.actions)}")
-        for action in layer.actions:
-            enter_action, exit_action = self._build_split_action(action)
-            if enter_action is not None:
-                enter_actions.append(enter_action)
-            if exit_action is not None:
-                exit_actions.append(exit_action)
-
-        return AkimboLayer(layer.name, key_tasks, layer.transparent, enter_actions, exit_actions)
-
-    def _build_split_action(self, action: ConfigAction):
-        if action.type == ConfigActionType.Press:
-            print("Building split press action")
-
-            def pre(delay: float):
-                for chord in action.keys:
-                    for press in chord:
-                        self.__supplier.press_key(press, delay)
-
-            def post(delay: float):
-                for chord in action.keys:
-                    for release in chord:
-                        self.__supplier.release_key(release, delay)
-
-            return pre, post
-        pass
-
-    def _build_action(
-            self, entry: ConfigMapEntry, code: int
-    ):
-        tasks = []
-        for action in entry.actions:
-            if action.type == ConfigActionType.Press:
-                print(f"Task for {code} will be {action.keys}")
-
-                def run_press(*args, **kwargs):
-                    delay = kwargs['delay'] if 'delay' in kwargs else 0
-                    layers = kwargs['layers'] if 'layers' in kwargs else []
-                    cancels = []
-                    for layer in layers:
-                        layer.start(delay)
-                    for chord in action.keys:
-                        for press in chord:
-                            cancels.append(self.__supplier.press_key(press, delay))
-                        for release in chord:
-                            cancels.append(self.__supplier.release_key(release, delay))
-                    for layer in layers:
-                        layer.finish(delay)
-
-                    def cancel():
-                        [cancel() for cancel in cancels]
-
-                    return cancel
-
-                tasks.append(run_press)
-
-            if action.type == ConfigActionType.PushLayer:
-                key = action.layer
-                print(f"Task for {code} will be move to {key}")
-
-                def run_pushlayer(**args):
-                    if key in self.__layers:
-                        self.__active_layers.append(self.__layers[key])
-
-                tasks.append(run_pushlayer)
-
-            if action.type == ConfigActionType.PopLayer:
-                def run_poplayer(*args, **kwargs):
-                    if len(self.__active_layers) > 1:
-                        self.__active_layers.pop()
-
-                tasks.append(run_poplayer)
-
-            if action.type == ConfigActionType.TopLayer:
-                key = action.layer
-                print(f"Task for {code} will be move to {key}")
-
-                def run_toplayer(*args, **kwargs):
-                    if key in self.__layers:
-                        self.__active_layers = filter(lambda x: x.name != key, self.__active_layers)
-                        self.__active_layers.append(self.__layers[key])
-
-                tasks.append(run_toplayer)
-
-        def run_action(*args, **kwargs):
-            cancels = [task(*args, **kwargs) for task in tasks]
-
-            return lambda: [cancel() for cancel in cancels]
-
-        return run_action
+        self.__clock = clock
+        self.__windows = windows
+        self.__tap_ids = count()
+        self.__devices: Dict[str, AkimboDevice] = {}
+        self.__combos = config.combos
+        self.__combo_window = config.combo_window
+        # Sequences spaced out over time (text), which a cancel action stops mid-stream
+        self.__streams: List[KeySequence] = []
+        # The resolved table for the active stack and the handlers its slots index into, swapped as one reference so
+        # a reload can never pair a table with the wrong handlers
+        self.__dispatch: Tuple[Tuple[AkimboSlot | None, ...], Handlers] = ((None,) * TABLE_SIZE, [])
+        # Translators by dictionary and rate, and the one of the steno layer on top of the stack
+        self.__translators: Dict[Tuple[str, float], StenoTranslator] = self._open_steno(config.layers, {})
+        self.__steno: StenoTranslator | None = None
+
+        with self.__stack_lock:
+            self._set_active_layers([self.__layers[name] for name in config.defaults])
+
+    # The table of the active stack, and for each hand's codes whether it binds a chord they're part of
+    @property
+    def table(self) -> Tuple[AkimboSlot | None, ...]:
+        return self.__dispatch[0]
+
+    @property
+    def joins(self) -> bytes:
+        return self.__joins
+
+    # Whether a tap of the code does anything; on a steno layer every code is a stroke
+    def binds(self, tapcode: int) -> bool:
+        return self.__dispatch[0][tapcode] is not None or self.__steno is not None
+
+    def device(self, identifier: str) -> AkimboDevice:
+        device = self.__devices.get(identifier)
+        if device is None:
+            with self.__stack_lock:
+                device = self.__devices.get(identifier)
+                if device is None:
+                    device = AkimboDevice(len(self.__devices), identifier)
+                    device.combos = self._combos(device, self.__combos)
+                    self.__dispatch[1].append([self._handler(slot, device) for slot in self.__slots])
+                    self.__devices[identifier] = device
+        return device
+
+    # tapped_at is when the tap happened (monotonic ns), if it was held back before reaching the model. Returns the
+    # deadline expire() has to be called at when the tap is held back as part of a combo.
+    def process(self, tapcode: int, tapped_at: int = 0, identifier: str = "") -> int | None:
+        device = self.__devices.get(identifier) or self.device(identifier)
+        combos = device.combos
+        if combos is not None:
+            return combos.tap(tapcode, tapped_at or self.__clock())
+        self._tap(device, tapcode, tapped_at or self.__clock())
+        return None
+
+    # Settles the combos whose window is over, returning when the next one has to be (if any taps are still held)
+    def expire(self, now: int = 0) -> int | None:
+        now = now or self.__clock()
+        deadline = None
+        for device in list(self.__devices.values()):
+            if device.combos is not None:
+                held = device.combos.expire(now)
+                if held is not None and (deadline is None or held < deadline):
+                    deadline = held
+        return deadline
+
+    @property
+    def deadline(self) -> int | None:
+        deadlines = [
+            device.combos.deadline for device in list(self.__devices.values()) if device.combos is not None
+        ]
+        return min((deadline for deadline in deadlines if deadline is not None), default=None)
+
+    def _tap(self, device: AkimboDevice, tapcode: int, tapped_at: int):
+        device.tapped_at = tapped_at
+        device.tap_id = next(self.__tap_ids)
+        if tracer.enabled:
+            tracer.record(TraceEvent.Tap, tapcode, device.tap_id, -1, tapped_at)
+        table, handlers = self.__dispatch
+        slot = table[tapcode]
+        if slot is None and self.__steno is not None:
+            self._stroke(device, tapcode)
+            return
+        handler = handlers[device.index][slot.index] if slot is not None else None
+        pending = device.pending
+        if pending is not None and pending is not handler:
+            # A different code can't continue the last one's multi-tap, so its output goes out now and ahead of this
+            task = pending.resolve()
+            if task is not None:
+                self.__supplier.expedite(task)
+        device.pending = handler
+        if handler is not None:
+            handler.execute(slot.programs, tapped_at, slot.speculative)
+
+    # Whether the tap would add to the device's multi-tap in progress
+    def _continues(self, device: AkimboDevice, tapcode: int, tapped_at: int) -> bool:
+        pending = device.pending
+        if pending is None:
+            return False
+        table, handlers = self.__dispatch
+        slot = table[tapcode]
+        return slot is not None and handlers[device.index][slot.index] is pending and pending.continues(tapped_at)
+
+    def _fire(self, device: AkimboDevice, program: LinkedProgram, tapped_at: int):
+        device.tapped_at = tapped_at
+        device.tap_id = next(self.__tap_ids)
+        if tracer.enabled:
+            tracer.record(TraceEvent.Combo, 0, device.tap_id, -1, tapped_at)
+        pending = device.pending
+        if pending is not None:
+            task = pending.resolve()
+            if task is not None:
+                self.__supplier.expedite(task)
+        device.pending = None
+        self._run(device, program)
+
+    def _stroke(self, device: AkimboDevice, stroke: int):
+        if tracer.enabled:
+            tracer.record(TraceEvent.Stroke, stroke, device.tap_id)
+        pending = device.pending
+        if pending is not None:
+            task = pending.resolve()
+            if task is not None:
+                self.__supplier.expedite(task)
+        device.pending = None
+        keys = self.__steno.stroke(stroke)
+        if keys:
+            self.__supplier.submit_sequence(keys, 0, device.tap_id, device.tapped_at)
+
+    # Opens the dictionaries of every steno layer, reusing the translators that are already open
+    @staticmethod
+    def _open_steno(
+            layers: Dict[str, AkimboLayer], previous: Dict[Tuple[str, float], StenoTranslator]
+    ) -> Dict[Tuple[str, float], StenoTranslator]:
+        translators = {}
+        for layer in layers.values():
+            if layer.steno is None:
+                continue
+            key = (layer.steno.dictionary, layer.steno.rate)
+            if key not in translators:
+                translators[key] = previous.get(key) or StenoTranslator(
+                    StenoDictionary.open(layer.steno.dictionary), layer.steno.rate
+                )
+        return translators
+
+    def _combos(self, device: AkimboDevice, trie: ComboTrie | None) -> ComboMatcher | None:
+        if trie is None:
+            return None
+        return ComboMatcher(
+            trie,
+            self.__combo_window,
+            partial(self._tap, device),
+            partial(self._fire, device),
+            partial(self._continues, device),
+        )
+
+    # Replaces the compiled config in place, keeping the handlers (and so any in-flight multi-taps) of every slot that
+    # survived the recompile and the active layer stack by name. Handlers that are dropped either let their deferred
+    # output finish or have it cancelled.
+    def swap(self, config: CompiledConfig, cancel_pending: bool = False):
+        # Compiling a changed dictionary's index can take a while, so it's done before taking the stack lock
+        translators = self._open_steno(config.layers, self.__translators)
+        with self.__stack_lock:
+            self.__translators = translators
+            _, handlers = self.__dispatch
+            reuse = config.timeout == self.__timeout
+            new_handlers = []
+            for device in self.__devices.values():
+                device_handlers = []
+                for index, slot in enumerate(config.slots):
+                    if slot is None:
+                        device_handlers.append(None)
+                    elif reuse and index < len(self.__slots) and self.__slots[index] is slot:
+                        device_handlers.append(handlers[device.index][index])
+                    else:
+                        device_handlers.append(self._handler(slot, device, config.timeout))
+                new_handlers.append(device_handlers)
+            if cancel_pending:
+                kept = {id(handler) for device_handlers in new_handlers for handler in device_handlers}
+                for handler in (handler for device_handlers in handlers for handler in device_handlers):
+                    if handler is not None and id(handler) not in kept:
+                        handler.cancel()
+
+            stack = [config.layers[layer.name] for layer in self.__active_layers if layer.name in config.layers]
+            if not stack:
+                stack = [config.layers[name] for name in config.defaults]
+            self.__layers = config.layers
+            self.__slots = config.slots
+            self.__timeout = config.timeout
+            self.__tables = {}
+            self._set_active_layers(stack, new_handlers)
+
+        # Outside the stack lock, as settling held taps can run layer actions
+        self.__combos = config.combos
+        self.__combo_window = config.combo_window
+        for device in list(self.__devices.values()):
+            if device.combos is None:
+                device.combos = self._combos(device, config.combos)
+            elif config.combos is None:
+                combos = device.combos
+                device.combos = None
+                combos.flush()
+            else:
+                device.combos.configure(config.combos, config.combo_window)
+
+    def _handler(
+            self, slot: AkimboSlot | None, device: AkimboDevice, timeout: float | None = None
+    ) -> AkimboTapHandler | None:
+        if slot is None:
+            return None
+        return AkimboTapHandler(
+            partial(self._run, device),
+            slot.actions,
+            self.__timeout if timeout is None else timeout,
+            slot.code,
+            self.__clock,
+            self.__windows,
+        )
+
+    # Must hold the stack lock
+    def _set_active_layers(self, layers: List[AkimboLayer], handlers: Handlers | None = None):
+        self.__active_layers = layers
+        key = tuple(layers)
+        resolved = self.__tables.get(key)
+        if resolved is None:
+            table = resolve_stack(key)
+            resolved = self.__tables[key] = (table, chord_hands(table))
+        table, joins = resolved
+        steno = None
+        if layers and layers[-1].steno is not None:
+            steno = self.__translators.get((layers[-1].steno.dictionary, layers[-1].steno.rate))
+        if self.__steno is not None and steno is not self.__steno:
+            # Strokes waiting for a longer entry don't carry over to the next time the layer is used
+            self.__steno.reset()
+        self.__steno = steno
+        # Any tap on a steno layer may be half of a chord stroke
+        self.__joins = _ALL_JOINS if steno is not None else joins
+        self.__dispatch = (table, self.__dispatch[1] if handlers is None else handlers)
+
+    def _push_layer(self, name: str):
+        with self.__stack_lock:
+            if name in self.__layers:
+                self._set_active_layers([*self.__active_layers, self.__layers[name]])
+
+    def _pop_layer(self):
+        with self.__stack_lock:
+            if len(self.__active_layers) > 1:
+                self._set_active_layers(self.__active_layers[:-1])
+
+    def _top_layer(self, name: str):
+        with self.__stack_lock:
+            if name in self.__layers:
+                self._set_active_layers(
+                    [*filter(lambda x: x.name != name, self.__active_layers), self.__layers[name]]
+                )
+
+    def _run(self, device: AkimboDevice, program: LinkedProgram, delay: float = 0) -> KeySequence | None:
+        for operation, layer, _ in program.layers:
+            match operation:
+                case LayerOperation.Push:
+                    self._push_layer(layer)
+                case LayerOperation.Pop:
+                    self._pop_layer()
+                case LayerOperation.Top:
+                    self._top_layer(layer)
+                case ModelOperation.CancelText:
+                    self._cancel_streams()
+
+        if not program.keys:
+            return None
+        sequence = self.__supplier.submit_sequence(program.keys, delay, device.tap_id, device.tapped_at)
+        if program.keys[-1][2]:
+            self.__streams = [
+                stream for stream in self.__streams if not stream.cancelled and stream.position < len(stream.ops)
+            ]
+            self.__streams.append(sequence)
+        return sequence
+
+    def _cancel_streams(self):
+        streams = self.__streams
+        self.__streams = []
+        for stream in streams:
+            stream.cancel()
+            if tracer.enabled:
+                tracer.record(TraceEvent.Cancel, 0, stream.tap_id, stream.task_id, self.__clock())
@@ -0,0 +1,151 @@
+from enum import Enum
+from typing import NamedTuple, Tuple
+
+from akimboxr.config.AkimboConfig import ConfigAction, ConfigActionType, ConfigMapEntry
+from akimboxr.threads.KeyboardThread import KeyOperation, KeyOp
+from pynput.keyboard import Key, KeyCode
+
+
+class LayerOperation(Enum):
+    Push = "push"
+    Pop = "pop"
+    Top = "top"
+
+
+# Other ops the model applies itself, alongside layer ops
+class ModelOperation(Enum):
+    CancelText = "cancel_text"
+
+
+# Key ops are (operation, key, delay relative to the start of the program); layer ops are (operation, layer name or
+# None, delay) and are applied by the model rather than the keyboard worker.
+LayerOp = Tuple[LayerOperation | ModelOperation, str | None, float]
+Op = KeyOp | LayerOp
+Program = Tuple[Op, ...]
+
+
+# A program split for execution: the key ops are submitted to the keyboard worker as a single sequence
+class LinkedProgram(NamedTuple):
+    keys: Tuple[KeyOp, ...]
+    layers: Tuple[LayerOp, ...]
+
+
+# Characters typed with shift held on a US layout, and the key that types them
+_SHIFTED = dict(zip('~!@#$%^&*()_+{}|:"<>?', "`1234567890-=[]\\;',./"))
+_SPECIAL = {" ": Key.space, "\n": Key.enter, "\t": Key.tab}
+
+
+# Renders text into key events spaced out to rate events per millisecond (all at once when rate is 0). Shift is held
+# across runs of shifted characters rather than pressed for each.
+def render_text(text: str, rate: float) -> Program:
+    events = []
+    shifted = False
+    for char in text:
+        if char in _SPECIAL:
+            key = _SPECIAL[char]
+            shift = False
+        elif char in _SHIFTED or char.isupper():
+            key = KeyCode.from_char(_SHIFTED.get(char, char.lower()))
+            shift = True
+        else:
+            key = KeyCode.from_char(char)
+            shift = False
+        if shift != shifted:
+            events.append((KeyOperation.Press if shift else KeyOperation.Release, Key.shift))
+            shifted = shift
+        events.append((KeyOperation.Press, key))
+        events.append((KeyOperation.Release, key))
+    if shifted:
+        events.append((KeyOperation.Release, Key.shift))
+    if rate <= 0:
+        return tuple((operation, key, 0) for operation, key in events)
+    return tuple((operation, key, int(index / rate) / 1000) for index, (operation, key) in enumerate(events))
+
+
+def compile_action(action: ConfigAction, text_rate: float = 0) -> Program:
+    match action.type:
+        case ConfigActionType.Press:
+            ops = []
+            for chord in action.keys:
+                ops.extend((KeyOperation.Press, key, 0) for key in chord)
+                ops.extend((KeyOperation.Release, key, 0) for key in chord)
+            return tuple(ops)
+
+        case ConfigActionType.PushLayer:
+            return ((LayerOperation.Push, action.layer, 0),)
+
+        case ConfigActionType.PopLayer:
+            return ((LayerOperation.Pop, None, 0),)
+
+        case ConfigActionType.TopLayer:
+            return ((LayerOperation.Top, action.layer, 0),)
+
+        case ConfigActionType.Text:
+            return render_text(action.text, action.rate if action.rate is not None else text_rate)
+
+        case ConfigActionType.Cancel:
+            return ((ModelOperation.CancelText, None, 0),)
+
+    return ()
+
+
+# Splits a layer action into what runs when a press passes through the layer and what runs after it
+def compile_split_action(action: ConfigAction) -> Tuple[Program, Program]:
+    if action.type != ConfigActionType.Press:
+        return (), ()
+    enter = tuple((KeyOperation.Press, key, 0) for chord in action.keys for key in chord)
+    exit = tuple((KeyOperation.Release, key, 0) for chord in action.keys for key in chord)
+    return enter, exit
+
+
+def compile_entry(entry: ConfigMapEntry | None, text_rate: float = 0) -> Tuple[Program, ...] | None:
+    if entry is None:
+        return None
+    return tuple(compile_action(action, text_rate) for action in entry.actions)
+
+
+def is_key_op(op: Op) -> bool:
+    return isinstance(op[0], KeyOperation)
+
+
+# Flattens an entry's actions into a single program, wrapping every action that types keys in the enter/exit ops of
+# the layers it passed through
+def link(actions: Tuple[Program, ...] | None, enter: Program = (), exit: Program = ()) -> LinkedProgram | None:
+    if actions is None:
+        return None
+    ops = []
+    for action in actions:
+        if any(is_key_op(op) for op in action):
+            ops.extend(enter)
+            ops.extend(action)
+            ops.extend(exit)
+        else:
+            ops.extend(action)
+    return LinkedProgram(
+        tuple(op for op in ops if is_key_op(op)),
+        tuple(op for op in ops if not is_key_op(op)),
+    )
+
+
+def retraction(count: int) -> Tuple[KeyOp, ...]:
+    return ((KeyOperation.Press, Key.backspace, 0), (KeyOperation.Release, Key.backspace, 0)) * count
+
+
+# For backspace mode: what to emit on the nth tap of a code, given that the output of the earlier taps is already on
+# screen and has to be backspaced away first. retract holds how many backspaces undo each tap count's output.
+def speculate(
+        programs: Tuple[LinkedProgram | None, ...], retract: Tuple[int, ...]
+) -> Tuple[LinkedProgram | None, ...]:
+    _, single, double, triple = programs
+    shown = retract[1] if single is not None else 0
+    if double is not None:
+        second = LinkedProgram(retraction(shown) + double.keys, double.layers)
+        shown = retract[2]
+    elif single is not None:
+        # No double binding: the second tap is just another single
+        second = single
+        shown += retract[1]
+    else:
+        second = None
+    third = LinkedProgram(retraction(shown) + triple.keys, triple.layers) if triple is not None else None
+    return None, single, second, third
@@ -1,80 +1,161 @@
-import asyncio
-from datetime import datetime, timedelta
-from threading import Timer
-from typing import Callable
+from time import monotonic_ns
+from typing import Callable, Tuple
+
+from akimboxr.metrics.Tracer import TraceEvent, tracer
+from akimboxr.threads.KeyboardThread import KeySequence
+
+from .AdaptiveWindows import AdaptiveWindows
+from .AkimboProgram import LinkedProgram, Program
+
+
+MAX_TAPS = 3
 
 
 class AkimboTapHandler:
+    __slots__ = (
+        "__run", "__single", "__double", "__triple", "__timeout", "__window", "__clock", "__task", "__code",
+        "__windows", "__presses", "__head", "__count", "__last",
+    )
+
     def __init__(
             self,
-            single: Callable[[...], Callable[[], None]],
-            double: Callable[[...], Callable[[], None]],
-            triple: Callable[[...], Callable[[], None]],
+            run: Callable[[LinkedProgram, float], KeySequence | None],
+            actions: Tuple[Tuple[Program, ...] | None, ...],
             timeout: float,
-            code: int):
-        self.__single = single
-        self.__double = double
-        self.__triple = triple
+            code: int,
+            clock: Callable[[], int] = monotonic_ns,
+            windows: AdaptiveWindows | None = None):
+        self.__run = run
+        self.__single = actions[1] is not None
+        self.__double = actions[2] is not None
+        self.__triple = actions[3] is not None
         self.__timeout = timeout
+        self.__window = int(timeout * 1_000_000_000)
+        self.__clock = clock
         self.__task = None
-        self.__last_presses = []
         self.__code = code
+        # A single that can't be a multi-tap runs straight away, so its window doesn't matter
+        self.__windows = windows if self.__double or self.__triple else None
+        # Ring of the most recent press timestamps (ns), oldest at head
+        self.__presses = [0] * MAX_TAPS
+        self.__head = 0
+        self.__count = 0
+        # The last press, for the gap to the next one whether or not it lands in the window (0 for none)
+        self.__last = 0
 
     def __cancel(self):
         if self.__task is not None:
-            self.__task()
+            self.__task.cancel()
+            if tracer.enabled:
+                tracer.record(TraceEvent.Cancel, 0, self.__task.tap_id, self.__task.task_id, self.__clock())
             self.__task = None
 
-    def __presses(self):
-        return len(self.__last_presses)
+    def cancel(self):
+        self.__cancel()
+        self.__reset()
+        self.__last = 0
+
+    # Ends the current multi-tap because another code was tapped, handing back its deferred output to run now
+    def resolve(self) -> KeySequence | None:
+        task = self.__task
+        self.__task = None
+        self.__reset()
+        self.__last = 0
+        return task
+
+    def __record(self, now: int) -> int:
+        presses = self.__presses
+        head = self.__head
+        count = self.__count
+        while count and now - presses[head] >= self.__window:
+            head = (head + 1) % MAX_TAPS
+            count -= 1
+        if count == MAX_TAPS:
+            head = (head + 1) % MAX_TAPS
+            count -= 1
+        presses[(head + count) % MAX_TAPS] = now
+        self.__head = head
+        self.__count = count + 1
+        return self.__count
+
+    def __reset(self):
+        self.__count = 0
+
+    # What's left of the window opened by a tap at now, as a delay from the clock
+    def __remaining(self, now: int) -> float:
+        return self.__timeout - (self.__clock() - now) / 1_000_000_000
+
+    # Whether a tap at now would add to the multi-tap in progress rather than start a new one
+    def continues(self, now: int) -> bool:
+        return 0 < self.__count < MAX_TAPS and now - self.__presses[self.__head] < self.__window
+
+    def __adapt(self, now: int):
+        windows = self.__windows
+        last = self.__last
+        self.__last = now
+        gap = now - last
+        windows.record(self.__code, gap if last and gap < windows.maximum * 1_000_000_000 else None)
+        self.__timeout = windows.window(self.__code)
+        self.__window = int(self.__timeout * 1_000_000_000)
+
+    # now is when the tap happened (monotonic ns), which is earlier than the clock when it was held back for a chord
+    # or combo, so the multi-tap window and the deferral both start from the tap itself. Speculative (backspace mode):
+    # every tap runs straight away and later taps retract what the earlier ones typed. It's up to the slot the tap
+    # resolved to, as a layer the code falls through can override the mode of the layer binding it.
+    def execute(self, programs: Tuple[LinkedProgram | None, ...], now: int = 0, speculative: bool = False):
+        now = now or self.__clock()
+        presses = self.__record(now)
+        if self.__windows is not None:
+            self.__adapt(now)
 
-    def execute(self, layers):
-        now = datetime.now()
-        self.__last_presses.append(now)
-        self.__last_presses = list(
-            filter(lambda press: now - press < timedelta(seconds=self.__timeout), self.__last_presses)
-        )
+        if speculative:
+            self.__speculate(programs, presses)
+            return
 
-        can_run_single_immediate = self.__single is not None and self.__double is None and self.__triple is None
-        can_run_double_immediate = self.__double is not None and self.__triple is None
-        can_run_triple_immediate = self.__triple is not None
-        needs_rerun_single = self.__single is not None and self.__double is None and self.__triple is not None
+        can_run_single_immediate = self.__single and not self.__double and not self.__triple
+        can_run_double_immediate = self.__double and not self.__triple
+        can_run_triple_immediate = self.__triple
+        needs_rerun_single = self.__single and not self.__double and self.__triple
 
-        if self.__presses() == 1:
+        if presses == 1:
             if can_run_single_immediate:
-                self.__last_presses = []
-                self.__single(layers=layers)
-            elif self.__single is not None:
-                self.__task = self.__single(layers=layers, delay=self.__timeout)
+                self.__reset()
+                self.__run(programs[1])
+            elif self.__single:
+                self.__task = self.__run(programs[1], self.__remaining(now))
             else:
                 # noop
                 pass
 
-        if self.__presses() == 2:
+        if presses == 2:
             self.__cancel()
             if needs_rerun_single:
-                self.__single_twice(layers=layers)
+                self.__run(programs[1])
+                self.__run(programs[1])
             elif can_run_double_immediate:
-                self.__last_presses = []
-                self.__double(layers=layers)
-            elif self.__double is not None:
-                self.__double(layers=layers, delay=self.__timeout)
+                self.__reset()
+                self.__run(programs[2])
+            elif self.__double:
+                self.__task = self.__run(programs[2], self.__remaining(now))
             else:
                 # noop
                 pass
 
-        if self.__presses() == 3:
+        if presses == 3:
             self.__cancel()
             if can_run_triple_immediate:
-                self.__triple(layers=layers)
-                self.__last_presses = []
+                self.__run(programs[3])
+                self.__reset()
             else:
                 # noop
                 pass
 
-    def __single_twice(self, *args, **kwargs):
-        self.__single(*args, **kwargs)
-        self.__single(*args, **kwargs)
+    def __speculate(self, programs: Tuple[LinkedProgram | None, ...], presses: int):
+        if presses == MAX_TAPS or (presses == 2 and not self.__triple):
+            # Nothing can follow, so the next tap starts over
+            self.__reset()
+        if programs[presses] is not None:
+            self.__run(programs[presses])
 
     def __repr__(self):
         return f"""AkimboTapHandler({self.__code}{" x1" if self.__single else ""}{" x2" if self.__double else ""}{" x3" if self.__triple else ""})"""
@@ -0,0 +1,91 @@
+from threading import Lock
+from time import monotonic_ns
+from typing import Callable, Dict, List
+
+from .AkimboLayer import HAND_BITS, HAND_SIZE
+from .AkimboModel import AkimboModel
+
+
+# Joins taps of the left and right devices that land within the window into chord codes (left | right << 5). A tap is
+# only held back when the active table binds a chord it could be part of; if the other hand doesn't complete one in
+# time, it's dispatched on its own, stamped with when it was tapped. Lone right-hand taps go to code << 5 when the table
+# binds that, and to the plain code otherwise. Devices past the first two never chord.
+class ChordCombiner:
+    def __init__(
+            self,
+            model: AkimboModel,
+            window: float,
+            devices: List[str] = (),
+            clock: Callable[[], int] = monotonic_ns,
+    ):
+        self.__model = model
+        self.__window = int(window * 1_000_000_000)
+        self.__clock = clock
+        self.__hands: Dict[str, int] = {identifier: hand for hand, identifier in enumerate(devices[:2])}
+        self.__lock = Lock()
+        # The held tap; hand -1 when there is none
+        self.__held_hand = -1
+        self.__held_device = ""
+        self.__held_code = 0
+        self.__held_at = 0
+
+    def configure(self, window: float):
+        self.__window = int(window * 1_000_000_000)
+
+    # When the held tap has to be dispatched alone (monotonic ns), if there is one
+    @property
+    def deadline(self) -> int | None:
+        return self.__held_at + self.__window if self.__held_hand >= 0 else None
+
+    def __hand(self, identifier: str) -> int:
+        hand = self.__hands.get(identifier)
+        if hand is None:
+            hand = self.__hands[identifier] = len(self.__hands) if len(self.__hands) < 2 else -1
+        return hand
+
+    # Returns the deadline expire() has to be called at when the tap is held back, here or by the model's combos
+    def tap(self, identifier: str, tapcode: int, now: int = 0) -> int | None:
+        now = now or self.__clock()
+        with self.__lock:
+            hand = self.__hand(identifier)
+            held = self.__held_hand
+            deadline = None
+            if held >= 0:
+                self.__held_hand = -1
+                if hand >= 0 and hand != held and now - self.__held_at < self.__window:
+                    if held == 0:
+                        chord = self.__held_code | tapcode << HAND_BITS
+                    else:
+                        chord = tapcode | self.__held_code << HAND_BITS
+                    if self.__model.binds(chord):
+                        return self.__model.process(chord, self.__held_at, self.__held_device)
+                deadline = self.__dispatch(held, self.__held_code, self.__held_at, self.__held_device)
+
+            if hand >= 0 and self.__model.joins[hand * HAND_SIZE + tapcode]:
+                self.__held_hand = hand
+                self.__held_device = identifier
+                self.__held_code = tapcode
+                self.__held_at = now
+                return _earliest(now + self.__window, deadline)
+            return _earliest(self.__dispatch(hand, tapcode, now, identifier), deadline)
+
+    # Dispatches the held tap once its window is over, returning the deadline of a tap that's still held
+    def expire(self, now: int = 0) -> int | None:
+        now = now or self.__clock()
+        with self.__lock:
+            held = self.__held_hand
+            if held >= 0 and now - self.__held_at >= self.__window:
+                self.__held_hand = -1
+                return self.__dispatch(held, self.__held_code, self.__held_at, self.__held_device)
+            return self.deadline
+
+    def __dispatch(self, hand: int, tapcode: int, tapped_at: int, identifier: str) -> int | None:
+        if hand == 1 and self.__model.binds(tapcode << HAND_BITS):
+            tapcode <<= HAND_BITS
+        return self.__model.process(tapcode, tapped_at, identifier)
+
+
+def _earliest(deadline: int | None, other: int | None) -> int | None:
+    if deadline is None:
+        return other
+    return deadline if other is None or deadline < other else other
@@ -0,0 +1,119 @@
+from threading import Lock
+from typing import Callable, List, Tuple
+
+from .AkimboProgram import LinkedProgram
+from .ComboTrie import ROOT, ComboTrie
+
+# (tapcode, when it was tapped in monotonic ns)
+Tap = Tuple[int, int]
+
+
+# Walks one device's taps through the combo trie. Taps are only held back while they're a prefix of some combo that the
+# next tap could still extend; once it can't, the longest combo matched so far runs and the taps after it are fed
+# through again, or the first tap is released to the model and the rest fed through again. A tap that no combo starts
+# with goes straight through, as does one that continues a multi-tap in progress, so holding it can't let the earlier
+# tap's deferred output run first. Each tap is fed at most as many times as the longest combo has codes.
+class ComboMatcher:
+    def __init__(
+            self,
+            trie: ComboTrie,
+            window: float,
+            release: Callable[[int, int], None],
+            fire: Callable[[LinkedProgram, int], None],
+            continues: Callable[[int, int], bool] = lambda tapcode, tapped_at: False,
+    ):
+        self.__trie = trie
+        self.__window = int(window * 1_000_000_000)
+        self.__release = release
+        self.__fire = fire
+        self.__continues = continues
+        self.__lock = Lock()
+        self.__state = ROOT
+        self.__buffer: List[Tap] = []
+        # How many of the buffered taps make up the longest combo matched so far, and its program
+        self.__matched = 0
+        self.__program: LinkedProgram | None = None
+
+    # Runs or releases whatever is held before switching to the new combos
+    def configure(self, trie: ComboTrie, window: float):
+        with self.__lock:
+            self.__flush()
+            self.__trie = trie
+            self.__window = int(window * 1_000_000_000)
+
+    # When the held taps have to be settled (monotonic ns), if any are held
+    @property
+    def deadline(self) -> int | None:
+        buffer = self.__buffer
+        return buffer[-1][1] + self.__window if buffer else None
+
+    # Returns the deadline expire() has to be called at when taps are held back
+    def tap(self, tapcode: int, tapped_at: int) -> int | None:
+        with self.__lock:
+            # The window may be over without expire() having been called yet
+            self.__expire(tapped_at)
+            self.__feed([(tapcode, tapped_at)])
+            return self.deadline
+
+    def expire(self, now: int) -> int | None:
+        with self.__lock:
+            self.__expire(now)
+            return self.deadline
+
+    def flush(self):
+        with self.__lock:
+            self.__flush()
+
+    def __flush(self):
+        while self.__buffer:
+            self.__feed(self.__settle())
+
+    def __expire(self, now: int):
+        buffer = self.__buffer
+        while buffer and now - buffer[-1][1] >= self.__window:
+            self.__feed(self.__settle())
+
+    # Feeds taps through the trie in order, splicing the taps that have to be fed again into taps
+    def __feed(self, taps: List[Tap]):
+        edges = self.__trie.edges
+        programs = self.__trie.programs
+        buffer = self.__buffer
+        index = 0
+        while index < len(taps):
+            tap = taps[index]
+            index += 1
+            state = edges[self.__state].get(tap[0])
+            if state is not None and not buffer and self.__continues(*tap):
+                state = None
+            if state is None:
+                if not buffer:
+                    self.__release(*tap)
+                else:
+                    # The held taps can't go any further: settle them and try this tap again after what they leave
+                    taps[index - 1:index] = [*self.__settle(), tap]
+                    index -= 1
+                continue
+            buffer.append(tap)
+            self.__state = state
+            if programs[state] is not None:
+                self.__matched = len(buffer)
+                self.__program = programs[state]
+            if not edges[state]:
+                taps[index:index] = self.__settle()
+
+    # Empties the buffer, running the longest matched combo or else releasing the first tap, and returns the taps that
+    # have to be fed through again
+    def __settle(self) -> List[Tap]:
+        buffer = self.__buffer
+        held = buffer[:]
+        matched = self.__matched
+        program = self.__program
+        buffer.clear()
+        self.__state = ROOT
+        self.__matched = 0
+        self.__program = None
+        if matched:
+            self.__fire(program, held[matched - 1][1])
+            return held[matched:]
+        self.__release(*held[0])
+        return held[1:]
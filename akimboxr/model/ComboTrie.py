@@ -0,0 +1,42 @@
+from typing import Dict, List
+
+from akimboxr.config.AkimboConfig import ConfigCombo
+
+from .AkimboProgram import LinkedProgram, compile_action, link
+
+ROOT = 0
+
+
+# The combos of a config as a trie over tapcodes: state ROOT is the empty prefix, edges[state] maps a tapcode to the
+# next state and programs[state] is what the combo ending there runs. Advancing is one dict lookup however many combos
+# there are.
+class ComboTrie:
+    def __init__(self):
+        self.edges: List[Dict[int, int]] = [{}]
+        self.programs: List[LinkedProgram | None] = [None]
+
+    @staticmethod
+    def build(combos: List[ConfigCombo], text_rate: float = 0) -> "ComboTrie | None":
+        if not combos:
+            return None
+        trie = ComboTrie()
+        for combo in combos:
+            trie.add(combo.codes, link(tuple(compile_action(action, text_rate) for action in combo.actions)))
+        return trie
+
+    # The first combo of a sequence wins, like map entries
+    def add(self, codes: List[int], program: LinkedProgram):
+        edges = self.edges
+        state = ROOT
+        for code in codes:
+            next_state = edges[state].get(code)
+            if next_state is None:
+                next_state = edges[state][code] = len(edges)
+                edges.append({})
+                self.programs.append(None)
+            state = next_state
+        if self.programs[state] is None:
+            self.programs[state] = program
+
+    def __len__(self):
+        return sum(program is not None for program in self.programs)
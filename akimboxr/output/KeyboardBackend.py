@@ -0,0 +1,26 @@
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Sequence, Tuple
+
+from pynput.keyboard import Key, KeyCode
+
+
+class KeyOperation(Enum):
+    Press = "press",
+    Release = "release",
+    Tap = "tap"
+
+
+# (operation, key, delay relative to the sequence's deadline)
+KeyOp = Tuple[KeyOperation, Key | KeyCode, float]
+
+
+# Where the keyboard worker sends key events. emit gets every op of a sequence that is due at once, so a backend that
+# can batch writes them in one go; delays have already been waited out.
+class KeyboardBackend(ABC):
+    @abstractmethod
+    def emit(self, ops: Sequence[KeyOp]):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,9 @@
+from typing import Sequence
+
+from .KeyboardBackend import KeyboardBackend, KeyOp
+
+
+# Discards everything, to measure the pipeline without any output cost
+class NullBackend(KeyboardBackend):
+    def emit(self, ops: Sequence[KeyOp]):
+        pass
@@ -0,0 +1,24 @@
+from typing import Sequence
+
+from pynput.keyboard import Controller
+
+from .KeyboardBackend import KeyboardBackend, KeyOp, KeyOperation
+
+
+# Types through pynput (or anything with the same press/release/tap methods), one call per event
+class PynputBackend(KeyboardBackend):
+    def __init__(self, controller: Controller):
+        self.controller = controller
+
+    def emit(self, ops: Sequence[KeyOp]):
+        controller = self.controller
+        for mode, key, _ in ops:
+            match mode:
+                case KeyOperation.Press:
+                    controller.press(key)
+
+                case KeyOperation.Release:
+                    controller.release(key)
+
+                case KeyOperation.Tap:
+                    controller.tap(key)
@@ -0,0 +1,23 @@
+from time import monotonic_ns
+from typing import Callable, List, Sequence, Tuple
+
+from pynput.keyboard import Key, KeyCode
+
+from .KeyboardBackend import KeyboardBackend, KeyOp, KeyOperation
+
+
+# Keeps (ns, operation, key) for every event instead of typing it, for replays and benchmarks
+class RecordingBackend(KeyboardBackend):
+    def __init__(self, clock: Callable[[], int] = monotonic_ns):
+        self.__clock = clock
+        self.events: List[Tuple[int, str, Key | KeyCode]] = []
+
+    def emit(self, ops: Sequence[KeyOp]):
+        now = self.__clock()
+        events = self.events
+        for mode, key, _ in ops:
+            if mode == KeyOperation.Tap:
+                events.append((now, "press", key))
+                events.append((now, "release", key))
+            else:
+                events.append((now, mode.value[0], key))
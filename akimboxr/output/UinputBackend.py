@@ -0,0 +1,138 @@
+import os
+import stat
+import struct
+from fcntl import ioctl
+from logging import getLogger
+from typing import Dict, Sequence, Set, Tuple
+
+from pynput.keyboard import Key, KeyCode
+
+from .KeyboardBackend import KeyboardBackend, KeyOp, KeyOperation
+
+logger = getLogger(__name__)
+
+# linux/input-event-codes.h and linux/uinput.h
+EV_SYN = 0x00
+EV_KEY = 0x01
+SYN_REPORT = 0
+BUS_USB = 0x03
+UI_SET_EVBIT = 0x40045564
+UI_SET_KEYBIT = 0x40045565
+UI_DEV_CREATE = 0x5501
+UI_DEV_DESTROY = 0x5502
+KEY_LEFTSHIFT = 42
+KEY_RIGHTSHIFT = 54
+
+# struct input_event: a timeval the kernel fills in, then type, code and value
+EVENT = struct.Struct("llHHi")
+# struct uinput_user_dev: name, input_id, ff_effects_max and four 64-entry abs arrays
+USER_DEV = struct.Struct("80sHHHHi256i")
+
+_KEYS: Dict[str, int] = {
+    "esc": 1, "backspace": 14, "tab": 15, "enter": 28, "ctrl": 29, "ctrl_l": 29, "shift": 42, "shift_l": 42,
+    "shift_r": 54, "alt": 56, "alt_l": 56, "space": 57, "caps_lock": 58, "f1": 59, "f2": 60, "f3": 61, "f4": 62,
+    "f5": 63, "f6": 64, "f7": 65, "f8": 66, "f9": 67, "f10": 68, "f11": 87, "f12": 88, "ctrl_r": 97, "alt_r": 100,
+    "alt_gr": 100, "home": 102, "up": 103, "page_up": 104, "left": 105, "right": 106, "end": 107, "down": 108,
+    "page_down": 109, "insert": 110, "delete": 111, "cmd": 125, "cmd_l": 125, "cmd_r": 126, "menu": 139,
+}
+
+# US layout: each row's characters, their shifted counterparts and the keycode of the first key
+_ROWS = (
+    ("1234567890-=", "!@#$%^&*()_+", 2),
+    ("qwertyuiop[]", "QWERTYUIOP{}", 16),
+    ("asdfghjkl;'`", 'ASDFGHJKL:"~', 30),
+    ("\\zxcvbnm,./", "|ZXCVBNM<>?", 43),
+)
+_CHARS: Dict[str, Tuple[int, bool]] = {}
+for plain, shifted, first in _ROWS:
+    for offset, (char, shifted_char) in enumerate(zip(plain, shifted)):
+        _CHARS[char] = (first + offset, False)
+        _CHARS[shifted_char] = (first + offset, True)
+_CHARS[" "] = (57, False)
+_CHARS["\n"] = (28, False)
+_CHARS["\t"] = (15, False)
+
+
+def _event(code: int, value: int) -> bytes:
+    return EVENT.pack(0, 0, EV_KEY, code, value) + EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+
+
+_SHIFT_DOWN = _event(KEY_LEFTSHIFT, 1)
+_SHIFT_UP = _event(KEY_LEFTSHIFT, 0)
+
+
+# Writes key events straight to a uinput device, a whole batch (each event followed by its SYN_REPORT) in a single
+# write. Characters that need shift get it around them unless it's already held. Given anything that isn't a character
+# device (a file or pipe) the device setup is skipped, so the stream can be inspected with read_events.
+class UinputBackend(KeyboardBackend):
+    def __init__(self, fd: int, device: bool):
+        self.__fd = fd
+        self.__device = device
+        self.__held: Set[int] = set()
+        # Unknown keys map to None, so they're only warned about once
+        self.__keys: Dict[Key | KeyCode, Tuple[int, bool, bytes, bytes] | None] = {}
+
+    @staticmethod
+    def open(path: str = "/dev/uinput", name: str = "akimboxr") -> "UinputBackend":
+        # Never created: without the uinput module there's no device, and key output has to fail rather than fill a file
+        fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        device = stat.S_ISCHR(os.fstat(fd).st_mode)
+        if not device:
+            logger.warning("%s isn't a device, so key events are written to it as a plain stream", path)
+        if device:
+            ioctl(fd, UI_SET_EVBIT, EV_KEY)
+            for code in sorted(set(_KEYS.values()) | {code for code, _ in _CHARS.values()}):
+                ioctl(fd, UI_SET_KEYBIT, code)
+            os.write(fd, USER_DEV.pack(name.encode("utf-8"), BUS_USB, 0x1, 0x1, 1, 0, *([0] * 256)))
+            ioctl(fd, UI_DEV_CREATE)
+        return UinputBackend(fd, device)
+
+    def close(self):
+        if self.__fd < 0:
+            return
+        if self.__device:
+            ioctl(self.__fd, UI_DEV_DESTROY)
+        os.close(self.__fd)
+        self.__fd = -1
+
+    # The key's code, whether it needs shift, and its packed press and release (each followed by a SYN_REPORT)
+    def __lookup(self, key: Key | KeyCode) -> Tuple[int, bool, bytes, bytes] | None:
+        if isinstance(key, Key):
+            code, shift = _KEYS.get(key.name), False
+        else:
+            code, shift = _CHARS.get(key.char, (None, False)) if key.char is not None else (None, False)
+        if code is None:
+            logger.warning("No uinput keycode for %s", key)
+            return None
+        return code, shift, _event(code, 1), _event(code, 0)
+
+    def emit(self, ops: Sequence[KeyOp]):
+        held = self.__held
+        keys = self.__keys
+        parts = []
+        for mode, key, _ in ops:
+            entry = keys.get(key, False)
+            if entry is False:
+                entry = keys[key] = self.__lookup(key)
+            if entry is None:
+                continue
+            code, shift, down, up = entry
+            # Shift around the character, unless the sequence is already holding it
+            wrap = shift and KEY_LEFTSHIFT not in held and KEY_RIGHTSHIFT not in held
+            if wrap and mode is not KeyOperation.Release:
+                parts.append(_SHIFT_DOWN)
+            if mode is not KeyOperation.Release:
+                parts.append(down)
+                held.add(code)
+            if mode is not KeyOperation.Press:
+                parts.append(up)
+                held.discard(code)
+            if wrap and mode is not KeyOperation.Press:
+                parts.append(_SHIFT_UP)
+        if parts:
+            os.write(self.__fd, b"".join(parts))
+
+
+# Decodes a stream written by UinputBackend into (type, code, value) triples
+def read_events(data: bytes) -> Sequence[Tuple[int, int, int]]:
+    return [(type, code, value) for _, _, type, code, value in EVENT.iter_unpack(data)]
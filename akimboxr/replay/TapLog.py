@@ -0,0 +1,68 @@
+import mmap
+import struct
+from threading import Lock
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+# File layout: MAGIC, then a stream of records. A device record (kind, index, length, utf-8 identifier) is written the
+# first time an identifier is seen; every tap after that is a fixed-size (kind, device index, tapcode, monotonic ns).
+MAGIC = b"AKTP\x01"
+_DEVICE = 0
+_TAP = 1
+_DEVICE_HEADER = struct.Struct("<BHH")
+_TAP_RECORD = struct.Struct("<BHBQ")
+
+
+class TapRecorder:
+    def __init__(self, file: BinaryIO):
+        self.__file = file
+        self.__devices: Dict[str, int] = {}
+        self.__lock = Lock()
+        self.__file.write(MAGIC)
+
+    @staticmethod
+    def open(filename: str) -> "TapRecorder":
+        return TapRecorder(open(filename, "wb"))
+
+    def record(self, identifier: str, tapcode: int, timestamp: int):
+        with self.__lock:
+            device = self.__devices.get(identifier)
+            if device is None:
+                device = len(self.__devices)
+                self.__devices[identifier] = device
+                name = identifier.encode("utf-8")
+                self.__file.write(_DEVICE_HEADER.pack(_DEVICE, device, len(name)) + name)
+            self.__file.write(_TAP_RECORD.pack(_TAP, device, tapcode, timestamp))
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+# Streams (identifier, tapcode, timestamp) records out of a memory-mapped log without materialising it
+class TapLog:
+    def __init__(self, filename: str):
+        self.__filename = filename
+
+    def __iter__(self) -> Iterator[Tuple[str, int, int]]:
+        with open(self.__filename, "rb") as file:
+            if file.seek(0, 2) <= len(MAGIC):
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{self.__filename} is not a tap log")
+                devices: List[str] = []
+                offset = len(MAGIC)
+                end = len(data)
+                while offset < end:
+                    if data[offset] == _DEVICE:
+                        _, index, length = _DEVICE_HEADER.unpack_from(data, offset)
+                        offset += _DEVICE_HEADER.size
+                        devices.append(bytes(data[offset:offset + length]).decode("utf-8"))
+                        offset += length
+                    else:
+                        if offset + _TAP_RECORD.size > end:
+                            # A truncated trailing record from a crashed session
+                            return
+                        _, device, tapcode, timestamp = _TAP_RECORD.unpack_from(data, offset)
+                        offset += _TAP_RECORD.size
+                        yield devices[device], tapcode, timestamp
@@ -0,0 +1,150 @@
+import argparse
+from math import ceil
+from queue import Empty, Queue
+from time import perf_counter
+from typing import Iterable, List, Tuple
+
+from akimboxr.config.AkimboConfig import AkimboConfig, ConfigAdaptive, ConfigMode, deserialize_config
+from akimboxr.metrics.LatencyTracker import LatencyTracker
+from akimboxr.model.AdaptiveWindows import AdaptiveWindows
+from akimboxr.model.AkimboModel import AkimboModel
+from akimboxr.model.ChordCombiner import ChordCombiner
+from akimboxr.output.RecordingBackend import RecordingBackend
+from akimboxr.threads.KeyboardThread import KeyboardScheduler, KeyboardThreadSupplier
+from pynput.keyboard import Key, KeyCode
+
+from .TapLog import TapLog
+
+
+class VirtualClock:
+    def __init__(self, now: int = 0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now / 1_000_000_000
+
+    def monotonic_ns(self) -> int:
+        return self.now
+
+
+# Drives the model and the keyboard worker's scheduler from a tap stream on a virtual clock, firing deferred sequences
+# at exactly their deadlines instead of sleeping
+class TapReplay:
+    def __init__(
+            self, config: AkimboConfig, tracker: LatencyTracker | None = None, windows: AdaptiveWindows | None = None
+    ):
+        self.clock = VirtualClock()
+        self.backend = RecordingBackend(self.clock.monotonic_ns)
+        self.__queue = Queue()
+        self.__scheduler = KeyboardScheduler(self.backend, tracker)
+        self.__model = AkimboModel(
+            config, KeyboardThreadSupplier(self.__queue, self.clock.monotonic), self.clock.monotonic_ns, windows
+        )
+        self.__combiner = (
+            ChordCombiner(self.__model, config.chord_window / 1000, config.devices, self.clock.monotonic_ns)
+            if config.chord_window > 0
+            else None
+        )
+        self.taps = 0
+
+    def __advance(self, until: int):
+        while True:
+            timeout = self.__scheduler.timeout(self.clock.monotonic())
+            deadline = self.clock.now + ceil(timeout * 1_000_000_000) if timeout is not None else None
+            held = self.__combiner.deadline if self.__combiner is not None else None
+            combo = self.__model.deadline
+            if combo is not None and (held is None or combo < held):
+                held = combo
+            if held is not None and (deadline is None or held < deadline):
+                if held > until:
+                    break
+                self.clock.now = max(self.clock.now, held)
+                if self.__combiner is not None:
+                    self.__combiner.expire()
+                self.__model.expire()
+                self.__drain()
+                continue
+            if deadline is None or deadline > until:
+                break
+            self.clock.now = deadline
+            self.__scheduler.run_due(self.clock.monotonic())
+        self.clock.now = max(self.clock.now, until)
+
+    def __drain(self):
+        while True:
+            try:
+                sequence = self.__queue.get_nowait()
+            except Empty:
+                return
+            self.__scheduler.submit(sequence, self.clock.monotonic())
+
+    def feed(self, taps: Iterable[Tuple[str, int, int]]):
+        for identifier, tapcode, timestamp in taps:
+            if self.taps == 0 and self.clock.now == 0:
+                self.clock.now = timestamp
+            self.__advance(timestamp)
+            if self.__combiner is not None:
+                self.__combiner.tap(identifier, tapcode)
+            else:
+                self.__model.process(tapcode, identifier=identifier)
+            self.__drain()
+            self.taps += 1
+
+    def finish(self) -> List[Tuple[int, str, Key | KeyCode]]:
+        self.__advance(1 << 63)
+        return self.backend.events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded tap log against a config")
+    parser.add_argument("log")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument(
+        "--mode", choices=[mode.value for mode in ConfigMode], help="override the config's disambiguation mode"
+    )
+    parser.add_argument("--chord-window", type=int, metavar="MS", help="override the config's chord window")
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="learn per-code windows while replaying (with the config's adaptive settings, or the defaults)",
+    )
+    parser.add_argument("--windows", metavar="FILE", help="start from and save learned windows in FILE")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    config = deserialize_config(args.config)
+    if args.mode is not None:
+        config.mode = ConfigMode(args.mode)
+    if args.chord_window is not None:
+        config.chord_window = args.chord_window
+    windows = None
+    if args.adaptive:
+        adaptive = config.adaptive if config.adaptive is not None else ConfigAdaptive.build({})
+        windows = AdaptiveWindows.build(adaptive, config.timeout / 1000)
+        if args.windows:
+            windows.load(args.windows)
+    tracker = LatencyTracker()
+    replay = TapReplay(config, tracker, windows)
+    started = perf_counter()
+    replay.feed(TapLog(args.log))
+    events = replay.finish()
+    elapsed = perf_counter() - started
+
+    if not args.quiet:
+        origin = events[0][0] if events else 0
+        for timestamp, operation, key in events:
+            print(f"{(timestamp - origin) / 1_000_000:12.3f}ms {operation:<7} {key}")
+    print(
+        f"{replay.taps} taps, {len(events)} key events in {elapsed:.3f}s "
+        f"({replay.taps / max(elapsed, 1e-9):.0f} taps/s)"
+    )
+    print(tracker.format())
+    if windows is not None:
+        print("Learned windows:")
+        print(windows.format())
+        if args.windows:
+            windows.save(args.windows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from time import perf_counter
+from typing import List, Tuple
+
+from akimboxr.config.AkimboConfig import _parse_code
+from akimboxr.model.AkimboLayer import TABLE_SIZE
+
+# File layout: a header (MAGIC, byte order, the source's size and mtime, entry count), then a directory of where each
+# first stroke's entries start, then four u32 per entry sorted by stroke sequence (where its strokes start and how many
+# there are, where its translation starts and how long it is), then every entry's strokes as u16 and then the utf-8
+# translations. The arrays are in the byte order of the machine that compiled the index, so they're read in place.
+MAGIC = b"AKSD\x02"
+_HEADER = struct.Struct("<5scQQI")
+_BYTE_ORDER = b"l" if sys.byteorder == "little" else b"b"
+_FIELDS = 4
+
+
+def index_filename(filename: str) -> str:
+    return f"{filename}.index"
+
+
+# Keeps the arrays that follow aligned for memoryview.cast
+def _padded(size: int) -> int:
+    return size + -size % 4
+
+
+# Parses a JSON dictionary of "stroke/stroke/..." -> translation, each stroke written like a map code, into the index
+def compile_dictionary(filename: str, index: str):
+    with open(filename, "r", encoding="utf-8") as file:
+        source = json.load(file)
+    status = os.stat(filename)
+    entries = {}
+    for key, translation in source.items():
+        strokes = tuple(_parse_code(stroke) for stroke in key.split("/"))
+        if not all(0 <= stroke < TABLE_SIZE for stroke in strokes):
+            raise ValueError(f"{filename}: {key} isn't a sequence of tapcodes")
+        # The first spelling of a sequence wins, as with map entries
+        entries.setdefault(strokes, str(translation).encode("utf-8"))
+    ordered = sorted(entries.items())
+
+    directory = array("I", [0] * (TABLE_SIZE + 1))
+    table = array("I")
+    strokes = array("H")
+    values = []
+    value_offset = 0
+    for sequence, value in ordered:
+        directory[sequence[0] + 1] += 1
+        table.extend((len(strokes), len(sequence), value_offset, len(value)))
+        strokes.extend(sequence)
+        values.append(value)
+        value_offset += len(value)
+    for stroke in range(TABLE_SIZE):
+        directory[stroke + 1] += directory[stroke]
+
+    # Write then rename so a crash mid-write never leaves an index that looks current
+    with open(f"{index}.tmp", "wb") as file:
+        file.write(_HEADER.pack(MAGIC, _BYTE_ORDER, status.st_size, status.st_mtime_ns, len(ordered)))
+        file.write(bytes(_padded(_HEADER.size) - _HEADER.size))
+        file.write(directory.tobytes())
+        file.write(table.tobytes())
+        file.write(strokes.tobytes())
+        file.write(bytes(_padded(2 * len(strokes)) - 2 * len(strokes)))
+        file.write(b"".join(values))
+    os.replace(f"{index}.tmp", index)
+
+
+# A steno dictionary read straight out of its memory-mapped index, so opening it costs the same however many entries
+# it has and only the pages that lookups touch are ever read. Lookups are incremental: the range of entries sharing
+# the strokes so far is narrowed one stroke at a time, the first straight from the directory.
+class StenoDictionary:
+    def __init__(self, data: mmap.mmap):
+        self.__data = data
+        _, _, _, _, count = _HEADER.unpack_from(data, 0)
+        self.__count = count
+        view = memoryview(data)
+        offset = _padded(_HEADER.size)
+        self.__directory = view[offset:offset + 4 * (TABLE_SIZE + 1)].cast("I")
+        offset += 4 * (TABLE_SIZE + 1)
+        self.__table = view[offset:offset + 4 * _FIELDS * count].cast("I")
+        offset += 4 * _FIELDS * count
+        strokes = self.__table[_FIELDS * (count - 1)] + self.__table[_FIELDS * (count - 1) + 1] if count else 0
+        self.__strokes = view[offset:offset + 2 * strokes].cast("H")
+        self.__values = offset + _padded(2 * strokes)
+
+    # Opens the index of a JSON dictionary, compiling it first when it's missing or older than the dictionary
+    @staticmethod
+    def open(filename: str) -> "StenoDictionary":
+        index = index_filename(filename)
+        status = os.stat(filename)
+        try:
+            with open(index, "rb") as file:
+                header = file.read(_HEADER.size)
+            current = len(header) == _HEADER.size and _HEADER.unpack(header)[:4] == (
+                MAGIC, _BYTE_ORDER, status.st_size, status.st_mtime_ns
+            )
+        except OSError:
+            current = False
+        if not current:
+            compile_dictionary(filename, index)
+        with open(index, "rb") as file:
+            return StenoDictionary(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self.__count
+
+    def close(self):
+        self.__directory.release()
+        self.__table.release()
+        self.__strokes.release()
+        self.__data.close()
+
+    # Narrows the entries [low, high), which share their first depth strokes, to those whose next stroke is stroke
+    def narrow(self, low: int, high: int, depth: int, stroke: int) -> Tuple[int, int]:
+        if depth == 0:
+            if not 0 <= stroke < TABLE_SIZE:
+                return 0, 0
+            return self.__directory[stroke], self.__directory[stroke + 1]
+        table = self.__table
+        strokes = self.__strokes
+        end = high
+        # An entry that ends at depth sorts before every longer one, as -1
+        while low < high:
+            middle = (low + high) // 2
+            entry = _FIELDS * middle
+            if table[entry + 1] <= depth or strokes[table[entry] + depth] < stroke:
+                low = middle + 1
+            else:
+                high = middle
+        start, high = low, end
+        while low < high:
+            middle = (low + high) // 2
+            entry = _FIELDS * middle
+            if table[entry + 1] <= depth or strokes[table[entry] + depth] <= stroke:
+                low = middle + 1
+            else:
+                high = middle
+        return start, low
+
+    # The translation of the first entry of a narrowed range, if its sequence is exactly depth strokes long
+    def translation(self, index: int, depth: int) -> str | None:
+        entry = _FIELDS * index
+        if self.__table[entry + 1] != depth:
+            return None
+        value = self.__values + self.__table[entry + 2]
+        return self.__data[value:value + self.__table[entry + 3]].decode("utf-8")
+
+    def lookup(self, strokes: List[int]) -> str | None:
+        low, high = 0, self.__count
+        for depth, stroke in enumerate(strokes):
+            low, high = self.narrow(low, high, depth, stroke)
+            if low == high:
+                return None
+        return self.translation(low, len(strokes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a steno dictionary's index ahead of time")
+    parser.add_argument("dictionary")
+    args = parser.parse_args()
+
+    started = perf_counter()
+    compile_dictionary(args.dictionary, index_filename(args.dictionary))
+    compiled = perf_counter() - started
+    dictionary = StenoDictionary.open(args.dictionary)
+    print(
+        f"{len(dictionary)} entries compiled into {index_filename(args.dictionary)} "
+        f"({os.path.getsize(index_filename(args.dictionary))} bytes) in {compiled:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from functools import lru_cache
+from threading import Lock
+from typing import List, Tuple
+
+from akimboxr.model.AkimboProgram import render_text, retraction
+from akimboxr.threads.KeyboardThread import KeyOp
+
+from .StenoDictionary import StenoDictionary
+
+
+@lru_cache(maxsize=4096)
+def _render(backspaces: int, text: str, rate: float) -> Tuple[KeyOp, ...]:
+    return retraction(backspaces) + render_text(text, rate)
+
+
+# Turns strokes into text as they come, the way Plover does: a stroke that completes a translation types it straight
+# away, and when a following stroke extends it into a longer one, the shorter one is backspaced and replaced. Strokes
+# that only start a longer entry wait for the next one; when it doesn't continue them, the last translation stays and
+# the strokes after it are translated again on their own. A stroke no entry starts with types nothing.
+class StenoTranslator:
+    def __init__(self, dictionary: StenoDictionary, rate: float = 0):
+        self.__dictionary = dictionary
+        self.__rate = rate
+        self.__lock = Lock()
+        self.__strokes: List[int] = []
+        self.__low = 0
+        self.__high = len(dictionary)
+        # How many of the strokes the typed translation covers, and what was typed for it
+        self.__matched = 0
+        self.__shown = ""
+
+    def reset(self):
+        with self.__lock:
+            self.__reset()
+
+    def __reset(self):
+        self.__strokes = []
+        self.__low = 0
+        self.__high = len(self.__dictionary)
+        self.__matched = 0
+        self.__shown = ""
+
+    # The keys to type for the stroke, everything it causes rendered into one batch
+    def stroke(self, stroke: int) -> Tuple[KeyOp, ...]:
+        with self.__lock:
+            output = ()
+            strokes = [stroke]
+            index = 0
+            while index < len(strokes):
+                stroke = strokes[index]
+                index += 1
+                depth = len(self.__strokes)
+                low, high = self.__dictionary.narrow(self.__low, self.__high, depth, stroke)
+                if low < high:
+                    self.__strokes.append(stroke)
+                    self.__low, self.__high = low, high
+                    translation = self.__dictionary.translation(low, depth + 1)
+                    if translation is not None:
+                        text = " " + translation
+                        output += _render(len(self.__shown), text, self.__rate)
+                        self.__matched = len(self.__strokes)
+                        self.__shown = text
+                        if high - low == 1:
+                            # Nothing longer starts with these strokes
+                            self.__reset()
+                    continue
+                if not self.__strokes:
+                    continue
+                # The strokes can't go any further: keep what was typed, and go again with the strokes it didn't cover
+                # (dropping the first when nothing was typed, as no entry is exactly it) followed by this one
+                held = self.__strokes[self.__matched or 1:]
+                self.__reset()
+                strokes[index - 1:index] = [*held, stroke]
+                index -= 1
+            return output
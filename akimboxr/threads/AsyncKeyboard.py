@@ -0,0 +1,87 @@
+from asyncio import AbstractEventLoop, TimerHandle
+from typing import Tuple
+
+from akimboxr.metrics.LatencyTracker import LatencyTracker
+from akimboxr.output.KeyboardBackend import KeyboardBackend
+from akimboxr.output.PynputBackend import PynputBackend
+
+from .KeyboardThread import KeyboardScheduler, KeyboardThreadSupplier, KeyOp, KeySequence, _controller
+
+
+# A deferred sequence on the event loop; cancelling it cancels its timer too
+class _TimedSequence(KeySequence):
+    __slots__ = ("handle",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.handle: TimerHandle | None = None
+
+    def cancel(self):
+        super().cancel()
+        if self.handle is not None:
+            self.handle.cancel()
+
+
+# Runs key sequences on the event loop the taps are dispatched on, instead of handing them to the keyboard thread:
+# immediate sequences are typed inline and deferred ones are scheduled with loop.call_at, so cancelling is
+# TimerHandle.cancel(). Must only be used from the loop's thread.
+class AsyncKeyboardSupplier(KeyboardThreadSupplier):
+    def __init__(
+            self,
+            loop: AbstractEventLoop,
+            backend: KeyboardBackend | None = None,
+            tracker: LatencyTracker | None = None,
+            modifier_hold: float = 0,
+    ):
+        super().__init__(None, loop.time)
+        self.loop = loop
+        self.__emitter = KeyboardScheduler(
+            backend if backend is not None else PynputBackend(_controller), tracker, modifier_hold
+        )
+        self.__hold = modifier_hold
+        # Releases held back modifiers once the hold passes without output
+        self.__release: TimerHandle | None = None
+
+    def submit_sequence(
+            self, ops: Tuple[KeyOp, ...], delay: float = 0, tap_id: int = -1, tapped_at: int = 0
+    ) -> KeySequence:
+        now = self.loop.time()
+        if delay > 0:
+            sequence = _TimedSequence(self._next_task_id(), ops, now + delay, tap_id, tapped_at)
+            sequence.handle = self.loop.call_at(sequence.deadline, self._fire, sequence)
+            return sequence
+        sequence = KeySequence(self._next_task_id(), ops, 0, tap_id, tapped_at)
+        self._fire(sequence)
+        return sequence
+
+    def expedite(self, sequence: KeySequence):
+        if sequence.cancelled or sequence.position:
+            return
+        if isinstance(sequence, _TimedSequence) and sequence.handle is not None:
+            sequence.handle.cancel()
+        sequence.deadline = self.loop.time()
+        self._fire(sequence)
+
+    def _fire(self, sequence: KeySequence):
+        if sequence.cancelled:
+            # Only reached for a sequence cancelled mid-stream; one cancelled before it started had its timer cancelled
+            self.__emitter.drop(sequence, self.loop.time())
+        else:
+            resume = self.__emitter.emit(sequence, self.loop.time())
+            if resume is not None:
+                self.loop.call_at(resume, self._fire, sequence)
+        if self.__hold > 0:
+            self.__schedule_release()
+
+    def __schedule_release(self):
+        if self.__release is not None:
+            self.__release.cancel()
+            self.__release = None
+        # Only held back releases are left in the scheduler, as everything else runs on its own timer
+        timeout = self.__emitter.timeout(self.loop.time())
+        if timeout is not None:
+            self.__release = self.loop.call_later(timeout, self.__run_release)
+
+    def __run_release(self):
+        self.__release = None
+        self.__emitter.run_due(self.loop.time())
@@ -0,0 +1,132 @@
+from collections import deque
+from enum import Enum
+from queue import Queue
+from time import monotonic_ns
+
+from akimboxr.metrics.QueueMetrics import QueueMetrics
+from akimboxr.metrics.Tracer import TraceEvent, tracer
+from akimboxr.output.KeyboardBackend import KeyOperation
+
+from .ModifierCoalescer import MODIFIERS
+
+
+class OverflowPolicy(Enum):
+    # The producer waits for the worker to take a sequence
+    Block = "block"
+    # The oldest queued deferred sequence is cancelled to make room
+    DropOldestDeferred = "drop-oldest-deferred"
+    # Redundant messages are removed and consecutive immediate sequences merged into one
+    Coalesce = "coalesce"
+
+
+# The queue between the model and the keyboard worker. Once maxsize sequences are waiting, a put makes room according
+# to the policy, falling back to waiting when there's nothing it can remove. Every sequence's time in the queue, the
+# deepest it got and every overflow are counted in metrics.
+class KeyQueue(Queue):
+    def __init__(self, maxsize: int = 0, policy: OverflowPolicy = OverflowPolicy.Block):
+        super().__init__(maxsize)
+        self.policy = policy
+        self.metrics = QueueMetrics(maxsize)
+
+    def _init(self, maxsize: int):
+        self.queue = deque()
+
+    def _put(self, item):
+        self.queue.append((item, monotonic_ns()))
+        if len(self.queue) > self.metrics.high_water:
+            self.metrics.high_water = len(self.queue)
+
+    def _get(self):
+        item, enqueued = self.queue.popleft()
+        self.metrics.waits.record(monotonic_ns() - enqueued)
+        return item
+
+    def put(self, item, block=True, timeout=None):
+        if self.maxsize > 0:
+            with self.mutex:
+                full = len(self.queue) >= self.maxsize
+                if full and self.policy != OverflowPolicy.Block:
+                    removed = self.__drop_oldest_deferred() if self.policy == OverflowPolicy.DropOldestDeferred else (
+                        self.__coalesce()
+                    )
+                    if removed:
+                        self.__removed(removed)
+                    full = len(self.queue) >= self.maxsize
+                if full and block:
+                    # Each device's taps arrive on their own thread, so the metrics are only updated under the mutex
+                    self.metrics.blocked += 1
+            if full and block:
+                started = monotonic_ns()
+                super().put(item, block, timeout)
+                with self.mutex:
+                    self.metrics.blocked_ns += monotonic_ns() - started
+                return
+        super().put(item, block, timeout)
+
+    # Removed sequences are never taken, so they count as done for join()
+    def __removed(self, count: int):
+        self.unfinished_tasks -= count
+        if self.unfinished_tasks <= 0:
+            self.all_tasks_done.notify_all()
+        self.not_full.notify(count)
+
+    def __drop_oldest_deferred(self) -> int:
+        for index, (sequence, _) in enumerate(self.queue):
+            if sequence.deadline and not sequence.expedited and not sequence.position:
+                del self.queue[index]
+                if tracer.enabled:
+                    tracer.record(TraceEvent.Overflow, 0, sequence.tap_id, sequence.task_id)
+                # Also ignores it if it's expedited later
+                sequence.cancel()
+                self.metrics.dropped += 1
+                return 1
+        return 0
+
+    def __coalesce(self) -> int:
+        kept = deque()
+        queued = set()
+        merged = None
+        # The ops of the runs of immediate sequences, each merged into its first
+        runs = []
+        for entry in self.queue:
+            sequence = entry[0]
+            if (
+                    sequence.cancelled and not sequence.position
+                    # The earlier message already runs it now, as the flag is on the sequence
+                    or sequence.expedited and id(sequence) in queued
+            ):
+                if tracer.enabled:
+                    tracer.record(TraceEvent.Overflow, 0, sequence.tap_id, sequence.task_id)
+                continue
+            queued.add(id(sequence))
+            if sequence.deadline or sequence.expedited or any(offset for _, _, offset in sequence.ops):
+                merged = None
+                kept.append(entry)
+                continue
+            if merged is None:
+                merged = sequence
+                runs.append((sequence, list(sequence.ops)))
+                kept.append(entry)
+                continue
+            if tracer.enabled:
+                tracer.record(TraceEvent.Overflow, 0, sequence.tap_id, sequence.task_id)
+            _join(runs[-1][1], sequence.ops)
+        for sequence, ops in runs:
+            sequence.ops = tuple(ops)
+        removed = len(self.queue) - len(kept)
+        self.queue = kept
+        self.metrics.coalesced += removed
+        return removed
+
+
+# Appends ops to a run of them, without releasing and pressing again a modifier that both hold
+def _join(ops: list, following: tuple):
+    start = 0
+    while (
+            ops and start < len(following)
+            and ops[-1][0] == KeyOperation.Release and following[start][0] == KeyOperation.Press
+            and ops[-1][1] == following[start][1] and ops[-1][1] in MODIFIERS
+    ):
+        ops.pop()
+        start += 1
+    ops.extend(following[start:] if start else following)
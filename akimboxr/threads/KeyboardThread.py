@@ -1,142 +1,247 @@
-from enum import Enum
+import heapq
 from queue import Queue, Empty
 from threading import Thread
-from typing import Dict, List
+from itertools import count
+from typing import Callable, List, Tuple
 
 from pynput.keyboard import KeyCode, Key, Controller
-from datetime import datetime, timedelta
-from time import sleep
+from time import monotonic
 from logging import getLogger
 
+from akimboxr.metrics.LatencyTracker import LatencyPath, LatencyTracker
+from akimboxr.metrics.Tracer import TraceEvent, tracer
+from akimboxr.output.KeyboardBackend import KeyboardBackend, KeyOperation, KeyOp
+from akimboxr.output.PynputBackend import PynputBackend
+
+from .KeyQueue import KeyQueue
+from .ModifierCoalescer import ModifierCoalescer
+
 logger = getLogger(__name__)
 logger.setLevel('INFO')
 
-queue = Queue()
+queue = KeyQueue()
 _controller = Controller()
 
 
-class KeyOperation(Enum):
-    Press = "press",
-    Release = "release",
-    Tap = "tap",
-    Cancel = "cancel"
+# A batch of key operations submitted as one queue message. Cancelling only flips a flag that the worker checks when
+# the sequence comes due, so it never costs a queue round-trip. Expediting re-sends the sequence flagged to run now.
+class KeySequence:
+    __slots__ = ("task_id", "ops", "deadline", "position", "cancelled", "expedited", "tap_id", "tapped_at")
+
+    def __init__(
+            self, task_id: int, ops: Tuple[KeyOp, ...], deadline: float, tap_id: int = -1, tapped_at: int = 0
+    ):
+        self.task_id = task_id
+        self.ops = ops
+        self.deadline = deadline
+        self.position = 0
+        self.cancelled = False
+        self.expedited = False
+        # The tap that produced this sequence and when it entered the model (monotonic ns), for latency tracing
+        self.tap_id = tap_id
+        self.tapped_at = tapped_at
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __repr__(self):
+        return f"KeySequence({self.task_id}, ops={len(self.ops)}, deadline={self.deadline})"
 
 
 class KeyboardThreadSupplier:
-    def __init__(self, _queue: Queue):
+    def __init__(self, _queue: Queue, clock: Callable[[], float] = monotonic):
         self.queue = _queue
-        self._task_id = 0
+        self.clock = clock
+        self._task_ids = count()
 
     def _next_task_id(self):
-        task_id = self._task_id
-        self._task_id += 1
-        return task_id
-
-    def _cancel_key(self, task_id: int):
-        logger.debug(f"Pushing cancel for {task_id}")
-        self.queue.put((task_id, KeyOperation.Cancel))
-        logger.debug(f"Queue size {self.queue.qsize()}")
+        return next(self._task_ids)
+
+    def submit_sequence(
+            self, ops: Tuple[KeyOp, ...], delay: float = 0, tap_id: int = -1, tapped_at: int = 0
+    ) -> KeySequence:
+        sequence = KeySequence(
+            self._next_task_id(), ops, self.clock() + delay if delay > 0 else 0, tap_id, tapped_at
+        )
+        if tracer.enabled:
+            tracer.record(TraceEvent.Submit, 0, tap_id, sequence.task_id, int(self.clock() * 1_000_000_000))
+        self.queue.put(sequence)
+        return sequence
+
+    # Runs a deferred sequence now rather than at its deadline; a no-op if it already started
+    def expedite(self, sequence: KeySequence):
+        sequence.expedited = True
+        if tracer.enabled:
+            tracer.record(
+                TraceEvent.Expedite, 0, sequence.tap_id, sequence.task_id, int(self.clock() * 1_000_000_000)
+            )
+        self.queue.put(sequence)
 
     def press_key(self, key: Key | KeyCode, delay: float = 0):
-        logger.debug(f"Pushing press for {key}")
-        task_id = self._next_task_id()
-        self.queue.put((task_id, KeyOperation.Press, key, delay))
-        logger.debug(f"Queue size {self.queue.qsize()}")
-        return lambda: self._cancel_key(task_id)
+        return self.submit_sequence(((KeyOperation.Press, key, 0),), delay)
 
     def release_key(self, key: Key | KeyCode, delay: float = 0):
-        logger.debug(f"Pushing release for {key}")
-        task_id = self._next_task_id()
-        self.queue.put((task_id, KeyOperation.Release, key, delay))
-        logger.debug(f"Queue size {self.queue.qsize()}")
-        return lambda: self._cancel_key(task_id)
+        return self.submit_sequence(((KeyOperation.Release, key, 0),), delay)
 
     def tap_key(self, key: Key | KeyCode, delay: float = 0):
-        logger.debug(f"Pushing tap for {key}")
-        task_id = self._next_task_id()
-        self.queue.put((task_id, KeyOperation.Tap, key, delay))
-        logger.debug(f"Queue size {self.queue.qsize()}")
-        return lambda: self._cancel_key(task_id)
-
-
-def _worker(key_queue: Queue):
-    tasks: Dict[int, (datetime, KeyOperation, Key | KeyCode)] = {}
-    times: Dict[datetime, List[int]] = {}
-
-    def _del_task(to_delete):
-        if to_delete not in tasks:
+        return self.submit_sequence(((KeyOperation.Tap, key, 0),), delay)
+
+
+# Min-heap of deferred key sequences ordered by monotonic deadline. Cancelled sequences, and the entries expedited ones
+# leave behind, are skipped when they surface, so neither cancelling nor expediting searches the heap. With a modifier
+# hold (seconds), modifiers stay down between keystrokes that need them, for up to that long without output.
+class KeyboardScheduler:
+    def __init__(self, backend: KeyboardBackend, tracker: LatencyTracker | None = None, modifier_hold: float = 0):
+        self.__backend = backend
+        self.__tracker = tracker
+        self.__deadlines: List[Tuple[float, int, KeySequence]] = []
+        self.__modifiers = ModifierCoalescer(modifier_hold) if modifier_hold > 0 else None
+
+    def __len__(self):
+        return len(self.__deadlines)
+
+    def timeout(self, now: float) -> float | None:
+        # How long the worker may block before the earliest deadline is due
+        deadlines = self.__deadlines
+        while deadlines:
+            deadline, _, sequence = deadlines[0]
+            stale = self.__stale(deadline, sequence)
+            if not stale and not sequence.cancelled:
+                break
+            heapq.heappop(deadlines)
+            if not stale:
+                self.drop(sequence, now)
+        deadline = deadlines[0][0] if deadlines else None
+        release = self.__modifiers.deadline if self.__modifiers is not None else None
+        if release is not None and (deadline is None or release < deadline):
+            deadline = release
+        if deadline is None:
+            return None
+        return max(deadline - now, 0)
+
+    def submit(self, sequence: KeySequence, now: float):
+        if sequence.expedited:
+            self.expedite(sequence, now)
             return
-        time, _, _ = tasks[to_delete]
-        times[time].remove(to_delete)
-        del tasks[to_delete]
-
+        if sequence.cancelled:
+            self.drop(sequence, now)
+            return
+        if sequence.deadline > now:
+            heapq.heappush(self.__deadlines, (sequence.deadline, sequence.task_id, sequence))
+        else:
+            self._run(sequence, now)
+
+    def run_due(self, now: float):
+        deadlines = self.__deadlines
+        while deadlines and deadlines[0][0] <= now:
+            deadline, _, sequence = heapq.heappop(deadlines)
+            if self.__stale(deadline, sequence):
+                continue
+            if sequence.cancelled:
+                self.drop(sequence, now)
+            else:
+                self._run(sequence, now)
+        modifiers = self.__modifiers
+        if modifiers is not None and modifiers.deadline is not None and modifiers.deadline <= now:
+            self.__backend.emit(modifiers.release())
+
+    # The expedited sequence may still be queued or already done. Moving its deadline up leaves any heap entry it has
+    # stale rather than searching for it.
+    def expedite(self, sequence: KeySequence, now: float):
+        if sequence.cancelled or sequence.position:
+            return
+        sequence.deadline = now
+        self._run(sequence, now)
+
+    # Whether a heap entry is no longer when its sequence is next due: it ran, or was expedited, since it was pushed
+    @staticmethod
+    def __stale(deadline: float, sequence: KeySequence) -> bool:
+        position = sequence.position
+        if position == 0:
+            return deadline != sequence.deadline
+        return position >= len(sequence.ops) or deadline != sequence.deadline + sequence.ops[position][2]
+
+    def drop(self, sequence: KeySequence, now: float):
+        if tracer.enabled:
+            tracer.record(TraceEvent.Drop, 0, sequence.tap_id, sequence.task_id, int(now * 1_000_000_000))
+        if sequence.position == 0:
+            if self.__tracker is not None and sequence.tapped_at:
+                self.__tracker.record(LatencyPath.Cancelled, sequence.tapped_at, int(now * 1_000_000_000))
+            return
+        # Cancelled mid-stream: let go of whatever the emitted part left held, e.g. shift
+        held = {}
+        for mode, key, _ in sequence.ops[:sequence.position]:
+            if mode == KeyOperation.Press:
+                held[key] = True
+            elif mode == KeyOperation.Release:
+                held.pop(key, None)
+        if held:
+            self.__output(tuple((KeyOperation.Release, key, 0) for key in reversed(list(held))), now)
+        sequence.position = len(sequence.ops)
+
+    def _run(self, sequence: KeySequence, now: float):
+        resume = self.emit(sequence, now)
+        if resume is not None:
+            heapq.heappush(self.__deadlines, (resume, sequence.task_id, sequence))
+
+    # Emits every op of the sequence that is due in one backend call, returning when the next spaced-out op is due (if
+    # any are left)
+    def emit(self, sequence: KeySequence, now: float) -> float | None:
+        ops = sequence.ops
+        start = position = sequence.position
+        if position == 0:
+            if self.__tracker is not None and sequence.tapped_at and ops:
+                path = LatencyPath.Deferred if sequence.deadline else LatencyPath.Immediate
+                self.__tracker.record(path, sequence.tapped_at, int(now * 1_000_000_000))
+            if not sequence.deadline:
+                # Immediate sequences are timed from their first emitted op
+                sequence.deadline = now
+        resume = None
+        due = sequence.deadline
+        while position < len(ops):
+            if due + ops[position][2] > now:
+                resume = due + ops[position][2]
+                break
+            position += 1
+        if position > start:
+            if tracer.enabled:
+                tracer.record(TraceEvent.Emit, 0, sequence.tap_id, sequence.task_id, int(now * 1_000_000_000))
+            self.__output(ops[start:position] if start or position < len(ops) else ops, now)
+        sequence.position = position
+        return resume
+
+    def __output(self, ops: Tuple[KeyOp, ...], now: float):
+        if self.__modifiers is not None:
+            ops = self.__modifiers.filter(ops, now)
+            if not ops:
+                return
+        self.__backend.emit(ops)
+
+
+def _worker(key_queue: Queue, scheduler: KeyboardScheduler, clock: Callable[[], float] = monotonic):
     while True:
-        logger.debug("Poll")
-        now = datetime.now()
-
-        for entry in times:
-            if entry < now:
-                for task_id in sorted(times[entry]):
-                    logger.debug(f"Running deferred task {task_id}")
-                    _, mode, key = tasks[task_id]
-                    match mode:
-                        case KeyOperation.Press:
-                            _controller.press(key)
-
-                        case KeyOperation.Release:
-                            _controller.release(key)
-
-                        case KeyOperation.Tap:
-                            _controller.tap(key)
-                    _del_task(task_id)
-
-        times = dict(filter(lambda x: len(x[1]) > 0, times.items()))
-
-        logger.debug(f"Queue length {key_queue.qsize()}")
-
+        # Block until either a message arrives or the next deadline is due
         try:
-            task_id, mode, *rest = key_queue.get(block=False)
-            logger.debug(f"Got {mode} ({task_id}) from queue")
-            match mode:
-                case KeyOperation.Cancel:
-                    _del_task(task_id)
-
-                case KeyOperation.Press:
-                    key, delay = rest
-                    if delay > 0:
-                        tasks[task_id] = (now + timedelta(seconds=delay), mode, key)
-                        times[now + timedelta(seconds=delay)] = times.get(now + timedelta(seconds=delay), []) + [
-                            task_id]
-                    else:
-                        _controller.press(key)
-                        _del_task(task_id)
-
-                case KeyOperation.Release:
-                    key, delay = rest
-                    if delay > 0:
-                        tasks[task_id] = (now + timedelta(seconds=delay), mode, key)
-                        times[now + timedelta(seconds=delay)] = times.get(now + timedelta(seconds=delay), []) + [
-                            task_id]
-                    else:
-                        _controller.release(key)
-                        _del_task(task_id)
-
-                case KeyOperation.Tap:
-                    key, delay = rest
-                    if delay > 0:
-                        tasks[task_id] = (now + timedelta(seconds=delay), mode, key)
-                        times[now + timedelta(seconds=delay)] = times.get(now + timedelta(seconds=delay), []) + [
-                            task_id]
-                    else:
-                        _controller.tap(key)
-                        _del_task(task_id)
-            key_queue.task_done()
+            sequence = key_queue.get(timeout=scheduler.timeout(clock()))
         except Empty:
-            pass
-        sleep(0)
+            sequence = None
+
+        now = clock()
+        scheduler.run_due(now)
+        if sequence is not None:
+            scheduler.submit(sequence, now)
+            key_queue.task_done()
 
 
-def run_keyboard_thread():
-    worker = Thread(target=_worker, daemon=True, args=(queue,))
+def run_keyboard_thread(
+        key_queue: Queue = queue,
+        backend: KeyboardBackend | None = None,
+        tracker: LatencyTracker | None = None,
+        modifier_hold: float = 0,
+):
+    backend = backend if backend is not None else PynputBackend(_controller)
+    scheduler = KeyboardScheduler(backend, tracker, modifier_hold)
+    worker = Thread(target=_worker, daemon=True, args=(key_queue, scheduler))
     worker.start()
     logger.info("Started keyboard worker")
+    return worker
@@ -0,0 +1,55 @@
+from typing import List, Sequence
+
+from pynput.keyboard import Key
+
+from akimboxr.output.KeyboardBackend import KeyOp, KeyOperation
+
+MODIFIERS = frozenset((
+    Key.shift, Key.shift_l, Key.shift_r, Key.ctrl, Key.ctrl_l, Key.ctrl_r, Key.alt, Key.alt_l, Key.alt_r, Key.alt_gr,
+    Key.cmd, Key.cmd_l, Key.cmd_r,
+))
+
+
+# Keeps modifiers held between keystrokes that each press and release them, e.g. every key typed on a transparent
+# shift layer. A modifier's release is held back until a key is pressed without it being pressed again first, or until
+# hold seconds pass without output; pressing it again while its release is held back emits nothing.
+class ModifierCoalescer:
+    def __init__(self, hold: float):
+        self.hold = hold
+        # Modifiers the ops released that are still down on the output
+        self.__released: List[Key] = []
+        self.__deadline: float | None = None
+
+    # When the held back releases have to go out (monotonic seconds), if there are any
+    @property
+    def deadline(self) -> float | None:
+        return self.__deadline
+
+    def filter(self, ops: Sequence[KeyOp], now: float) -> Sequence[KeyOp]:
+        released = self.__released
+        if not released and not any(type(key) is Key and key in MODIFIERS for _, key, _ in ops):
+            return ops
+        out = []
+        for op in ops:
+            mode, key, _ = op
+            if type(key) is Key and key in MODIFIERS:
+                if mode == KeyOperation.Press and key in released:
+                    released.remove(key)
+                    continue
+                if mode == KeyOperation.Release:
+                    if key not in released:
+                        released.append(key)
+                    continue
+            elif released and mode != KeyOperation.Release:
+                out.extend((KeyOperation.Release, modifier, 0) for modifier in released)
+                released.clear()
+            out.append(op)
+        self.__deadline = now + self.hold if released else None
+        return out
+
+    # The releases held back, which are now due
+    def release(self) -> Sequence[KeyOp]:
+        ops = tuple((KeyOperation.Release, modifier, 0) for modifier in self.__released)
+        self.__released.clear()
+        self.__deadline = None
+        return ops
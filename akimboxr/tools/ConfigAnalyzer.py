@@ -0,0 +1,250 @@
+import argparse
+import json
+import sys
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+from akimboxr.config.AkimboConfig import ConfigMapEntryType, deserialize_config, format_code
+from akimboxr.model.AkimboCompiler import CompiledConfig, compile_config
+from akimboxr.model.AkimboLayer import HAND_SIZE, TABLE_SIZE, AkimboLayer, AkimboSlot, chord_hands, resolve_stack
+from akimboxr.model.AkimboProgram import LayerOperation, LinkedProgram
+from akimboxr.model.ComboTrie import ROOT
+
+# Stacks deeper than this aren't explored, as a layer that pushes itself would otherwise never stop
+MAX_DEPTH = 8
+_TAPS = {1: ConfigMapEntryType.Single.value, 2: ConfigMapEntryType.Double.value, 3: ConfigMapEntryType.Triple.value}
+
+
+# Works out ahead of time what the model would do with every tap: which layer stacks the config's layer actions can
+# reach, and for each code bound on each of them how long each tap count's output can wait before it's emitted, and
+# why. Also finds the layers and map entries no tap can ever reach.
+class ConfigAnalyzer:
+    def __init__(self, config: CompiledConfig):
+        self.__config = config
+        # Which layer defines each slot; the tables of the layers extending it hold it too, wrapped
+        self.__owners: Dict[int, str] = {}
+        for layer in config.layers.values():
+            for slot in layer.table:
+                if slot is not None and not slot.layers:
+                    self.__owners[slot.index] = layer.name
+        window = config.timeout
+        if config.adaptive is not None and config.adaptive.max is not None:
+            window = max(window, config.adaptive.max / 1000)
+        # The longest a multi-tap can wait, learned windows included
+        self.__window = window
+        self.__combo_starts = set(config.combos.edges[ROOT]) if config.combos is not None else set()
+        self.__tables: Dict[Tuple[AkimboLayer, ...], Tuple[AkimboSlot | None, ...]] = {}
+        self.truncated = False
+
+    def __table(self, stack: Tuple[AkimboLayer, ...]) -> Tuple[AkimboSlot | None, ...]:
+        table = self.__tables.get(stack)
+        if table is None:
+            table = self.__tables[stack] = resolve_stack(stack)
+        return table
+
+    def stacks(self) -> List[Tuple[AkimboLayer, ...]]:
+        layers = self.__config.layers
+        start = tuple(layers[name] for name in self.__config.defaults)
+        seen = {start}
+        order = [start]
+        pending = deque([start])
+        while pending:
+            stack = pending.popleft()
+            for program in self.__programs(stack):
+                following = _apply(stack, program, layers)
+                if following in seen:
+                    continue
+                if len(following) > MAX_DEPTH:
+                    self.truncated = True
+                    continue
+                seen.add(following)
+                order.append(following)
+                pending.append(following)
+        return order
+
+    # Every program a tap can run on the stack, combos included as they apply on any stack
+    def __programs(self, stack: Tuple[AkimboLayer, ...]):
+        for slot in self.__table(stack):
+            if slot is not None:
+                yield from (program for program in slot.programs if program is not None)
+        if self.__config.combos is not None:
+            yield from (program for program in self.__config.combos.programs if program is not None)
+
+    def analyze(self) -> Dict[str, Any]:
+        config = self.__config
+        stacks = self.stacks()
+        # Stacks that resolve every code the same way are reported once
+        reported = {}
+        resolved_slots = set()
+        for stack in stacks:
+            table = self.__table(stack)
+            key = tuple(None if slot is None else (slot.index, slot.layers) for slot in table)
+            resolved_slots.update(slot.index for slot in table if slot is not None)
+            if key not in reported:
+                reported[key] = self.__stack(stack, table)
+        reached = {layer.name for stack in stacks for layer in stack}
+
+        bindings = [binding for stack in reported.values() for binding in stack["bindings"]]
+        worst = max((tap["delay_ms"] for binding in bindings for tap in binding["taps"].values()), default=0)
+        return {
+            "timeout_ms": config.timeout * 1000,
+            "mode": config.mode.value,
+            "worst_delay_ms": worst,
+            "truncated": self.truncated,
+            "stacks": list(reported.values()),
+            "unreachable_layers": [name for name in config.layers if name not in reached],
+            "shadowed": self.__shadowed(reached, resolved_slots),
+            "triple_deferrals": self.__triple_deferrals(bindings),
+        }
+
+    def __stack(self, stack: Tuple[AkimboLayer, ...], table: Tuple[AkimboSlot | None, ...]) -> Dict[str, Any]:
+        config = self.__config
+        joins = chord_hands(table)
+        bindings = []
+        for code, slot in enumerate(table):
+            if slot is None:
+                continue
+            # Holds before the model sees the tap at all: waiting for the other hand, then for a combo to continue
+            held = 0
+            holds = []
+            if config.chord_window > 0 and code < HAND_SIZE and (joins[code] or joins[HAND_SIZE + code]):
+                held += config.chord_window
+                holds.append("chord")
+            if code in self.__combo_starts:
+                held += config.combo_window
+                holds.append("combo")
+            taps = {}
+            for presses, delay, reasons in self.__delays(slot):
+                taps[_TAPS[presses]] = {
+                    "delay_ms": round((held + delay) * 1000, 3),
+                    "reasons": holds + reasons,
+                }
+            bindings.append({
+                "code": format_code(code),
+                "layer": self.__owners.get(slot.index),
+                "through": [layer.name for layer in slot.layers],
+                "speculative": slot.speculative,
+                "taps": taps,
+            })
+        top = stack[-1] if stack else None
+        return {
+            "layers": [layer.name for layer in stack],
+            "steno": top.steno.dictionary if top is not None and top.steno is not None else None,
+            "bindings": bindings,
+        }
+
+    # How long the output of each tap count the slot binds waits after the tap that completes it (mirroring
+    # AkimboTapHandler.execute), and what it waits for
+    def __delays(self, slot: AkimboSlot):
+        single, double, triple = (slot.actions[presses] is not None for presses in (1, 2, 3))
+        window = self.__window
+        if slot.speculative:
+            # Typed straight away and backspaced when a later tap changes it
+            for presses, bound in ((1, single), (2, double), (3, triple)):
+                if bound:
+                    yield presses, 0, []
+            return
+        if single:
+            if double or triple:
+                yield 1, window, ["double" if double else "triple"]
+            else:
+                yield 1, 0, []
+        if double:
+            if triple:
+                yield 2, window, ["triple"]
+            else:
+                yield 2, 0, []
+        if triple:
+            yield 3, 0, []
+
+    def __shadowed(self, reached: set, resolved_slots: set) -> List[Dict[str, Any]]:
+        config = self.__config
+        shadowed = []
+        for name, source in config.sources.items():
+            layer = config.layers[name]
+            seen = set()
+            for entry in source.map:
+                found = {"layer": name, "code": format_code(entry.code), "type": entry.type.value}
+                if entry.code >= TABLE_SIZE:
+                    shadowed.append({**found, "reason": "code out of range"})
+                    continue
+                if (entry.code, entry.type) in seen:
+                    shadowed.append({**found, "reason": "an earlier entry binds the same code and type"})
+                    continue
+                seen.add((entry.code, entry.type))
+                slot = layer.table[entry.code]
+                if name not in reached:
+                    shadowed.append({**found, "reason": "layer unreachable"})
+                elif slot is None or slot.index not in resolved_slots:
+                    shadowed.append({**found, "reason": "never on top of a reachable stack"})
+        return shadowed
+
+    # Bindings whose lower tap counts wait only because a triple is bound, and what dropping it would save them
+    def __triple_deferrals(self, bindings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        deferrals = {}
+        for binding in bindings:
+            deferred = [
+                taps for taps, tap in binding["taps"].items() if tap["reasons"] and tap["reasons"][-1] == "triple"
+            ]
+            if not deferred:
+                continue
+            key = (binding["layer"], binding["code"])
+            if key not in deferrals:
+                deferrals[key] = {
+                    "layer": binding["layer"],
+                    "code": binding["code"],
+                    "deferred": deferred,
+                    "saved_ms": round(self.__window * 1000, 3),
+                }
+        return list(deferrals.values())
+
+
+def _apply(stack: Tuple[AkimboLayer, ...], program: LinkedProgram, layers: Dict[str, AkimboLayer]):
+    for operation, name, _ in program.layers:
+        match operation:
+            case LayerOperation.Push:
+                if name in layers:
+                    stack = stack + (layers[name],)
+            case LayerOperation.Pop:
+                if len(stack) > 1:
+                    stack = stack[:-1]
+            case LayerOperation.Top:
+                if name in layers:
+                    stack = tuple(layer for layer in stack if layer.name != name) + (layers[name],)
+    return stack
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the worst-case latency of every binding a config can reach")
+    parser.add_argument("config", nargs="?", default="config.yaml")
+    parser.add_argument("--output", metavar="FILE", help="write the JSON report to FILE instead of stdout")
+    parser.add_argument(
+        "--max-delay",
+        type=float,
+        metavar="MS",
+        help="exit non-zero when any binding can wait longer than MS, e.g. in CI",
+    )
+    parser.add_argument("--fail-shadowed", action="store_true", help="exit non-zero when any entry is unreachable")
+    args = parser.parse_args()
+
+    report = {"config": args.config, **ConfigAnalyzer(compile_config(deserialize_config(args.config))).analyze()}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    failures = []
+    if args.max_delay is not None and report["worst_delay_ms"] > args.max_delay:
+        failures.append(f"a binding can wait {report['worst_delay_ms']}ms, over {args.max_delay}ms")
+    if args.fail_shadowed and (report["shadowed"] or report["unreachable_layers"]):
+        failures.append(f"{len(report['shadowed'])} entries can never be reached")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from collections import Counter
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, List, Tuple
+
+import yaml
+
+from akimboxr.config.AkimboConfig import (
+    ConfigActionType,
+    ConfigMapEntryType,
+    ConfigMode,
+    _Loader,
+    _parse_code,
+    deserialize_config_text,
+    format_code,
+)
+from akimboxr.model.AkimboCompiler import CompiledConfig, compile_config
+from akimboxr.model.AkimboLayer import HAND_SIZE, AkimboLayer, AkimboSlot, resolve_stack
+from akimboxr.model.AkimboTapHandler import MAX_TAPS
+from akimboxr.replay.TapLog import TapLog
+
+from .ConfigAnalyzer import _apply
+
+_PRESSES = {ConfigMapEntryType.Single.value: 1, ConfigMapEntryType.Double.value: 2, ConfigMapEntryType.Triple.value: 3}
+_TYPES = {presses: name for name, presses in _PRESSES.items()}
+# Actions backspacing can take back, so backspace mode can type them speculatively
+_TYPING = (ConfigActionType.Press.value, ConfigActionType.Text.value)
+# Positions are code * 4 + presses, so each code's single, double and triple sit next to each other
+_WIDTH = 4
+
+
+# How often each binding fired in a tap stream, by the layer that defines it, its code and its tap count. Each press is
+# handled the way AkimboTapHandler.execute handles it: presses older than the window drop out of the multi-tap, bindings
+# that run straight away count then, deferred ones (and what speculative taps left typed) once a different code or the
+# window passing ends the multi-tap, and it only ends early where the handler resets it. Layer actions are applied as
+# their bindings fire, so taps are counted against the stack they were made on.
+def count_usage(config: CompiledConfig, taps: Iterable[Tuple[str, int, int]]) -> Counter:
+    owners = {
+        slot.index: layer.name for layer in config.layers.values() for slot in layer.table
+        if slot is not None and not slot.layers
+    }
+    window = int(config.timeout * 1_000_000_000)
+    tables: Dict[Tuple[AkimboLayer, ...], Tuple[AkimboSlot | None, ...]] = {}
+    stack = tuple(config.layers[name] for name in config.defaults)
+    usage = Counter()
+    # Each device's multi-tap in progress: the slot, when its presses were, and the tap counts of the bindings that
+    # count once it's over (the deferred one, or the ones typed speculatively and not taken back yet)
+    pending: Dict[str, Tuple[AkimboSlot, List[int], List[int]]] = {}
+
+    def fire(slot: AkimboSlot, count: int):
+        nonlocal stack
+        usage[(owners.get(slot.index), slot.code, count)] += 1
+        stack = _apply(stack, slot.programs[count], config.layers)
+
+    def finish(identifier: str):
+        slot, _, waiting = pending.pop(identifier)
+        for count in waiting:
+            fire(slot, count)
+
+    for identifier, tapcode, timestamp in taps:
+        tap = pending.get(identifier)
+        if tap is not None:
+            # Only the presses still in the window count, and a full multi-tap drops its oldest one
+            times = [at for at in tap[1] if timestamp - at < window][1 - MAX_TAPS:]
+            if tap[0].code != tapcode or not times:
+                finish(identifier)
+                tap = None
+            else:
+                tap[1][:] = times
+        if tap is None:
+            table = tables.get(stack)
+            if table is None:
+                table = tables[stack] = resolve_stack(stack)
+            slot = table[tapcode] if 0 <= tapcode < len(table) else None
+            if slot is None:
+                continue
+            tap = pending[identifier] = (slot, [], [])
+        slot, times, waiting = tap
+        times.append(timestamp)
+        presses = len(times)
+        single, double, triple = (slot.actions[count] is not None for count in (1, 2, 3))
+        if slot.speculative:
+            # Each press's program takes back what the presses before it would have typed (see speculate), which is
+            # the last few typed when some dropped out of the window
+            if slot.programs[presses] is not None:
+                if presses == 2 and not double:
+                    # No double: the second press is another single
+                    waiting.append(1)
+                else:
+                    taken = (0, int(single), 1 if double else 2 * single)[presses - 1]
+                    del waiting[max(len(waiting) - taken, 0):]
+                    waiting.append(presses)
+            if presses == MAX_TAPS or (presses == 2 and not triple):
+                finish(identifier)
+            continue
+        # The press cancels the binding deferred by the last one
+        waiting.clear()
+        reset = False
+        if presses == 1:
+            if single and not double and not triple:
+                reset = True
+                fire(slot, 1)
+            elif single:
+                waiting.append(1)
+        elif presses == 2:
+            if single and not double and triple:
+                # No double: the single runs twice, and a third press can still make the triple
+                fire(slot, 1)
+                fire(slot, 1)
+            elif double and not triple:
+                reset = True
+                fire(slot, 2)
+            elif double:
+                waiting.append(2)
+        elif triple:
+            reset = True
+            fire(slot, 3)
+        if reset:
+            del pending[identifier]
+    for identifier in list(pending):
+        finish(identifier)
+    return usage
+
+
+# The search problem for one layer: its bindings on single-hand codes, how often each fired, and which can move. A
+# code's bindings only cost each other latency (a single waits out the window when a double or triple is bound, a
+# double when a triple is), so the cost of a layout is a sum over codes, and a move only changes the two codes it
+# touches.
+class LayoutProblem:
+    def __init__(
+            self,
+            frequencies: List[int],
+            typing: List[bool],
+            home: List[int],
+            pinned: List[bool],
+            pinned_codes: Iterable[int],
+            window: float,
+            tap_cost: float,
+            move_cost: float,
+            speculative: bool,
+    ):
+        self.frequencies = frequencies
+        self.typing = typing
+        self.home = home
+        self.pinned = pinned
+        self.window = window
+        self.tap_cost = tap_cost
+        # Charged per moved binding, scaled by the total use, so bindings that gain nothing stay where they are
+        self.move_cost = move_cost * max(sum(frequencies), 1)
+        self.speculative = speculative
+        layout = [-1] * (HAND_SIZE * _WIDTH)
+        for binding, position in enumerate(home):
+            layout[position] = binding
+        self.layout = layout
+        # Pinned bindings and pinned codes never change; every other position on a single-hand code can take a binding
+        held = {home[binding] for binding in range(len(home)) if pinned[binding]}
+        held.update(code * _WIDTH + presses for code in pinned_codes for presses in (1, 2, 3))
+        self.positions = [
+            code * _WIDTH + presses for code in range(1, HAND_SIZE) for presses in (1, 2, 3)
+            if code * _WIDTH + presses not in held
+        ]
+
+    # Mirrors the compiler's _retract: backspace mode only speculates on ambiguous codes, and only when every binding
+    # can be taken back
+    def __speculative(self, single: int, double: int, triple: int) -> bool:
+        if not self.speculative or (double < 0 and triple < 0):
+            return False
+        return all(self.typing[binding] for binding in (single, double, triple) if binding >= 0)
+
+    def code_cost(self, layout: List[int], code: int) -> float:
+        base = code * _WIDTH
+        single, double, triple = layout[base + 1], layout[base + 2], layout[base + 3]
+        if single < 0 and double < 0 and triple < 0:
+            return 0
+        speculative = self.__speculative(single, double, triple)
+        frequencies = self.frequencies
+        cost = 0
+        for presses, binding in ((1, single), (2, double), (3, triple)):
+            if binding < 0:
+                continue
+            delay = 0
+            if not speculative and (presses == 1 and (double >= 0 or triple >= 0) or presses == 2 and triple >= 0):
+                delay = self.window
+            cost += frequencies[binding] * (delay + self.tap_cost * presses)
+            if base + presses != self.home[binding]:
+                cost += self.move_cost
+        return cost
+
+    def cost(self, layout: List[int]) -> float:
+        return sum(self.code_cost(layout, code) for code in range(1, HAND_SIZE))
+
+    # Expected latency (ms) and taps per binding used, and how many bindings moved
+    def summary(self, layout: List[int]) -> Dict[str, float]:
+        total = max(sum(self.frequencies), 1)
+        delay = 0
+        taps = 0
+        moved = 0
+        for position, binding in enumerate(layout):
+            if binding < 0:
+                continue
+            code, presses = divmod(position, _WIDTH)
+            base = code * _WIDTH
+            single, double, triple = layout[base + 1], layout[base + 2], layout[base + 3]
+            speculative = self.__speculative(single, double, triple)
+            if not speculative and (presses == 1 and (double >= 0 or triple >= 0) or presses == 2 and triple >= 0):
+                delay += self.frequencies[binding] * self.window
+            taps += self.frequencies[binding] * presses
+            moved += position != self.home[binding]
+        return {
+            "delay_ms": round(delay / total, 3),
+            "taps": round(taps / total, 4),
+            "cost_ms": round((delay + taps * self.tap_cost) / total, 3),
+            "moved": moved,
+        }
+
+
+# Simulated annealing over swaps of two positions' bindings (either may be empty), from the current layout. Runs in a
+# worker process, one per seed.
+def anneal(problem: LayoutProblem, seed: int, iterations: int) -> Tuple[float, List[int]]:
+    rng = random.Random(seed)
+    layout = list(problem.layout)
+    positions = problem.positions
+    code_cost = problem.code_cost
+    cost = problem.cost(layout)
+    best, best_layout = cost, list(layout)
+    if len(positions) < 2:
+        return best, best_layout
+
+    def delta(first: int, second: int) -> float:
+        codes = {first // _WIDTH, second // _WIDTH}
+        before = sum(code_cost(layout, code) for code in codes)
+        layout[first], layout[second] = layout[second], layout[first]
+        after = sum(code_cost(layout, code) for code in codes)
+        return after - before
+
+    # Start hot enough to accept a typical uphill move most of the time
+    samples = []
+    for _ in range(200):
+        first, second = rng.sample(positions, 2)
+        if layout[first] < 0 and layout[second] < 0:
+            continue
+        change = delta(first, second)
+        layout[first], layout[second] = layout[second], layout[first]
+        if change > 0:
+            samples.append(change)
+    temperature = sum(samples) / len(samples) if samples else 1.0
+    cooling = (1e-4) ** (1 / max(iterations, 1))
+
+    for _ in range(iterations):
+        first, second = rng.sample(positions, 2)
+        if layout[first] < 0 and layout[second] < 0:
+            continue
+        change = delta(first, second)
+        if change <= 0 or rng.random() < math.exp(-change / temperature):
+            cost += change
+            if cost < best - 1e-9:
+                best, best_layout = cost, list(layout)
+        else:
+            layout[first], layout[second] = layout[second], layout[first]
+        temperature *= cooling
+    return best, best_layout
+
+
+# Remaps the bindings of one layer of a config across the single, double and triple taps of its single-hand codes, to
+# minimise the expected latency and tap count of the bindings a tap stream used. Layer-changing bindings and pinned
+# codes keep their places; chords and other layers are left alone.
+class LayoutOptimizer:
+    def __init__(
+            self,
+            source: str,
+            layer: str | None = None,
+            pinned: Iterable[int] = (),
+            tap_cost: float = 100,
+            move_cost: float = 0.01,
+    ):
+        self.__raw = yaml.load(source, Loader=_Loader)
+        self.config = compile_config(deserialize_config_text(source))
+        self.layer = layer if layer is not None else (self.config.defaults[0] if self.config.defaults else "")
+        if self.layer not in self.config.layers:
+            raise ValueError(f"No layer {self.layer} to optimise")
+        self.__pinned = set(pinned)
+        self.__tap_cost = tap_cost
+        self.__move_cost = move_cost
+        # The effective map entries the search can place: the first of each code and type on a single-hand code
+        self.__entries: List[Dict[str, Any]] = []
+        self.__shadowed: List[Dict[str, Any]] = []
+        seen = set()
+        for entry in self.__raw["layers"][self.layer].get("map", []):
+            key = (_parse_code(entry["code"]), entry["type"])
+            if key in seen:
+                self.__shadowed.append(entry)
+            elif 0 < key[0] < HAND_SIZE:
+                seen.add(key)
+                self.__entries.append(entry)
+            else:
+                seen.add(key)
+
+    def problem(self, usage: Counter) -> LayoutProblem:
+        config = self.config
+        source = config.sources[self.layer]
+        mode = source.mode if source.mode is not None else config.mode
+        frequencies, typing, home, pinned = [], [], [], []
+        for entry in self.__entries:
+            code = _parse_code(entry["code"])
+            presses = _PRESSES[entry["type"]]
+            frequencies.append(usage[(self.layer, code, presses)])
+            types = [action["type"] for action in entry.get("actions", [])]
+            typing.append(all(kind in _TYPING for kind in types))
+            home.append(code * _WIDTH + presses)
+            pinned.append(code in self.__pinned or not typing[-1])
+        return LayoutProblem(
+            frequencies,
+            typing,
+            home,
+            pinned,
+            self.__pinned,
+            config.timeout * 1000,
+            self.__tap_cost,
+            self.__move_cost,
+            mode == ConfigMode.Backspace,
+        )
+
+    def optimise(self, usage: Counter, workers: int = 0, restarts: int = 0, iterations: int = 200_000):
+        problem = self.problem(usage)
+        workers = workers or os.cpu_count() or 1
+        restarts = restarts or workers
+        jobs = [(problem, seed, iterations) for seed in range(restarts)]
+        if workers > 1:
+            with Pool(workers) as pool:
+                results = pool.starmap(anneal, jobs)
+        else:
+            results = [anneal(*job) for job in jobs]
+        _, layout = min(results, key=lambda result: result[0])
+        return problem, layout
+
+    # The config with the layer's entries moved to their places in the layout, and shadowed duplicates dropped
+    def remap(self, layout: List[int]) -> str:
+        placed = {binding: position for position, binding in enumerate(layout) if binding >= 0}
+        moved = {id(entry): placed[binding] for binding, entry in enumerate(self.__entries)}
+        shadowed = {id(entry) for entry in self.__shadowed}
+        entries = []
+        for entry in self.__raw["layers"][self.layer].get("map", []):
+            if id(entry) in shadowed:
+                continue
+            if id(entry) in moved:
+                code, presses = divmod(moved[id(entry)], _WIDTH)
+                entry = {**entry, "code": format_code(code), "type": _TYPES[presses]}
+            entries.append(entry)
+        raw = {**self.__raw, "layers": {**self.__raw["layers"]}}
+        raw["layers"][self.layer] = {**raw["layers"][self.layer], "map": entries}
+        return yaml.safe_dump(raw, sort_keys=False, allow_unicode=True)
+
+    def report(self, problem: LayoutProblem, layout: List[int]) -> Dict[str, Any]:
+        moves = []
+        for position, binding in enumerate(layout):
+            if binding < 0 or position == problem.home[binding]:
+                continue
+            entry = self.__entries[binding]
+            code, presses = divmod(position, _WIDTH)
+            moves.append({
+                "actions": _describe(entry),
+                "uses": problem.frequencies[binding],
+                "from": f"{format_code(_parse_code(entry['code']))} {entry['type']}",
+                "to": f"{format_code(code)} {_TYPES[presses]}",
+            })
+        moves.sort(key=lambda move: -move["uses"])
+        return {
+            "layer": self.layer,
+            "uses": sum(problem.frequencies),
+            "before": problem.summary(problem.layout),
+            "after": problem.summary(layout),
+            "moves": moves,
+            "dropped_shadowed": [
+                f"{format_code(_parse_code(entry['code']))} {entry['type']}" for entry in self.__shadowed
+            ],
+        }
+
+
+def _describe(entry: Dict[str, Any]) -> str:
+    return ", ".join(
+        f"{action['type']} {action.get('key', action.get('text', action.get('layer', '')))!r}"
+        for action in entry.get("actions", [])
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remap a layer's bindings to cut the latency and taps of recorded use")
+    parser.add_argument("taps", nargs="+", help="tap logs recorded with --record")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--layer", help="the layer to remap (the first default layer)")
+    parser.add_argument("--pin", action="append", default=[], metavar="CODE", help="keep a code's bindings in place")
+    parser.add_argument("--tap-cost", type=float, default=100, metavar="MS", help="cost of each tap, in ms of latency")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (one per CPU)")
+    parser.add_argument("--restarts", type=int, default=0, help="independent searches (one per worker)")
+    parser.add_argument("--iterations", type=int, default=200_000, help="moves tried per search")
+    parser.add_argument("--output", metavar="FILE", help="write the remapped config to FILE instead of stdout")
+    parser.add_argument("--report", metavar="FILE", help="also write the cost report as JSON")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as file:
+        source = file.read()
+    optimizer = LayoutOptimizer(source, args.layer, [_parse_code(code) for code in args.pin], args.tap_cost)
+    usage = Counter()
+    for log in args.taps:
+        usage.update(count_usage(optimizer.config, TapLog(log)))
+    problem, layout = optimizer.optimise(usage, args.workers, args.restarts, args.iterations)
+
+    remapped = optimizer.remap(layout)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(remapped)
+    else:
+        sys.stdout.write(remapped)
+
+    report = optimizer.report(problem, layout)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    before, after = report["before"], report["after"]
+    print(f"{report['uses']} uses of {report['layer']} bindings", file=sys.stderr)
+    for label, stats in (("before", before), ("after", after)):
+        print(
+            f"{label:>7}: {stats['delay_ms']:.1f}ms waiting, {stats['taps']:.3f} taps, "
+            f"{stats['cost_ms']:.1f}ms cost per use",
+            file=sys.stderr,
+        )
+    for move in report["moves"]:
+        print(f"  {move['actions']:<24} {move['from']:>14} -> {move['to']:<14} ({move['uses']} uses)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Runs the hot-path microbenchmarks headless, optionally saving or comparing against a JSON baseline.
+#
+#   python -m benchmarks [--filter PREFIX] [--save baseline.json] [--compare baseline.json [--threshold 0.2]]
+import argparse
+import io
+import json
+import sys
+from contextlib import redirect_stdout
+from time import perf_counter_ns
+from typing import Tuple
+
+from benchmarks import _stubs
+
+_stubs.install()
+
+from benchmarks.suite import BENCHMARKS  # noqa: E402
+
+
+def measure(setup, repeat: int, budget: float) -> Tuple[float, dict]:
+    run, ops, *metrics = setup()
+    run()
+    # Scale the number of calls per repeat so each repeat takes roughly budget / repeat seconds
+    started = perf_counter_ns()
+    run()
+    elapsed = max(perf_counter_ns() - started, 1)
+    calls = max(int(budget * 1_000_000_000 / repeat / elapsed), 1)
+    best = None
+    for _ in range(repeat):
+        started = perf_counter_ns()
+        for _ in range(calls):
+            run()
+        per_op = (perf_counter_ns() - started) / (calls * ops)
+        best = per_op if best is None else min(best, per_op)
+    return best, metrics[0] if metrics else {}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["ns_per_op"]
+        after = result["ns_per_op"]
+        change = (after - before) / before
+        flag = "REGRESSION" if change > threshold else ""
+        print(f"{name:<32} {before:>12.1f} -> {after:>12.1f} ns/op {change * 100:+7.1f}% {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name starts with this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds to spend per benchmark")
+    parser.add_argument("--save", metavar="FILE", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if not name.startswith(args.filter):
+            continue
+        # Keep anything printed while setting up out of the report
+        with redirect_stdout(io.StringIO()):
+            ns_per_op, metrics = measure(setup, args.repeat, args.budget)
+        results[name] = {"ns_per_op": ns_per_op, "ops_per_s": 1_000_000_000 / ns_per_op, **metrics}
+        extra = "".join(f" {value:>10.2f} {metric}" for metric, value in metrics.items())
+        print(f"{name:<32} {ns_per_op:>12.1f} ns/op {results[name]['ops_per_s']:>14.0f} ops/s{extra}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold * 100:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Headless stand-ins for pynput and tapsdk. Both need a display server or BLE adapter at import time, so the benchmarks
+# install these before importing anything from akimboxr.
+import sys
+import types
+from enum import Enum
+from time import monotonic
+
+
+class Key(Enum):
+    alt = "alt"
+    alt_l = "alt_l"
+    alt_r = "alt_r"
+    alt_gr = "alt_gr"
+    backspace = "backspace"
+    caps_lock = "caps_lock"
+    cmd = "cmd"
+    cmd_l = "cmd_l"
+    cmd_r = "cmd_r"
+    ctrl = "ctrl"
+    ctrl_l = "ctrl_l"
+    ctrl_r = "ctrl_r"
+    delete = "delete"
+    down = "down"
+    end = "end"
+    enter = "enter"
+    esc = "esc"
+    home = "home"
+    insert = "insert"
+    left = "left"
+    page_down = "page_down"
+    page_up = "page_up"
+    right = "right"
+    shift = "shift"
+    shift_l = "shift_l"
+    shift_r = "shift_r"
+    space = "space"
+    tab = "tab"
+    up = "up"
+
+
+class KeyCode:
+    def __init__(self, vk=None, char=None):
+        self.vk = vk
+        self.char = char
+
+    @classmethod
+    def from_char(cls, char):
+        return cls(char=char)
+
+    @classmethod
+    def from_vk(cls, vk):
+        return cls(vk=vk)
+
+    def __eq__(self, other):
+        return isinstance(other, KeyCode) and (self.vk, self.char) == (other.vk, other.char)
+
+    def __hash__(self):
+        return hash((self.vk, self.char))
+
+    def __repr__(self):
+        return repr(self.char) if self.char is not None else f"<{self.vk}>"
+
+
+class Controller:
+    def __init__(self):
+        self.events = []
+
+    def press(self, key):
+        self.events.append(("press", key, monotonic()))
+
+    def release(self, key):
+        self.events.append(("release", key, monotonic()))
+
+    def tap(self, key):
+        self.press(key)
+        self.release(key)
+
+
+class TapSDK:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def TapInputMode(mode):
+    return mode
+
+
+def install():
+    pynput = types.ModuleType("pynput")
+    keyboard = types.ModuleType("pynput.keyboard")
+    keyboard.Key = Key
+    keyboard.KeyCode = KeyCode
+    keyboard.Controller = Controller
+    pynput.keyboard = keyboard
+    tapsdk = types.ModuleType("tapsdk")
+    tapsdk.TapSDK = TapSDK
+    tapsdk.TapInputMode = TapInputMode
+    sys.modules["pynput"] = pynput
+    sys.modules["pynput.keyboard"] = keyboard
+    sys.modules["tapsdk"] = tapsdk
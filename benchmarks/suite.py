@@ -0,0 +1,763 @@
+# Hot-path microbenchmarks. Each entry is a setup function returning (callable, ops per call), optionally followed by
+# a dict of other figures the callable fills in; only the callable is timed. Install the stubs before importing this
+# module.
+import asyncio
+import json
+import os
+import random
+import tempfile
+from queue import Queue
+from time import monotonic_ns
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+import yaml
+
+from akimboxr.config.AkimboConfig import (
+    AkimboConfig,
+    ConfigAdaptive,
+    ConfigMapEntry,
+    _parse_code,
+    deserialize_config,
+)
+from akimboxr.metrics.Tracer import TraceEvent, Tracer, tracer
+from akimboxr.model.AdaptiveWindows import AdaptiveWindows
+from akimboxr.model.AkimboCompiler import compile_config, load_compiled
+from akimboxr.model.AkimboModel import AkimboModel
+from akimboxr.model.AkimboProgram import render_text
+from akimboxr.model.ChordCombiner import ChordCombiner
+from akimboxr.output.KeyboardBackend import KeyboardBackend
+from akimboxr.output.NullBackend import NullBackend
+from akimboxr.output.PynputBackend import PynputBackend
+from akimboxr.output.UinputBackend import EVENT, UinputBackend
+from akimboxr.steno.StenoDictionary import StenoDictionary
+from akimboxr.steno.StenoTranslator import StenoTranslator
+from akimboxr.threads.AsyncKeyboard import AsyncKeyboardSupplier
+from akimboxr.tools.ConfigAnalyzer import ConfigAnalyzer
+from akimboxr.tools.LayoutOptimizer import LayoutOptimizer, count_usage
+from akimboxr.threads.KeyQueue import KeyQueue, OverflowPolicy
+from akimboxr.threads.KeyboardThread import (
+    KeyboardScheduler,
+    KeyboardThreadSupplier,
+    KeyOperation,
+    KeySequence,
+    run_keyboard_thread,
+)
+from benchmarks._stubs import Controller, Key, KeyCode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHIPPED_CONFIG = os.path.join(ROOT, "config.yaml")
+# Every file the benchmarks write, and the caches and indexes written next to them, removed at exit
+SCRATCH = tempfile.TemporaryDirectory(prefix="akimboxr-benchmarks-")
+
+BENCHMARKS: Dict[str, Callable[[], Tuple[Callable[[], None], int]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+class NullQueue:
+    def put(self, item, block=True, timeout=None):
+        pass
+
+
+class ListQueue:
+    def __init__(self):
+        self.items = []
+
+    def put(self, item, block=True, timeout=None):
+        self.items.append(item)
+
+
+# Steps a fixed amount per reading so multi-tap windows behave the same on every run
+class SteppingClock:
+    def __init__(self, step: int):
+        self.now = 0
+        self.step = step
+
+    def __call__(self) -> int:
+        self.now += self.step
+        return self.now
+
+
+def synthetic_config(layers: int, transparent: bool = False) -> dict:
+    keys = "abcdefghijklmnopqrstuvwxyz0123"
+    config = {"onehand": True, "mode": "timeout", "timeout": 200, "layers": {}}
+    for i in range(layers):
+        layer = {"default": i == 0 or transparent, "transparent": transparent and i > 0, "map": []}
+        if i == 0 or not transparent:
+            for code in range(1, 31):
+                key = keys[code - 1]
+                layer["map"].append({"code": code, "type": "single", "actions": [{"type": "press", "key": key}]})
+                if code % 3 == 0:
+                    layer["map"].append(
+                        {"code": code, "type": "double", "actions": [{"type": "press", "key": "shift+" + key}]}
+                    )
+            push = {"type": "pushlayer", "layer": f"layer{(i + 1) % layers}"}
+            layer["map"].append({"code": 31, "type": "single", "actions": [push]})
+        config["layers"][f"layer{i}"] = layer
+    return config
+
+
+def _scratch(suffix: str = "") -> Tuple[int, str]:
+    return tempfile.mkstemp(suffix=suffix, dir=SCRATCH.name)
+
+
+def _write_config(config: dict) -> str:
+    handle, filename = _scratch(".yaml")
+    with os.fdopen(handle, "w", encoding="utf-8") as file:
+        yaml.safe_dump(config, file)
+    return filename
+
+
+def _model(config: AkimboConfig, step_ms: int, windows: AdaptiveWindows | None = None) -> AkimboModel:
+    return AkimboModel(config, KeyboardThreadSupplier(NullQueue()), SteppingClock(step_ms * 1_000_000), windows)
+
+
+def synthetic_combos(combos: int, seed: int = 0) -> list:
+    # Distinct sequences of three or four codes, each typing its own index
+    rng = random.Random(seed)
+    seen = set()
+    result = []
+    while len(result) < combos:
+        codes = tuple(rng.randint(1, 30) for _ in range(rng.randint(3, 4)))
+        if codes in seen:
+            continue
+        seen.add(codes)
+        result.append({"codes": list(codes), "actions": [{"type": "text", "text": str(len(result)), "rate": 0}]})
+    return result
+
+
+@benchmark("deserialize_config.shipped")
+def _deserialize_shipped():
+    return lambda: deserialize_config(SHIPPED_CONFIG), 1
+
+
+@benchmark("deserialize_config.synthetic_50")
+def _deserialize_synthetic():
+    filename = _write_config(synthetic_config(50))
+    return lambda: deserialize_config(filename), 1
+
+
+@benchmark("model_build.shipped")
+def _build_shipped():
+    config = deserialize_config(SHIPPED_CONFIG)
+    return lambda: _model(config, 1), 1
+
+
+@benchmark("model_build.synthetic_50")
+def _build_synthetic():
+    config = deserialize_config(_write_config(synthetic_config(50)))
+    return lambda: _model(config, 1), 1
+
+
+@benchmark("analyze.shipped")
+def _analyze_shipped():
+    compiled = compile_config(deserialize_config(SHIPPED_CONFIG))
+    return lambda: ConfigAnalyzer(compiled).analyze(), 1
+
+
+@benchmark("analyze.synthetic_50")
+def _analyze_synthetic():
+    # Each layer pushes the next, so the stacks explored stop at the depth limit
+    compiled = compile_config(deserialize_config(_write_config(synthetic_config(50))))
+
+    def run():
+        analyzer = ConfigAnalyzer(compiled)
+        analyzer.analyze()
+        if not analyzer.truncated:
+            raise RuntimeError("the analysis of a config that pushes layers forever wasn't cut off")
+
+    return run, 1
+
+
+@benchmark("optimize.shipped")
+def _optimize_shipped():
+    with open(SHIPPED_CONFIG, "r", encoding="utf-8") as file:
+        optimizer = LayoutOptimizer(file.read())
+    # Single taps spaced past the window, the most used codes first, so every deferred single is a cost to remove
+    rng = random.Random(0)
+    codes = list(range(1, 32))
+    weights = [1 / rank for rank in range(1, 32)]
+    taps = [("bench", code, index * 300_000_000) for index, code in enumerate(rng.choices(codes, weights, k=5_000))]
+    metrics = {}
+
+    def run():
+        problem, layout = optimizer.optimise(count_usage(optimizer.config, taps), workers=1, iterations=5_000)
+        before, after = problem.cost(problem.layout), problem.cost(layout)
+        if after > before:
+            raise RuntimeError(f"the optimised layout costs {after}, more than the {before} it started from")
+        metrics["ms/use before"] = problem.summary(problem.layout)["cost_ms"]
+        metrics["ms/use after"] = problem.summary(layout)["cost_ms"]
+
+    run()
+    return run, 1, metrics
+
+
+def _startup(use_cache: bool, config: dict | None = None):
+    if config is None:
+        handle, filename = _scratch(".yaml")
+        with os.fdopen(handle, "wb") as file, open(SHIPPED_CONFIG, "rb") as shipped:
+            file.write(shipped.read())
+    else:
+        filename = _write_config(config)
+    load_compiled(filename, use_cache)
+
+    def run():
+        compiled, _ = load_compiled(filename, use_cache)
+        AkimboModel(compiled, KeyboardThreadSupplier(NullQueue()))
+
+    return run, 1
+
+
+@benchmark("startup.shipped")
+def _startup_shipped():
+    return _startup(False)
+
+
+@benchmark("startup.shipped_cached")
+def _startup_shipped_cached():
+    return _startup(True)
+
+
+@benchmark("startup.synthetic_50")
+def _startup_synthetic():
+    return _startup(False, synthetic_config(50))
+
+
+@benchmark("startup.synthetic_50_cached")
+def _startup_synthetic_cached():
+    return _startup(True, synthetic_config(50))
+
+
+def _process(codes: str, taps: int, step_ms: int, windows: AdaptiveWindows | None = None):
+    model = _model(deserialize_config(SHIPPED_CONFIG), step_ms, windows)
+    code = _parse_code(codes)
+    process = model.process
+
+    def run():
+        for _ in range(100):
+            for _ in range(taps):
+                process(code)
+
+    return run, 100 * taps
+
+
+@benchmark("process.immediate")
+def _process_immediate():
+    # f: single binding only
+    return _process("xxoxo", 1, 1000)
+
+
+@benchmark("process.immediate_traced")
+def _process_immediate_traced():
+    # As process.immediate, recording into the tracer; it's only enabled while running so other benchmarks stay untraced
+    run, ops = _process("xxoxo", 1, 1000)
+    tracer.enable(1 << 12)
+    tracer.disable()
+
+    def traced():
+        tracer.enabled = True
+        try:
+            run()
+        finally:
+            tracer.enabled = False
+
+    return traced, ops
+
+
+@benchmark("trace.record")
+def _trace_record():
+    trace = Tracer()
+    trace.enable(1 << 12)
+    record = trace.record
+
+    def run():
+        for task_id in range(1000):
+            record(TraceEvent.Emit, 0, task_id, task_id, 1)
+
+    return run, 1000
+
+
+@benchmark("process.double")
+def _process_double():
+    # comma: single and double bindings, the double fires immediately
+    return _process("oxoxo", 2, 10)
+
+
+@benchmark("process.double_adaptive")
+def _process_double_adaptive():
+    # As process.double, also learning the code's window from every gap
+    return _process("oxoxo", 2, 10, AdaptiveWindows.build(ConfigAdaptive.build({}), 0.2))
+
+
+@benchmark("process.triple")
+def _process_triple():
+    # ; : single, double and triple bindings
+    return _process("xoxxx", 3, 10)
+
+
+@benchmark("process.resolve")
+def _process_resolve():
+    # comma then f: every f resolves the pending comma early
+    model = _model(deserialize_config(SHIPPED_CONFIG), 50)
+    comma, f = _parse_code("oxoxo"), _parse_code("xxoxo")
+    process = model.process
+
+    def run():
+        for _ in range(100):
+            process(comma)
+            process(f)
+
+    return run, 200
+
+
+@benchmark("combiner.chord")
+def _combiner_chord():
+    # a with both hands: the left tap is held and the right one completes the chord
+    config = deserialize_config(SHIPPED_CONFIG)
+    config.layers["base"].map.append(ConfigMapEntry.build({"code": "xoooo|xoooo", "type": "single"}))
+    combiner = ChordCombiner(_model(config, 10), 0.05, ["left", "right"], SteppingClock(10 * 1_000_000))
+    code = _parse_code("xoooo")
+    tap = combiner.tap
+
+    def run():
+        for _ in range(100):
+            tap("left", code)
+            tap("right", code)
+
+    return run, 200
+
+
+@benchmark("combiner.solo")
+def _combiner_solo():
+    # f can't start a chord, so it passes straight through
+    combiner = ChordCombiner(_model(deserialize_config(SHIPPED_CONFIG), 1000), 0.05, ["left", "right"])
+    code = _parse_code("xxoxo")
+    tap = combiner.tap
+
+    def run():
+        for _ in range(100):
+            tap("left", code)
+
+    return run, 100
+
+
+def _fall_through(depth: int):
+    config = AkimboConfig.build(synthetic_config(depth + 1, transparent=True))
+    model = _model(config, 1000)
+    process = model.process
+
+    def run():
+        for _ in range(100):
+            process(1)
+
+    return run, 100
+
+
+@benchmark("process.fall_through_1")
+def _fall_through_1():
+    return _fall_through(1)
+
+
+@benchmark("process.fall_through_16")
+def _fall_through_16():
+    return _fall_through(16)
+
+
+@benchmark("supplier.submit_sequence")
+def _submit_sequence():
+    key_queue = KeyQueue()
+    supplier = KeyboardThreadSupplier(key_queue)
+    key = KeyCode.from_char("a")
+    ops = ((KeyOperation.Press, key, 0), (KeyOperation.Release, key, 0))
+
+    def run():
+        for _ in range(100):
+            supplier.submit_sequence(ops)
+        key_queue.queue.clear()
+
+    return run, 100
+
+
+@benchmark("worker.drain")
+def _worker_drain():
+    key_queue = KeyQueue()
+    controller = Controller()
+    run_keyboard_thread(key_queue, PynputBackend(controller))
+    key = KeyCode.from_char("a")
+    ops = ((KeyOperation.Press, key, 0), (KeyOperation.Release, key, 0))
+
+    def run():
+        # Fill the queue in one go so only the worker's side is measured
+        with key_queue.mutex:
+            now = monotonic_ns()
+            key_queue.queue.extend((KeySequence(task_id, ops, 0), now) for task_id in range(1000))
+            key_queue.unfinished_tasks += 1000
+            key_queue.not_empty.notify()
+        key_queue.join()
+        controller.events.clear()
+
+    return run, 1000
+
+
+# An application reading at most capacity key events per millisecond, dropping the rest
+class DroppingBackend(KeyboardBackend):
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.now = 0.0
+        self.millisecond = -1
+        self.seen = 0
+        self.dropped = 0
+
+    def emit(self, ops):
+        millisecond = round(self.now * 1000)
+        if millisecond != self.millisecond:
+            self.millisecond = millisecond
+            self.seen = 0
+        self.seen += len(ops)
+        if self.seen > self.capacity:
+            self.dropped += min(self.seen - self.capacity, len(ops))
+
+
+TEXT = "The quick brown fox jumps over the lazy dog. SPHINX OF BLACK QUARTZ, JUDGE MY VOW! " * 12
+
+
+def _text(rate: float, capacity: int):
+    # Types TEXT through the scheduler on a virtual clock, jumping straight to each spaced-out chunk
+    ops = render_text(TEXT, rate)
+    backend = DroppingBackend(capacity)
+    scheduler = KeyboardScheduler(backend)
+
+    def run():
+        backend.now = 0.0
+        backend.millisecond = -1
+        backend.dropped = 0
+        scheduler.submit(KeySequence(0, ops, 0), 0.0)
+        while True:
+            timeout = scheduler.timeout(backend.now)
+            if timeout is None:
+                break
+            backend.now += timeout
+            scheduler.run_due(backend.now)
+        if rate and backend.dropped:
+            raise RuntimeError(f"{backend.dropped} key events dropped at {rate} events/ms")
+
+    return run, len(ops)
+
+
+@benchmark("text.throttled")
+def _text_throttled():
+    # At the application's own rate nothing may be dropped
+    return _text(2, 2)
+
+
+@benchmark("text.unthrottled")
+def _text_unthrottled():
+    return _text(0, 2)
+
+
+def _output(backend: KeyboardBackend, check: Callable[[], None] = lambda: None):
+    # TEXT typed unthrottled, so every run is one batch of ops
+    ops = render_text(TEXT, 0)
+    scheduler = KeyboardScheduler(backend)
+
+    def run():
+        for task_id in range(10):
+            scheduler.submit(KeySequence(task_id, ops, 0), 0.0)
+        check()
+
+    return run, 10 * len(ops)
+
+
+@benchmark("output.null")
+def _output_null():
+    return _output(NullBackend())
+
+
+@benchmark("output.pynput")
+def _output_pynput():
+    controller = Controller()
+    return _output(PynputBackend(controller), controller.events.clear)
+
+
+@benchmark("output.uinput")
+def _output_uinput():
+    # Written to a plain file, so only the encoding and the one write per batch are measured
+    fd, path = _scratch()
+    os.unlink(path)
+    backend = UinputBackend(fd, False)
+    expected = 10 * len(render_text(TEXT, 0)) * 2 * EVENT.size
+
+    def check():
+        written = os.lseek(fd, 0, os.SEEK_CUR)
+        if written != expected:
+            raise RuntimeError(f"uinput wrote {written} bytes, expected {expected}")
+        os.lseek(fd, 0, os.SEEK_SET)
+
+    return _output(backend, check)
+
+
+def _shift_layer_keys() -> List[Tuple]:
+    # One key of each finger typed on the shipped config's shift layer, each pressing and releasing shift around it
+    key_queue = ListQueue()
+    model = AkimboModel(
+        deserialize_config(SHIPPED_CONFIG), KeyboardThreadSupplier(key_queue), SteppingClock(1_000_000_000)
+    )
+    model.process(_parse_code("xxxoo"))
+    for code in ("xoooo", "oxooo", "ooxoo", "oooxo", "oooox"):
+        model.process(_parse_code(code))
+    # Expedited sequences are queued again; keep each one once
+    return list({id(sequence): sequence.ops for sequence in key_queue.items}.values())
+
+
+def _typed(ops) -> str:
+    return "".join(key.char for mode, key, _ in ops if mode == KeyOperation.Press and isinstance(key, KeyCode))
+
+
+def _overflow(policy: OverflowPolicy, deferred: bool):
+    # A burst of 1000 sequences into a 64 deep queue while the worker is stalled, then drained
+    keys = _shift_layer_keys() * 200
+    expected = "".join(_typed(ops) for ops in keys)
+    key_queue = KeyQueue(64, policy)
+    metrics = {}
+
+    def run():
+        key_queue.metrics.reset()
+        for task_id, ops in enumerate(keys):
+            key_queue.put(KeySequence(task_id, ops, 1.0 if deferred else 0))
+        drained = []
+        while not key_queue.empty():
+            drained.append(key_queue.get_nowait())
+            key_queue.task_done()
+        stats = key_queue.metrics
+        if stats.high_water > 64:
+            raise RuntimeError(f"queue reached {stats.high_water} sequences")
+        if deferred and stats.dropped != len(keys) - 64:
+            raise RuntimeError(f"dropped {stats.dropped} of {len(keys)} deferred sequences")
+        if not deferred and "".join(_typed(sequence.ops) for sequence in drained) != expected:
+            raise RuntimeError("coalescing changed the typed keys")
+        if deferred:
+            metrics["dropped"] = stats.dropped
+        else:
+            metrics["events/char"] = sum(len(sequence.ops) for sequence in drained) / len(keys)
+
+    return run, len(keys), metrics
+
+
+@benchmark("queue.overflow_drop_oldest_deferred")
+def _queue_overflow_drop():
+    return _overflow(OverflowPolicy.DropOldestDeferred, True)
+
+
+@benchmark("queue.overflow_coalesce")
+def _queue_overflow_coalesce():
+    return _overflow(OverflowPolicy.Coalesce, False)
+
+
+class CountingBackend(KeyboardBackend):
+    def __init__(self):
+        self.events = 0
+        self.shifted = True
+        self.down = set()
+
+    def emit(self, ops):
+        self.events += len(ops)
+        for mode, key, _ in ops:
+            if mode == KeyOperation.Press:
+                if isinstance(key, KeyCode) and Key.shift not in self.down:
+                    self.shifted = False
+                self.down.add(key)
+            elif mode == KeyOperation.Release:
+                self.down.discard(key)
+
+
+def _shift_layer(hold: float):
+    # Keys typed on the shipped config's shift layer 1ms apart
+    keys = _shift_layer_keys() * 40
+    backend = CountingBackend()
+    scheduler = KeyboardScheduler(backend, modifier_hold=hold)
+    metrics = {}
+
+    def run():
+        backend.events = 0
+        now = 0.0
+        for task_id, ops in enumerate(keys):
+            now += 0.001
+            scheduler.run_due(now)
+            scheduler.submit(KeySequence(task_id, ops, 0), now)
+        scheduler.run_due(now + 1)
+        if not backend.shifted or backend.down:
+            raise RuntimeError(f"shift layer typed unshifted keys or left {backend.down} down")
+        metrics["events/char"] = backend.events / len(keys)
+
+    return run, len(keys), metrics
+
+
+@benchmark("modifiers.shift_layer")
+def _modifiers_shift_layer():
+    return _shift_layer(0)
+
+
+@benchmark("modifiers.shift_layer_coalesced")
+def _modifiers_shift_layer_coalesced():
+    return _shift_layer(0.1)
+
+
+def _pipeline(supplier, controller: Controller, wait: Callable[[], None]):
+    model = AkimboModel(deserialize_config(SHIPPED_CONFIG), supplier, SteppingClock(1_000_000_000))
+    code = _parse_code("xxoxo")
+    process = model.process
+
+    def run():
+        for _ in range(100):
+            process(code)
+        wait()
+        controller.events.clear()
+
+    return run, 100
+
+
+def _combo(combos: int):
+    config = synthetic_config(1)
+    config["combos"] = synthetic_combos(combos)
+    key_queue = ListQueue()
+    clock = SteppingClock(50_000_000)
+    model = AkimboModel(AkimboConfig.build(config), KeyboardThreadSupplier(key_queue), clock)
+    # The last combo has to type its index once its codes are tapped
+    for code in config["combos"][-1]["codes"]:
+        model.process(code)
+    model.expire(clock.now + 1_000_000_000)
+    typed = "".join(key.char for operation, key, _ in key_queue.items[-1].ops if operation == KeyOperation.Press)
+    if typed != str(combos - 1):
+        raise RuntimeError(f"combo {combos - 1} typed {typed!r}")
+
+    # Random taps 50ms apart, so most of them start or extend a combo
+    rng = random.Random(1)
+    codes = [rng.randint(1, 30) for _ in range(1000)]
+    process = model.process
+
+    def run():
+        for code in codes:
+            process(code)
+        key_queue.items.clear()
+
+    return run, len(codes)
+
+
+@benchmark("combo.10")
+def _combo_10():
+    return _combo(10)
+
+
+@benchmark("combo.10k")
+def _combo_10k():
+    # Per-tap cost has to match combo.10: advancing is one trie edge lookup
+    return _combo(10_000)
+
+
+@lru_cache(maxsize=None)
+def synthetic_steno(entries: int = 100_000) -> Tuple[str, List[List[int]]]:
+    # A dictionary the size of Plover's, of one to three chord strokes per entry, compiled once. Returns its filename
+    # and the stroke sequences of 1000 of its entries.
+    rng = random.Random(2)
+    source = {}
+    sequences = []
+    while len(source) < entries:
+        strokes = [rng.randint(1, 1023) for _ in range(rng.choice((1, 2, 2, 3)))]
+        key = "/".join(str(stroke) for stroke in strokes)
+        if key not in source:
+            source[key] = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 10)))
+            if len(sequences) < 1000:
+                sequences.append(strokes)
+    handle, filename = _scratch(".json")
+    with os.fdopen(handle, "w", encoding="utf-8") as file:
+        json.dump(source, file)
+    StenoDictionary.open(filename).close()
+    return filename, sequences
+
+
+def _plain_steno(filename: str) -> Dict[Tuple[int, ...], str]:
+    with open(filename, "r", encoding="utf-8") as file:
+        source = json.load(file)
+    return {tuple(_parse_code(stroke) for stroke in key.split("/")): value for key, value in source.items()}
+
+
+@benchmark("steno.load_index")
+def _steno_load_index():
+    filename, _ = synthetic_steno()
+    return lambda: StenoDictionary.open(filename).close(), 1
+
+
+@benchmark("steno.load_dict")
+def _steno_load_dict():
+    filename, _ = synthetic_steno()
+    return lambda: _plain_steno(filename), 1
+
+
+@benchmark("steno.lookup_index")
+def _steno_lookup_index():
+    # Each sequence narrowed one stroke at a time, as the translator does
+    filename, sequences = synthetic_steno()
+    dictionary = StenoDictionary.open(filename)
+    plain = _plain_steno(filename)
+    for strokes in sequences:
+        if dictionary.lookup(strokes) != plain[tuple(strokes)]:
+            raise RuntimeError(f"index translates {strokes} as {dictionary.lookup(strokes)!r}")
+    lookup = dictionary.lookup
+
+    def run():
+        for strokes in sequences:
+            lookup(strokes)
+
+    return run, sum(len(strokes) for strokes in sequences)
+
+
+@benchmark("steno.lookup_dict")
+def _steno_lookup_dict():
+    filename, sequences = synthetic_steno()
+    lookup = _plain_steno(filename).get
+    keys = [tuple(strokes) for strokes in sequences]
+
+    def run():
+        for key in keys:
+            lookup(key)
+
+    return run, sum(len(key) for key in keys)
+
+
+@benchmark("steno.translate")
+def _steno_translate():
+    # Stroke to rendered keys, including the retyping of multi-stroke entries
+    filename, sequences = synthetic_steno()
+    translator = StenoTranslator(StenoDictionary.open(filename))
+    strokes = [stroke for sequence in sequences for stroke in sequence]
+
+    def run():
+        for stroke in strokes:
+            translator.stroke(stroke)
+        translator.reset()
+
+    return run, len(strokes)
+
+
+@benchmark("pipeline.thread")
+def _pipeline_thread():
+    # Tap to emitted key through the queue and keyboard thread
+    key_queue = KeyQueue()
+    controller = Controller()
+    run_keyboard_thread(key_queue, PynputBackend(controller))
+    return _pipeline(KeyboardThreadSupplier(key_queue), controller, key_queue.join)
+
+
+@benchmark("pipeline.asyncio")
+def _pipeline_asyncio():
+    # Tap to emitted key when taps are processed on the event loop; immediate keys are typed inline
+    controller = Controller()
+    supplier = AsyncKeyboardSupplier(asyncio.new_event_loop(), PynputBackend(controller))
+    return _pipeline(supplier, controller, lambda: None)
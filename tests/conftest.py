@@ -0,0 +1,5 @@
+# pynput and tapsdk need a display server or BLE adapter at import time, so the tests run against the same stand-ins as
+# the benchmarks
+from benchmarks import _stubs
+
+_stubs.install()
@@ -0,0 +1,55 @@
+# Fakes and fixtures the tests share. The benchmarks keep their own, so neither imports from the other.
+import os
+from itertools import count
+from typing import List, Tuple
+
+from akimboxr.config.AkimboConfig import _parse_code, deserialize_config
+from akimboxr.model.AkimboModel import AkimboModel
+from akimboxr.output.KeyboardBackend import KeyboardBackend, KeyOperation
+from akimboxr.threads.KeyboardThread import KeyboardThreadSupplier
+from pynput.keyboard import Key, KeyCode
+
+SHIPPED_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.yaml")
+
+
+class ListQueue:
+    def __init__(self):
+        self.items = []
+
+    def put(self, item, block=True, timeout=None):
+        self.items.append(item)
+
+
+# Counts the events it's sent, and whether every character went out with shift down
+class CountingBackend(KeyboardBackend):
+    def __init__(self):
+        self.events = 0
+        self.shifted = True
+        self.down = set()
+
+    def emit(self, ops):
+        self.events += len(ops)
+        for mode, key, _ in ops:
+            if mode == KeyOperation.Press:
+                if isinstance(key, KeyCode) and Key.shift not in self.down:
+                    self.shifted = False
+                self.down.add(key)
+            elif mode == KeyOperation.Release:
+                self.down.discard(key)
+
+
+# One key of each finger typed on the shipped config's shift layer, each pressing and releasing shift around it
+def shift_layer_keys() -> List[Tuple]:
+    key_queue = ListQueue()
+    # A second between taps, so none of them make a multi-tap
+    clock = count(1_000_000_000, 1_000_000_000).__next__
+    model = AkimboModel(deserialize_config(SHIPPED_CONFIG), KeyboardThreadSupplier(key_queue), clock)
+    model.process(_parse_code("xxxoo"))
+    for code in ("xoooo", "oxooo", "ooxoo", "oooxo", "oooox"):
+        model.process(_parse_code(code))
+    # Expedited sequences are queued again; keep each one once
+    return list({id(sequence): sequence.ops for sequence in key_queue.items}.values())
+
+
+def typed(ops) -> str:
+    return "".join(key.char for mode, key, _ in ops if mode == KeyOperation.Press and isinstance(key, KeyCode))
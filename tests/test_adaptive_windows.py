@@ -0,0 +1,41 @@
+from akimboxr.config.AkimboConfig import AkimboConfig, ConfigAdaptive, _parse_code
+from akimboxr.model.AdaptiveWindows import AdaptiveWindows
+from akimboxr.replay.TapReplay import TapReplay
+
+A = _parse_code("xoooo")
+CONFIG = {
+    "onehand": True,
+    "timeout": 300,
+    "layers": {
+        "base": {
+            "default": True,
+            "map": [
+                {"code": "xoooo", "type": "single", "actions": [{"type": "press", "key": "a"}]},
+                {"code": "xoooo", "type": "double", "actions": [{"type": "press", "key": "b"}]},
+            ],
+        },
+    },
+}
+
+
+# Double taps of A with the given gap between their taps, a second apart
+def _doubles(replay: TapReplay, start: int, gap: int, count: int) -> int:
+    taps = []
+    for _ in range(count):
+        taps += [("tap", A, start * 1_000_000), ("tap", A, (start + gap) * 1_000_000)]
+        start += 1000
+    replay.feed(taps)
+    return start
+
+
+def test_shrunk_window_grows_back():
+    windows = AdaptiveWindows.build(ConfigAdaptive.build({}), 0.3)
+    replay = TapReplay(AkimboConfig.build(CONFIG), windows=windows)
+    start = _doubles(replay, 1000, 40, 300)
+    assert windows.window(A) < 0.1
+    # Slower double taps land outside the shrunk window, and still teach it
+    _doubles(replay, start, 150, 300)
+    assert windows.window(A) > 0.15
+    typed = [str(key) for _, operation, key in replay.finish() if operation != "release"]
+    assert typed[-1] == "'b'"
+    assert "mean deferral 300ms -> " in windows.format()
@@ -0,0 +1,46 @@
+import pickle
+import shutil
+
+from akimboxr.model.AkimboCompiler import CompiledConfig, cache_filename, config_digest, load_compiled
+from tests.helpers import SHIPPED_CONFIG
+
+
+def _config(tmp_path) -> str:
+    filename = str(tmp_path / "config.yaml")
+    shutil.copy(SHIPPED_CONFIG, filename)
+    return filename
+
+
+def test_cache_is_reused(tmp_path):
+    filename = _config(tmp_path)
+    assert not load_compiled(filename)[1]
+    compiled, cached = load_compiled(filename)
+    assert cached
+    assert isinstance(compiled, CompiledConfig)
+
+
+def test_damaged_cache_is_recompiled(tmp_path):
+    filename = _config(tmp_path)
+    with open(filename, "rb") as file:
+        digest = config_digest(file.read())
+    with open(cache_filename(filename), "wb") as file:
+        file.write(digest + b"not a pickle")
+    compiled, cached = load_compiled(filename)
+    assert not cached
+    assert compiled.layers
+    assert load_compiled(filename)[1]
+
+
+def test_stale_cache_is_recompiled(tmp_path):
+    # A config pickled by a revision before some attribute was added, under a digest that still matches
+    filename = _config(tmp_path)
+    stale = CompiledConfig.__new__(CompiledConfig)
+    stale.timeout = 0.2
+    with open(filename, "rb") as file:
+        digest = config_digest(file.read())
+    with open(cache_filename(filename), "wb") as file:
+        file.write(digest)
+        pickle.dump(stale, file)
+    compiled, cached = load_compiled(filename)
+    assert not cached
+    assert compiled.combos is None and compiled.layers
@@ -0,0 +1,60 @@
+import copy
+
+from akimboxr.config.AkimboConfig import AkimboConfig, _parse_code
+from akimboxr.replay.TapReplay import TapReplay
+
+A, B = _parse_code("xoooo"), _parse_code("oxooo")
+CONFIG = {
+    "onehand": True,
+    "mode": "timeout",
+    "timeout": 200,
+    "combo_window": 300,
+    "layers": {
+        "base": {
+            "default": True,
+            "map": [
+                {"code": "xoooo", "type": "single", "actions": [{"type": "press", "key": "a"}]},
+                {"code": "xoooo", "type": "double", "actions": [{"type": "press", "key": "b"}]},
+                {"code": "oxooo", "type": "single", "actions": [{"type": "press", "key": "c"}]},
+            ],
+        }
+    },
+}
+COMBO = {"codes": ["xoooo", "oxooo"], "actions": [{"type": "press", "key": "z"}]}
+CHORD = {"code": (A << 5) | A, "type": "single", "actions": [{"type": "press", "key": "q"}]}
+# Replays start a second in, as a tap at 0 would read as having no timestamp
+START = 1000
+
+
+# The keys typed, and when in ms after START
+def _replay(taps, combos: bool = False, chord_window: int = 0):
+    config = copy.deepcopy(CONFIG)
+    if combos:
+        config["combos"] = [copy.deepcopy(COMBO)]
+    if chord_window:
+        config["chord_window"] = chord_window
+        config["layers"]["base"]["map"].append(copy.deepcopy(CHORD))
+    replay = TapReplay(AkimboConfig.build(config))
+    replay.feed([("tap", code, (START + at) * 1_000_000) for code, at in taps])
+    return [
+        (round(timestamp / 1_000_000) - START, key.char)
+        for timestamp, operation, key in replay.finish()
+        if operation != "release"
+    ]
+
+
+def test_double_tap_on_a_combo_start():
+    assert _replay([(A, 0), (A, 100)]) == [(100, "b")]
+    assert _replay([(A, 0), (A, 100)], combos=True) == [(100, "b")]
+
+
+def test_combo_still_fires():
+    assert _replay([(A, 0), (B, 100)], combos=True) == [(100, "z")]
+
+
+def test_held_single_waits_from_the_tap():
+    # Held for the combo window, which is longer than the multi-tap window, so it goes out as soon as it's released
+    assert _replay([(A, 0)], combos=True) == [(300, "a")]
+    # Held for the other hand, then deferred for the rest of the window
+    assert _replay([(A, 0)], chord_window=50) == [(200, "a")]
+    assert _replay([(A, 0), (A, 150)], chord_window=50) == [(200, "b")]
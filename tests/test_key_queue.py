@@ -0,0 +1,33 @@
+from akimboxr.threads.KeyQueue import KeyQueue, OverflowPolicy
+from akimboxr.threads.KeyboardThread import KeySequence
+from tests.helpers import shift_layer_keys, typed
+
+
+def _burst(policy: OverflowPolicy, deadline: float):
+    # 1000 sequences into a 64 deep queue while nothing takes them
+    keys = shift_layer_keys() * 200
+    key_queue = KeyQueue(64, policy)
+    sequences = [KeySequence(task_id, ops, deadline) for task_id, ops in enumerate(keys)]
+    for sequence in sequences:
+        key_queue.put(sequence)
+    drained = []
+    while not key_queue.empty():
+        drained.append(key_queue.get_nowait())
+        key_queue.task_done()
+    return keys, sequences, drained, key_queue.metrics
+
+
+def test_coalesce_keeps_the_typed_keys():
+    keys, _, drained, metrics = _burst(OverflowPolicy.Coalesce, 0)
+    assert metrics.high_water <= 64
+    assert "".join(typed(sequence.ops) for sequence in drained) == "aeiou" * 200
+    # Shift is held across the merged sequences rather than released and pressed again around every key
+    assert sum(len(sequence.ops) for sequence in drained) < sum(len(ops) for ops in keys)
+
+
+def test_drop_oldest_deferred_cancels_what_it_drops():
+    keys, sequences, drained, metrics = _burst(OverflowPolicy.DropOldestDeferred, 1.0)
+    assert metrics.high_water <= 64
+    assert metrics.dropped == len(keys) - 64
+    assert drained == sequences[-64:]
+    assert all(sequence.cancelled for sequence in sequences[:-64])
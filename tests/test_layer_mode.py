@@ -0,0 +1,46 @@
+from akimboxr.config.AkimboConfig import AkimboConfig, _parse_code
+from akimboxr.replay.TapReplay import TapReplay
+
+A, PUSH = _parse_code("xoooo"), _parse_code("oxooo")
+
+
+def _config(vim: dict) -> dict:
+    return {
+        "onehand": True,
+        "mode": "backspace",
+        "timeout": 200,
+        "layers": {
+            "base": {
+                "default": True,
+                "map": [
+                    {"code": "xoooo", "type": "single", "actions": [{"type": "press", "key": "a"}]},
+                    {"code": "xoooo", "type": "double", "actions": [{"type": "press", "key": "b"}]},
+                    {"code": "oxooo", "type": "single", "actions": [{"type": "pushlayer", "layer": "vim"}]},
+                ],
+            },
+            "vim": {"map": [{"code": "ooxoo", "type": "single", "actions": [{"type": "press", "key": "h"}]}], **vim},
+        },
+    }
+
+
+# The keys typed by a double tap of A, after pushing vim first if asked to
+def _double_tap(config: dict, push: bool) -> list:
+    replay = TapReplay(AkimboConfig.build(config))
+    taps = [(PUSH, 1000)] if push else []
+    taps += [(A, 2000), (A, 2050)]
+    replay.feed([("tap", code, at * 1_000_000) for code, at in taps])
+    return [str(key) for _, operation, key in replay.finish() if operation != "release"]
+
+
+def test_base_layer_speculates():
+    assert _double_tap(_config({"transparent": True}), True) == ["'a'", "Key.backspace", "'b'"]
+
+
+def test_transparent_layer_mode_applies_to_codes_falling_through():
+    assert _double_tap(_config({"transparent": True, "mode": "timeout"}), True) == ["'b'"]
+    # Not pushed, so the base layer's own mode applies
+    assert _double_tap(_config({"transparent": True, "mode": "timeout"}), False) == ["'a'", "Key.backspace", "'b'"]
+
+
+def test_extending_layer_mode_applies_to_inherited_codes():
+    assert _double_tap(_config({"extends": "base", "mode": "timeout"}), True) == ["'b'"]
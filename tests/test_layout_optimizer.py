@@ -0,0 +1,84 @@
+import random
+from collections import Counter
+
+import pytest
+
+from akimboxr.config.AkimboConfig import AkimboConfig, _parse_code, format_code
+from akimboxr.model.AkimboCompiler import compile_config
+from akimboxr.replay.TapLog import TapLog, TapRecorder
+from akimboxr.replay.TapReplay import TapReplay
+from akimboxr.tools.LayoutOptimizer import count_usage
+
+# Every binding types its own key, so the keys the model emits say which bindings fired
+BINDINGS = {
+    # Single, double and triple
+    ("base", "xoooo"): ["a", "b", "c"],
+    # Single and triple but no double
+    ("base", "xoxoo"): ["d", None, "e"],
+    # Single only
+    ("base", "oxooo"): ["f", None, None],
+    # Double only
+    ("base", "ooxoo"): [None, "g", None],
+    ("num", "xoooo"): ["1", None, None],
+    ("num", "xoxoo"): [None, "2", "3"],
+}
+PUSH, POP = "ooxxo", "oooxx"
+
+
+def _config(mode: str) -> dict:
+    layers = {"base": {"default": True, "map": []}, "num": {"transparent": True, "map": []}}
+    for (layer, code), keys in BINDINGS.items():
+        for key, type in zip(keys, ("single", "double", "triple")):
+            if key is not None:
+                layers[layer]["map"].append({"code": code, "type": type, "actions": [{"type": "press", "key": key}]})
+    layers["base"]["map"].append({"code": PUSH, "type": "single", "actions": [{"type": "pushlayer", "layer": "num"}]})
+    layers["num"]["map"].append({"code": POP, "type": "single", "actions": [{"type": "poplayer"}]})
+    return {"onehand": True, "mode": mode, "timeout": 200, "layers": layers}
+
+
+# Bursts of the same code with gaps either side of the window, so multi-taps finish, get cut short and slide
+def _taps(seed: int) -> list:
+    rng = random.Random(seed)
+    codes = [code for _, code in BINDINGS] + [PUSH, POP]
+    # Starting with the triple that a single and triple code without a double can only make on a quick third press
+    taps = [("tap", _parse_code("xoxoo"), at * 1_000_000) for at in (1000, 1050, 1100)]
+    at = 1500
+    for _ in range(300):
+        code = _parse_code(rng.choice(codes))
+        for _ in range(rng.choice((1, 1, 2, 3, 4))):
+            taps.append(("tap", code, at * 1_000_000))
+            at += rng.choice((30, 120, 190, 210, 350))
+        at += rng.choice((0, 250))
+    return taps
+
+
+@pytest.mark.parametrize("mode", ["timeout", "backspace"])
+def test_count_usage_matches_the_replayed_keys(tmp_path, mode):
+    taps = _taps(7)
+    filename = str(tmp_path / "taps.log")
+    recorder = TapRecorder.open(filename)
+    for identifier, code, timestamp in taps:
+        recorder.record(identifier, code, timestamp)
+    recorder.close()
+
+    usage = count_usage(compile_config(AkimboConfig.build(_config(mode))), TapLog(filename))
+    counted = Counter()
+    for (layer, code, count), uses in usage.items():
+        key = BINDINGS.get((layer, format_code(code)), [None] * 3)[count - 1]
+        if key is not None:
+            counted[key] += uses
+
+    replay = TapReplay(AkimboConfig.build(_config(mode)))
+    replay.feed(taps)
+    events = replay.finish()
+    # Speculative taps that got taken back were typed and then backspaced, so only what's left counts
+    typed = []
+    for _, operation, key in events:
+        if operation != "press":
+            continue
+        if getattr(key, "char", None) is None:
+            typed.pop()
+        else:
+            typed.append(key.char)
+    assert counted == Counter(typed)
+    assert counted["e"] and counted["d"]
@@ -0,0 +1,29 @@
+from akimboxr.threads.KeyboardThread import KeyboardScheduler, KeySequence
+from tests.helpers import CountingBackend, shift_layer_keys
+
+
+# Keys typed on the shipped config's shift layer 1ms apart, and then the hold left to run out
+def _type(hold: float) -> CountingBackend:
+    keys = shift_layer_keys() * 40
+    backend = CountingBackend()
+    scheduler = KeyboardScheduler(backend, modifier_hold=hold)
+    now = 0.0
+    for task_id, ops in enumerate(keys):
+        now += 0.001
+        scheduler.run_due(now)
+        scheduler.submit(KeySequence(task_id, ops, 0), now)
+    scheduler.run_due(now + 1)
+    return backend
+
+
+def test_shift_layer_without_hold():
+    backend = _type(0)
+    assert backend.shifted and not backend.down
+    assert backend.events == 4 * 200
+
+
+def test_shift_held_between_keys():
+    backend = _type(0.1)
+    assert backend.shifted and not backend.down
+    # One shift press and release around all 200 keys
+    assert backend.events == 2 * 200 + 2
@@ -0,0 +1,69 @@
+import shutil
+
+from akimboxr.config.AkimboConfig import _parse_code
+from akimboxr.model.AkimboCompiler import load_compiled
+from akimboxr.model.AkimboModel import AkimboModel
+from akimboxr.threads.KeyboardThread import KeyboardThreadSupplier
+from tests.helpers import SHIPPED_CONFIG, ListQueue
+
+
+def _config(tmp_path) -> str:
+    filename = str(tmp_path / "config.yaml")
+    shutil.copy(SHIPPED_CONFIG, filename)
+    return filename
+
+
+def _edit(filename: str, old: str, new: str):
+    with open(filename, "r", encoding="utf-8") as file:
+        content = file.read()
+    with open(filename, "w", encoding="utf-8") as file:
+        file.write(content.replace(old, new, 1))
+
+
+def test_unchanged_reload_keeps_the_config(tmp_path):
+    filename = _config(tmp_path)
+    compiled, _ = load_compiled(filename)
+    # The cache now matches, but its slots aren't the ones the model holds handlers for
+    assert load_compiled(filename, previous=compiled) == (compiled, False)
+
+
+def test_reload_rebuilds_only_what_changed(tmp_path):
+    filename = _config(tmp_path)
+    compiled, _ = load_compiled(filename)
+    load_compiled(filename)
+    _edit(filename, 'key: "1"', 'key: "!"')
+    reloaded, cached = load_compiled(filename, previous=compiled)
+    assert not cached
+    assert reloaded.rebuilt == ["number"]
+
+
+def test_reloads_reuse_slot_indices(tmp_path):
+    filename = _config(tmp_path)
+    compiled, _ = load_compiled(filename, use_cache=False)
+    slots = len(compiled.slots)
+    for old, new in zip("1!@#", "!@#$"):
+        _edit(filename, f'key: "{old}"', f'key: "{new}"')
+        compiled, _ = load_compiled(filename, use_cache=False, previous=compiled)
+        assert len(compiled.slots) == slots
+        assert None not in compiled.slots
+        assert all(slot.index == index for index, slot in enumerate(compiled.slots))
+
+
+def test_reload_keeps_multi_taps_in_progress(tmp_path):
+    filename = _config(tmp_path)
+    compiled, _ = load_compiled(filename, use_cache=False)
+    key_queue = ListQueue()
+    now = [1_000_000_000]
+    model = AkimboModel(compiled, KeyboardThreadSupplier(key_queue), lambda: now[0])
+    # ; has a single, a double and a triple
+    code = _parse_code("xoxxx")
+    model.process(code)
+    _edit(filename, 'key: "1"', 'key: "!"')
+    model.swap(load_compiled(filename, use_cache=False, previous=compiled)[0])
+    now[0] += 50_000_000
+    model.process(code)
+    now[0] += 50_000_000
+    model.process(code)
+    # Single and double deferred then cancelled, and the triple typed straight away
+    assert [sequence.cancelled for sequence in key_queue.items] == [True, True, False]
+    assert not key_queue.items[-1].deadline
@@ -0,0 +1,83 @@
+import random
+from collections import deque
+from queue import Empty
+
+import pytest
+
+from akimboxr.output.RecordingBackend import RecordingBackend
+from akimboxr.threads.KeyboardThread import KeyboardScheduler, KeyboardThreadSupplier, _worker
+from pynput.keyboard import KeyCode
+
+
+class Stop(Exception):
+    pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def monotonic_ns(self) -> int:
+        return int(self.now * 1_000_000_000)
+
+
+# Hands the worker what was put, then moves the clock on by whatever it waits for instead of blocking. Waiting with no
+# timeout, with nothing left to hand over, would block for good, so it stops the worker.
+class ScriptedQueue:
+    def __init__(self, clock: Clock):
+        self.clock = clock
+        self.items = deque()
+        self.timeouts = []
+
+    def put(self, item):
+        self.items.append(item)
+
+    def get(self, timeout=None):
+        self.timeouts.append(timeout)
+        if self.items:
+            return self.items.popleft()
+        if timeout is None:
+            raise Stop
+        self.clock.now += timeout
+        raise Empty
+
+    def task_done(self):
+        pass
+
+
+def _run(clock: Clock, key_queue: ScriptedQueue) -> RecordingBackend:
+    backend = RecordingBackend(clock.monotonic_ns)
+    with pytest.raises(Stop):
+        _worker(key_queue, KeyboardScheduler(backend), clock.monotonic)
+    return backend
+
+
+def test_idle_worker_blocks_without_a_timeout():
+    clock = Clock()
+    key_queue = ScriptedQueue(clock)
+    _run(clock, key_queue)
+    assert key_queue.timeouts == [None]
+
+
+def test_deferred_taps_fire_in_deadline_order():
+    clock = Clock()
+    key_queue = ScriptedQueue(clock)
+    supplier = KeyboardThreadSupplier(key_queue, clock.monotonic)
+    rng = random.Random(1)
+    deadlines = {}
+    for i in range(1000):
+        key = KeyCode.from_char(str(i))
+        delay = rng.uniform(0.1, 0.2)
+        deadlines[key] = clock.now + delay
+        supplier.tap_key(key, delay)
+    backend = _run(clock, key_queue)
+
+    pressed = [(at, key) for at, operation, key in backend.events if operation == "press"]
+    assert [key for _, key in pressed] == sorted(deadlines, key=deadlines.get)
+    # Each one right at its deadline (give or take the recorded nanosecond), and the worker only wakes for the next one
+    # rather than polling
+    assert all(abs(at - deadlines[key] * 1_000_000_000) <= 1 for at, key in pressed)
+    assert len(key_queue.timeouts) <= 2 * len(deadlines) + 1
@@ -0,0 +1,32 @@
+from threading import Thread
+
+from akimboxr.config.AkimboConfig import _parse_code, deserialize_config
+from akimboxr.model.AkimboModel import AkimboModel
+from akimboxr.threads.KeyboardThread import KeyboardThreadSupplier
+from tests.helpers import SHIPPED_CONFIG, ListQueue
+
+
+def test_two_devices_keep_their_own_multi_taps():
+    # Two devices triple-tapping the same code on their own threads, with every tap inside the window. Each device's
+    # taps carry its own tapped_at, so a triple assembled from the other device's taps shows up in the counts.
+    key_queue = ListQueue()
+    model = AkimboModel(deserialize_config(SHIPPED_CONFIG), KeyboardThreadSupplier(key_queue), lambda: 1)
+    code = _parse_code("xoxxx")
+    taps = 3000
+
+    def device(identifier: str, tapped_at: int):
+        for _ in range(taps):
+            model.process(code, tapped_at, identifier)
+
+    threads = [Thread(target=device, args=("left", 1)), Thread(target=device, args=("right", 2))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for tapped_at in (1, 2):
+        sequences = [item for item in key_queue.items if item.tapped_at == tapped_at]
+        triples = [item for item in sequences if not item.deadline]
+        assert len(triples) == taps // 3
+        # Every single and double is deferred, and every one of them is superseded by the tap after it
+        assert all(item.cancelled for item in sequences if item.deadline)
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from akimboxr.output.KeyboardBackend import KeyOperation
+from akimboxr.output.UinputBackend import EVENT, UinputBackend
+from pynput.keyboard import KeyCode
+
+
+def test_missing_device_fails(tmp_path):
+    path = tmp_path / "uinput"
+    with pytest.raises(FileNotFoundError):
+        UinputBackend.open(str(path))
+    assert not path.exists()
+
+
+def test_plain_file_gets_the_event_stream(tmp_path):
+    path = tmp_path / "uinput"
+    path.touch()
+    backend = UinputBackend.open(str(path))
+    backend.emit(((KeyOperation.Tap, KeyCode.from_char("a"), 0),))
+    backend.close()
+    # Press and release, each followed by a SYN_REPORT
+    assert os.path.getsize(path) == 4 * EVENT.size